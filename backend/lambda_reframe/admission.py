@@ -0,0 +1,205 @@
+"""
+Admission Control
+Per-user and global token buckets guarding the reframe path (and the Bedrock quota).
+
+Each bucket is one DynamoDB item holding a theoretical arrival time `tat`
+(GCRA, the single-timestamp form of a token bucket): a bucket with rate r
+and burst b admits a request when tat <= now + (b - 1)/r, then advances tat
+by 1/r. Both outcomes are decided by one conditional UpdateItem, so
+concurrent containers never over-admit and an admitted request costs a
+single write.
+
+A warm container also keeps the same buckets in memory. Local state only
+advances for requests DynamoDB admitted, so a local denial implies a shared
+denial and floods are shed without a round trip. The same holds until a
+remembered Retry-After runs out.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from botocore.exceptions import ClientError, BotoCoreError
+
+# In-memory buckets kept per container before the least recently used are dropped
+LOCAL_MAX_KEYS = 10000
+BUCKET_IDLE_TTL_SECONDS = 3600
+
+
+class Decision:
+    """Outcome of an admission check"""
+
+    def __init__(self, admitted: bool, retry_after: float = 0.0, scope: Optional[str] = None,
+                 source: str = 'dynamodb'):
+        self.admitted = admitted
+        self.retry_after = retry_after
+        self.scope = scope  # 'user' or 'global' when denied
+        self.source = source  # 'local' when decided without DynamoDB
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Whole seconds for the Retry-After header"""
+        return max(1, math.ceil(self.retry_after))
+
+    def __repr__(self):
+        return f"Decision(admitted={self.admitted}, retry_after={self.retry_after:.3f}, scope={self.scope}, source={self.source})"
+
+
+class BucketPolicy:
+    """Refill rate (requests per second) and burst size of one class of bucket"""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, int(burst))
+
+    @property
+    def interval_ms(self) -> int:
+        return max(1, int(round(1000 / self.rate_per_second)))
+
+    @property
+    def tolerance_ms(self) -> int:
+        return self.interval_ms * (self.burst - 1)
+
+
+class LocalBuckets:
+    """Warm-container mirror of the shared buckets (bounded LRU)"""
+
+    def __init__(self, max_keys: int = LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._tat: 'OrderedDict[str, int]' = OrderedDict()
+        self._blocked_until: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def check(self, key: str, policy: BucketPolicy, now_ms: int) -> Optional[float]:
+        """Seconds to wait if this container alone already knows the bucket is empty, else None"""
+        with self._lock:
+            blocked_until = self._blocked_until.get(key, 0)
+            if blocked_until > now_ms:
+                return (blocked_until - now_ms) / 1000
+            tat = self._tat.get(key)
+            if tat is not None and tat - now_ms > policy.tolerance_ms:
+                return (tat - now_ms - policy.tolerance_ms) / 1000
+        return None
+
+    def busy(self, key: str, now_ms: int) -> bool:
+        """Whether this container last saw the bucket with tokens already spent"""
+        with self._lock:
+            return self._tat.get(key, 0) > now_ms
+
+    def admitted(self, key: str, policy: BucketPolicy, now_ms: int) -> None:
+        with self._lock:
+            self._tat[key] = max(self._tat.get(key, 0), now_ms) + policy.interval_ms
+            self._tat.move_to_end(key)
+            self._blocked_until.pop(key, None)
+            while len(self._tat) > self.max_keys:
+                evicted, _ = self._tat.popitem(last=False)
+                self._blocked_until.pop(evicted, None)
+
+    def denied(self, key: str, retry_after: float, now_ms: int) -> None:
+        with self._lock:
+            self._blocked_until[key] = now_ms + int(retry_after * 1000)
+            if len(self._blocked_until) > self.max_keys:
+                self._blocked_until = {k: v for k, v in self._blocked_until.items() if v > now_ms}
+
+
+class AdmissionController:
+    """
+    Checks the user bucket (locally, then in DynamoDB), then the global bucket
+    DynamoDB errors fail open: a throttled limiter must not take the API down with it
+    """
+
+    def __init__(self, table, user_policy: BucketPolicy, global_policy: Optional[BucketPolicy] = None,
+                 local: Optional[LocalBuckets] = None, clock=time.time):
+        self.table = table
+        self.user_policy = user_policy
+        self.global_policy = global_policy
+        self.local = local if local is not None else LocalBuckets()
+        self.clock = clock
+
+    def admit(self, user_id: str) -> Decision:
+        now_ms = int(self.clock() * 1000)
+        buckets = [('user', f"user#{user_id}", self.user_policy)]
+        if self.global_policy:
+            buckets.append(('global', 'global', self.global_policy))
+
+        # User bucket first, so a spent global bucket never hides a user's own limit.
+        # Each bucket is pre-checked locally: no DynamoDB traffic for requests this
+        # container already knows to shed
+        for scope, key, policy in buckets:
+            wait = self.local.check(key, policy, now_ms)
+            if wait is not None:
+                return Decision(False, wait, scope, source='local')
+            try:
+                admitted, wait = self._take(key, policy, now_ms, busy=self.local.busy(key, now_ms))
+            except (ClientError, BotoCoreError) as e:
+                print(f"Admission check failed for {key}, admitting: {e}")
+                continue
+            if not admitted:
+                self.local.denied(key, wait, now_ms)
+                return Decision(False, wait, scope)
+            self.local.admitted(key, policy, now_ms)
+
+        return Decision(True)
+
+    def _take(self, key: str, policy: BucketPolicy, now_ms: int, busy: bool = False) -> Tuple[bool, float]:
+        """
+        Take one token from a shared bucket with conditional updates
+        Tries the branch the local state predicts first, so most checks are one write
+        Returns (admitted, seconds until a token is available)
+        """
+        # Idle buckets expire; a recreated bucket starts full, which is what idling earns anyway
+        expires = (now_ms + policy.tolerance_ms + policy.interval_ms) // 1000 + BUCKET_IDLE_TTL_SECONDS
+        limit = now_ms + policy.tolerance_ms
+        attempts = [self._take_busy, self._take_idle] if busy else [self._take_idle, self._take_busy]
+
+        tat = None
+        for attempt in attempts:
+            try:
+                attempt(key, policy, now_ms, limit, expires)
+                return True, 0.0
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+                if 'tat' in e.response.get('Item', {}):
+                    tat = int(e.response['Item']['tat']['N'])
+
+        if tat is None:
+            tat = limit + policy.interval_ms
+        return False, max(tat - limit, 1) / 1000
+
+    def _take_idle(self, key: str, policy: BucketPolicy, now_ms: int, limit: int, expires: int) -> None:
+        """Idle (or new) bucket: the full burst is available"""
+        self.table.update_item(
+            Key={'bucket_key': key},
+            UpdateExpression='SET tat = :next, #ttl = :ttl',
+            ConditionExpression='attribute_not_exists(tat) OR tat <= :now',
+            ExpressionAttributeNames={'#ttl': 'ttl'},
+            ExpressionAttributeValues={':next': now_ms + policy.interval_ms, ':now': now_ms, ':ttl': expires}
+        )
+
+    def _take_busy(self, key: str, policy: BucketPolicy, now_ms: int, limit: int, expires: int) -> None:
+        """Busy bucket: admit while within the burst tolerance"""
+        self.table.update_item(
+            Key={'bucket_key': key},
+            UpdateExpression='SET tat = tat + :interval, #ttl = :ttl',
+            ConditionExpression='tat <= :limit',
+            ExpressionAttributeNames={'#ttl': 'ttl'},
+            ExpressionAttributeValues={':interval': policy.interval_ms, ':limit': limit, ':ttl': expires},
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+
+
+def policy_from_env(environ, prefix: str, default_rate: float, default_burst: int) -> BucketPolicy:
+    """{PREFIX}_RATE_PER_MINUTE and {PREFIX}_BURST"""
+    rate_per_minute = float(environ.get(f"{prefix}_RATE_PER_MINUTE", str(default_rate)))
+    burst = int(environ.get(f"{prefix}_BURST", str(default_burst)))
+    return BucketPolicy(rate_per_minute / 60, burst)
+
+
+def rejection_body(decision: Decision) -> Dict[str, Any]:
+    return {
+        'error': 'Too many requests',
+        'scope': decision.scope,
+        'retry_after': decision.retry_after_seconds
+    }
@@ -3,12 +3,27 @@ Cognitive Reframer - Main Lambda Handler
 Orchestrates the agent flow: memory recall → model selection → reframing → storage
 """
 
+import hashlib
 import json
 import os
+import time
 import boto3
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from typing import Dict, Any, List
-from botocore.exceptions import ClientError
+from typing import Dict, Any, List, Optional
+from botocore.exceptions import ClientError, BotoCoreError
+
+from single_flight import SingleFlight, DynamoLease, request_key
+from profile_compactor import top_entries
+import usage_stats
+import reframe_archive
+import degraded_mode
+import long_input
+import shadow_mode
+import near_duplicate
+import profiling
+from admission import AdmissionController, policy_from_env, rejection_body
+from repository import open_repository, new_reframe_item
 
 # Initialize AWS clients
 # Lambda provides AWS_DEFAULT_REGION automatically
@@ -19,13 +34,58 @@ dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_RE
 MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-v2')
 REFRAMES_TABLE = os.environ.get('REFRAMES_TABLE', 'CognitiveReframer-Reframes')
 USERS_TABLE = os.environ.get('USERS_TABLE', 'CognitiveReframer-Users')
+INFLIGHT_TABLE = os.environ.get('INFLIGHT_TABLE', '')  # Empty disables cross-container coalescing
+# Well under the 30 s function timeout, so a crashed leader's lease frees up while its followers still run
+INFLIGHT_LEASE_SECONDS = float(os.environ.get('INFLIGHT_LEASE_SECONDS', '15'))
+STORAGE_URL = os.environ.get('STORAGE_URL', '')  # Empty uses DynamoDB; sqlite:///path for single-box deployments
+REFRAME_LATENCY_BUDGET_MS = float(os.environ.get('REFRAME_LATENCY_BUDGET_MS', '12000'))  # 0 waits for the model
+DEGRADED_FALLBACK = os.environ.get('DEGRADED_FALLBACK', 'true').lower() in ('1', 'true', 'yes')
 
+RATE_LIMIT_TABLE = os.environ.get('RATE_LIMIT_TABLE', '')  # Empty disables admission control
+OVERFLOW_MODEL_ID = os.environ.get('OVERFLOW_MODEL_ID', '')  # Cheaper model for requests over the global limit
+
+# Look up the user's near-duplicate thoughts before the model call (needs the index: NEAR_DUPLICATES_TABLE)
+NEAR_DUPLICATE_LOOKUP = os.environ.get('NEAR_DUPLICATE_LOOKUP', 'false').lower() in ('1', 'true', 'yes')
+# Near-duplicates at least this similar reuse the earlier reframe without a model call (above 1 never reuses)
+NEAR_DUPLICATE_REUSE_THRESHOLD = float(os.environ.get('NEAR_DUPLICATE_REUSE_THRESHOLD', '0.85'))
+
+# Model for the per-chunk belief extraction of long entries (empty uses the reframe model)
+EXTRACTION_MODEL_ID = os.environ.get('EXTRACTION_MODEL_ID', '')
+
+# Model calls run on this pool so the handler can stop waiting once the latency budget is spent
+model_pool = ThreadPoolExecutor(max_workers=8)
+# Sized for every chunk of a long entry at once, so extraction is one round trip
+extraction_pool = ThreadPoolExecutor(max_workers=long_input.MAX_CHUNKS)
+
+# Identical in-flight reframes within this container share one invocation
+reframe_flight = SingleFlight()
+
+# Per-user and global token buckets for /reframe; in-memory state persists across warm invocations
+admission_controller = AdmissionController(
+    dynamodb.Table(RATE_LIMIT_TABLE),
+    user_policy=policy_from_env(os.environ, 'USER', default_rate=10, default_burst=5),
+    global_policy=policy_from_env(os.environ, 'GLOBAL', default_rate=600, default_burst=50)
+) if RATE_LIMIT_TABLE else None
+
+
+def repository():
+    """
+    Data access for reframes and users (DynamoDB unless STORAGE_URL selects SQLite)
+    """
+    return open_repository(STORAGE_URL, dynamodb=dynamodb)
+
+
+@profiling.profiled('reframe')
 def lambda_handler(event, context):
     """
     Main Lambda handler for API Gateway requests
     """
     print(f"Received event: {json.dumps(event)}")
     
+    # Asynchronous self-invocation carrying a sampled request for the candidate models
+    if 'shadow' in event:
+        return handle_shadow(event['shadow'])
+    
     # Parse request
     try:
         if isinstance(event.get('body'), str):
@@ -38,11 +98,31 @@ def lambda_handler(event, context):
         
         # Route to appropriate handler
         if action == 'reframe':
-            response = handle_reframe(user_id, body)
+            model_id = None
+            decision = admission_controller.admit(user_id) if admission_controller else None
+            if decision and not decision.admitted:
+                if decision.scope == 'global' and OVERFLOW_MODEL_ID:
+                    # Shed load onto the cheaper model rather than turning users away
+                    model_id = OVERFLOW_MODEL_ID
+                else:
+                    print(f"Rejected reframe for {user_id}: {decision}")
+                    return create_response(429, rejection_body(decision),
+                                           headers={'Retry-After': str(decision.retry_after_seconds)})
+            response = handle_reframe(user_id, body, model_id=model_id)
         elif action == 'history':
-            response = handle_history(user_id)
+            response = handle_history(user_id, before=body.get('before'), since=body.get('since'),
+                                      if_none_match=request_header(event, 'If-None-Match'))
+            etag = response.pop('etag', None)
+            headers = {'ETag': etag} if etag else None
+            if response.pop('not_modified', False):
+                return create_response(304, None, headers=headers)
+            return create_response(200, response, headers=headers)
         elif action == 'get_user':
             response = handle_get_user(user_id)
+        elif action == 'stats':
+            response = handle_stats(user_id, body)
+        elif action == 'usage':
+            response = handle_usage(user_id, body)
         else:
             return create_response(400, {'error': f'Unknown action: {action}'})
         
@@ -55,7 +135,7 @@ def lambda_handler(event, context):
         return create_response(500, {'error': str(e)})
 
 
-def handle_reframe(user_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+def handle_reframe(user_id: str, body: Dict[str, Any], model_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Main reframing flow:
     1. Validate and sanitize input
@@ -66,55 +146,303 @@ def handle_reframe(user_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
     6. Store reframe to memory
     7. Return formatted response
     """
-    user_input = body.get('input', '').strip()
-    tone = body.get('tone', 'gentle')
-    
-    # Validation
-    if not user_input:
-        raise ValueError("Input cannot be empty")
-    
-    if len(user_input) > 500:
-        raise ValueError("Input too long (max 500 characters)")
+    user_input, tone = validate_reframe_input(body)
     
     # Safety check
     if is_self_harm_risk(user_input):
-        return {
-            'safety_response': True,
-            'message': 'Your message suggests you may be in distress. This tool is not a substitute for professional help.',
-            'resources': [
-                'National Suicide Prevention Lifeline: 988 (US)',
-                'Crisis Text Line: Text HOME to 741741 (US)',
-                'International Association for Suicide Prevention: https://www.iasp.info/resources/Crisis_Centres/'
-            ]
-        }
+        return safety_response()
     
-    # Step 1: Recall relevant memories (semantic search)
+    # Steps 1-5 run once per identical in-flight (user_id, input, tone)
+    key = request_key(user_id, user_input, tone)
+    response, shared = reframe_flight.do(
+        key, lambda: generate_reframe_leased(key, user_id, user_input, tone, model_id)
+    )
+    if shared:
+        print(f"Coalesced duplicate reframe request for user {user_id}")
+    return response
+
+
+def generate_reframe_leased(key: str, user_id: str, user_input: str, tone: str,
+                            model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Generate a reframe under a cross-container DynamoDB lease when configured,
+    so duplicates landing on other containers read the leader's result.
+    Waiting for the leader counts against the latency budget: a follower that
+    runs out falls back to its own (by then degraded) reframe
+    """
+    started = time.monotonic()
+    if not INFLIGHT_TABLE:
+        return generate_reframe(user_id, user_input, tone, model_id, started)
+
+    lease = DynamoLease(dynamodb.Table(INFLIGHT_TABLE), lease_seconds=INFLIGHT_LEASE_SECONDS)
+    response, shared = lease.run(
+        key, lambda: generate_reframe(user_id, user_input, tone, model_id, started),
+        max_wait=remaining_budget(started)
+    )
+    if shared:
+        print(f"Reused in-flight reframe from another container for user {user_id}")
+    return response
+
+
+def generate_reframe(user_id: str, user_input: str, tone: str, model_id: Optional[str] = None,
+                     started: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Recall memories, invoke Bedrock, parse, store and format the response
+    Falls back to the local degraded-mode engine when the model is too slow or fails
+    `started` is when the request's latency budget began (default: now)
+    """
+    started = time.monotonic() if started is None else started
+    
+    # Step 0: Has the user worked on this worry before? Near-identical repeats skip the model
+    previous = find_previous_reframe(user_id, user_input)
+    if previous and can_reuse(previous, tone):
+        print(f"Reusing reframe {previous['reframe_id']} for near-duplicate input "
+              f"(similarity {previous['similarity']:.2f})")
+        return reused_reframe_response(user_id, user_input, previous)
+    
+    # Step 1: Recall relevant memories (semantic search) and the long-term profile
     memory_context = recall_memories(user_id, user_input)
+    if previous:
+        # Adapt rather than repeat: the earlier take on this worry leads the context
+        memory_context = [previous] + [m for m in memory_context if m.get('reframe_id') != previous['reframe_id']]
+    # Users without any stored reframes have no profile yet, so skip the read
+    profile_summary = load_profile_summary(user_id) if memory_context else None
     
     # Step 2: Build prompt with context
-    system_prompt = build_system_prompt(tone, memory_context)
-    
-    # Step 3: Invoke Bedrock
-    reframe_response = invoke_bedrock_reframe(system_prompt, user_input)
+    system_prompt = build_system_prompt(tone, memory_context, profile_summary)
     
-    # Step 4: Parse JSON response
+    # Steps 3-4: Invoke Bedrock and parse, within what is left of the latency budget
+    shadowed = not long_input.is_long(user_input) and shadow_mode.sampled()
+    model_started = time.monotonic()
     try:
-        reframe_data = parse_reframe_response(reframe_response)
-        reframe_data['input'] = user_input  # Ensure input is preserved
-    except json.JSONDecodeError as e:
-        print(f"Failed to parse Bedrock response as JSON: {reframe_response}")
-        raise ValueError(f"Model returned invalid JSON: {str(e)}")
+        if long_input.is_long(user_input):
+            reframe_data = long_reframe(system_prompt, user_input, started, model_id)
+        else:
+            reframe_data = model_reframe(system_prompt, user_input, remaining_budget(started), model_id)
+        model_result = reframe_data
+    except Exception as e:
+        model_result = e
+        if not DEGRADED_FALLBACK:
+            raise
+        print(f"Model path unavailable ({type(e).__name__}: {e}); serving degraded reframe")
+        reframe_data = degraded_mode.generate(user_input, tone)
+    finally:
+        if shadowed:
+            # Candidates see the same prompt; the primary's outcome travels with it
+            shadow_mode.dispatch(system_prompt, user_input, shadow_mode.outcome(
+                model_id or MODEL_ID, model_result, time.monotonic() - model_started))
     
     # Step 5: Store reframe to memory and DynamoDB
-    reframe_id = store_reframe(user_id, user_input, reframe_data)
+    try:
+        reframe_id = store_reframe(user_id, user_input, reframe_data, tone=tone)
+    except ClientError:
+        # A degraded answer is still useful when storage is the thing failing
+        if not reframe_data.get('degraded'):
+            raise
+        reframe_id = None
     
     # Step 6: Return response
-    return {
+    response = {
         'reframe_id': reframe_id,
         'user_id': user_id,
         'created_at': datetime.utcnow().isoformat(),
         **reframe_data
     }
+    if previous:
+        response['previously_worked_on'] = previous_reference(previous)
+    return response
+
+
+def find_previous_reframe(user_id: str, user_input: str) -> Optional[Dict[str, Any]]:
+    """
+    The user's earlier reframe of (nearly) the same thought, from the LSH index
+    """
+    if not NEAR_DUPLICATE_LOOKUP:
+        return None
+    try:
+        return near_duplicate.find_near_duplicate(repository(), user_id, user_input)
+    except (ClientError, BotoCoreError) as e:
+        # The lookup is an optimisation: never let it fail the reframe
+        print(f"Error looking up near-duplicates: {e}")
+        return None
+
+
+def can_reuse(previous: Dict[str, Any], tone: str) -> bool:
+    """
+    Reuse only close repeats of a full model answer in the same tone
+    """
+    return (previous['similarity'] >= NEAR_DUPLICATE_REUSE_THRESHOLD
+            and not previous.get('degraded')
+            and previous.get('tone', tone) == tone
+            and len(previous.get('reframes') or []) >= 2)
+
+
+def previous_reference(previous: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The "you've worked on this before" pointer returned to the client
+    """
+    return {
+        'reframe_id': previous['reframe_id'],
+        'input': previous.get('source_input', ''),
+        'created_at': previous.get('created_at'),
+        'similarity': round(previous['similarity'], 2)
+    }
+
+
+def reused_reframe_response(user_id: str, user_input: str, previous: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Response built from an earlier stored reframe (nothing new is stored)
+    """
+    return {
+        'reframe_id': previous['reframe_id'],
+        'user_id': user_id,
+        'created_at': datetime.utcnow().isoformat(),
+        'input': user_input,
+        'model_selection': previous.get('models_used', []),
+        'reframes': previous.get('reframes', []),
+        'summary': previous.get('summary', ''),
+        'follow_up': previous.get('follow_up', ''),
+        'reused': True,
+        'previously_worked_on': previous_reference(previous)
+    }
+
+
+def remaining_budget(started: float) -> Optional[float]:
+    """
+    Seconds left of REFRAME_LATENCY_BUDGET_MS since `started`; None when no budget is set
+    """
+    if REFRAME_LATENCY_BUDGET_MS <= 0:
+        return None
+    return REFRAME_LATENCY_BUDGET_MS / 1000 - (time.monotonic() - started)
+
+
+def model_reframe(system_prompt: str, user_input: str, timeout: Optional[float] = None,
+                  model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Invoke Bedrock and parse its reframes, giving up after `timeout` seconds
+    """
+    call_started = time.monotonic()
+    if timeout is None:
+        reframe_response = invoke_bedrock_reframe(system_prompt, user_input, model_id=model_id)
+    else:
+        if timeout <= 0:
+            raise FutureTimeoutError("Latency budget spent before the model call")
+        future = model_pool.submit(invoke_bedrock_reframe, system_prompt, user_input, model_id=model_id)
+        try:
+            reframe_response = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise FutureTimeoutError(f"Model did not answer within {timeout:.2f}s")
+    latency = time.monotonic() - call_started
+    usage = request_usage(model_id or MODEL_ID, reframe_response, latency)
+    
+    try:
+        reframe_data = parse_reframe_response(reframe_response)
+        reframe_data['input'] = user_input  # Ensure input is preserved
+    except json.JSONDecodeError as e:
+        print(f"Failed to parse Bedrock response as JSON: {reframe_response}")
+        raise ModelParseError(f"Model returned invalid JSON: {str(e)}", usage)
+    except ValueError as e:
+        raise ModelParseError(str(e), usage)
+    reframe_data['usage'] = usage
+    return reframe_data
+
+
+class ModelParseError(ValueError):
+    """The model answered, but not in the reframe schema; carries the call's usage"""
+
+    def __init__(self, message: str, usage: Dict[str, Any]):
+        super().__init__(message)
+        self.usage = usage
+
+
+def handle_shadow(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run a sampled request on the candidate models (see shadow_mode), each with
+    the reframe latency budget the primary had
+    """
+    return shadow_mode.run(request, lambda candidate: model_reframe(
+        request['system_prompt'], request['user_input'], remaining_budget(time.monotonic()), candidate))
+
+
+def extract_beliefs(chunk: str) -> tuple:
+    """One extraction call: (beliefs, usage)"""
+    output = invoke_bedrock_reframe(long_input.EXTRACTION_PROMPT, chunk, model_id=EXTRACTION_MODEL_ID or MODEL_ID)
+    return long_input.parse_beliefs(output), getattr(output, 'usage', {})
+
+
+def long_reframe(system_prompt: str, user_input: str, started: float,
+                 model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Map-reduce reframe of a long journal entry: extract candidate beliefs from
+    every chunk in parallel, then one reframe call on the distilled beliefs
+    Two model round trips whatever the entry length; chunks whose extraction
+    fails are skipped, and the result has the usual parse_reframe_response shape
+    """
+    chunks = long_input.chunk_text(user_input)
+    futures = [extraction_pool.submit(extract_beliefs, chunk) for chunk in chunks]
+    per_chunk = []
+    extraction = {'model_id': EXTRACTION_MODEL_ID or MODEL_ID, 'calls': len(chunks),
+                  'input_tokens': 0, 'output_tokens': 0}
+    for future in futures:
+        budget = remaining_budget(started)
+        try:
+            beliefs, usage = future.result(timeout=max(budget, 0) if budget is not None else None)
+        except FutureTimeoutError:
+            future.cancel()
+            print("Belief extraction ran out of latency budget")
+            continue
+        except Exception as e:
+            print(f"Belief extraction failed for one chunk: {e}")
+            continue
+        per_chunk.append(beliefs)
+        extraction['input_tokens'] += usage.get('input_tokens', 0)
+        extraction['output_tokens'] += usage.get('output_tokens', 0)
+
+    beliefs = long_input.distill(per_chunk)
+    if not beliefs:
+        raise ValueError(f"No beliefs extracted from {len(chunks)} chunks")
+    print(f"Distilled {len(beliefs)} beliefs from {len(chunks)} chunks")
+
+    reframe_data = model_reframe(system_prompt, long_input.distilled_input(beliefs),
+                                 remaining_budget(started), model_id)
+    reframe_data['input'] = user_input
+    reframe_data['distilled_beliefs'] = beliefs
+    reframe_data['usage']['extraction'] = extraction
+    return reframe_data
+
+
+def validate_reframe_input(body: Dict[str, Any]) -> tuple:
+    """
+    Validate and sanitize a reframe request body
+    Returns (user_input, tone)
+    """
+    user_input = body.get('input', '').strip()
+    tone = body.get('tone', 'gentle')
+    
+    if not user_input:
+        raise ValueError("Input cannot be empty")
+    
+    # Past MAX_INPUT_CHARS the entry is distilled first (see long_reframe)
+    if len(user_input) > long_input.LONG_INPUT_MAX_CHARS:
+        raise ValueError(f"Input too long (max {long_input.LONG_INPUT_MAX_CHARS} characters)")
+    
+    return user_input, tone
+
+
+def safety_response() -> Dict[str, Any]:
+    """
+    Crisis resources returned instead of reframes for self-harm risk
+    """
+    return {
+        'safety_response': True,
+        'message': 'Your message suggests you may be in distress. This tool is not a substitute for professional help.',
+        'resources': [
+            'National Suicide Prevention Lifeline: 988 (US)',
+            'Crisis Text Line: Text HOME to 741741 (US)',
+            'International Association for Suicide Prevention: https://www.iasp.info/resources/Crisis_Centres/'
+        ]
+    }
 
 
 def is_self_harm_risk(text: str) -> bool:
@@ -136,23 +464,51 @@ def recall_memories(user_id: str, query: str, top_k: int = 3) -> List[Dict[str,
     For now, uses DynamoDB; will integrate AgentCore Memory in future
     """
     try:
-        table = dynamodb.Table(REFRAMES_TABLE)
-        response = table.query(
-            IndexName='UserIdIndex',  # GSI on user_id
-            KeyConditionExpression='user_id = :uid',
-            ExpressionAttributeValues={':uid': user_id},
-            ScanIndexForward=False,  # Most recent first
-            Limit=top_k
-        )
-        return response.get('Items', [])
+        return repository().recent_reframes(user_id, limit=top_k)
     except ClientError as e:
         print(f"Error recalling memories: {e}")
         return []
 
 
-def build_system_prompt(tone: str, memory_context: List[Dict[str, Any]]) -> str:
+def load_profile_summary(user_id: str) -> Optional[Dict[str, Any]]:
     """
-    Construct the system prompt with mental models and memory context
+    Fetch the compacted long-term profile maintained by the stream consumer
+    """
+    try:
+        user = repository().get_user(user_id, projection=['profile_summary'])
+        return (user or {}).get('profile_summary')
+    except ClientError as e:
+        print(f"Error loading profile summary: {e}")
+        return None
+
+
+def format_profile_section(profile_summary: Optional[Dict[str, Any]]) -> str:
+    """
+    Render the profile summary as a fixed-size prompt section
+    Size is bounded by the top-N limits, not by history length
+    """
+    if not profile_summary or not int(profile_summary.get('reframe_count', 0)):
+        return ""
+
+    themes = top_entries(profile_summary.get('themes', {}), 5)
+    models = top_entries(profile_summary.get('model_counts', {}), 8)
+    steps = top_entries(profile_summary.get('action_steps', {}), 3)
+
+    section = f"\n\nLong-term profile ({int(profile_summary['reframe_count'])} past reframes):\n"
+    if themes:
+        section += f"- Recurring themes: {', '.join(theme for theme, _ in themes)}\n"
+    if models:
+        section += f"- Mental models used: {', '.join(f'{m} x{c}' for m, c in models)}\n"
+    if steps:
+        section += f"- Recurring action steps: {'; '.join(step[:80] for step, _ in steps)}\n"
+    section += "Prefer models the user has used less often when they fit equally well.\n"
+    return section
+
+
+def build_system_prompt(tone: str, memory_context: List[Dict[str, Any]],
+                        profile_summary: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Construct the system prompt with mental models, memory context and long-term profile
     """
     tone_guidance = {
         'gentle': 'Use warm, supportive language. Be encouraging and emphasize small wins.',
@@ -165,6 +521,7 @@ def build_system_prompt(tone: str, memory_context: List[Dict[str, Any]]) -> str:
         for mem in memory_context[:2]:  # Include only 2 most recent
             memory_section += f"- Input: {mem.get('source_input', 'N/A')}\n"
             memory_section += f"  Models used: {mem.get('models_used', 'N/A')}\n"
+    memory_section += format_profile_section(profile_summary)
     
     prompt = f"""You are "Cognitive Reframer" — a precise cognitive toolkit that helps users reframe stuck or stressful thoughts.
 
@@ -281,75 +638,137 @@ Now process the user's input below. Output ONLY valid JSON, nothing else.
     return prompt
 
 
-def invoke_bedrock_reframe(system_prompt: str, user_input: str) -> str:
+def build_full_prompt(system_prompt: str, user_input: str) -> str:
     """
-    Invoke Amazon Bedrock to generate reframes
-    Returns raw model output (should be JSON string)
-    Supports both Claude v2 (legacy) and Claude 3+ (Messages API)
+    Combine system prompt and user input into the text sent to the model
     """
-    # Construct the full prompt
-    full_prompt = f"{system_prompt}\n\nUser input: {user_input}\n\nJSON output:"
-    
-    try:
-        # Check model type and use appropriate API format
-        if 'amazon.titan' in MODEL_ID.lower():
-            # Use Titan API format
-            request_body = {
-                "inputText": full_prompt,
-                "textGenerationConfig": {
-                    "maxTokenCount": 2048,
-                    "temperature": 0.3,
-                    "topP": 0.9,
-                    "stopSequences": []
-                }
-            }
-        elif 'claude-3' in MODEL_ID.lower() or 'claude-sonnet-4' in MODEL_ID.lower():
-            # Use Messages API for Claude 3+
-            request_body = {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 2048,
-                "temperature": 0.3,
-                "top_p": 0.9,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": full_prompt
-                    }
-                ]
-            }
-        else:
-            # Use legacy format for Claude v2
-            request_body = {
-                "prompt": f"\n\nHuman: {full_prompt}\n\nAssistant:",
-                "max_tokens_to_sample": 1024,
+    return f"{system_prompt}\n\nUser input: {user_input}\n\nJSON output:"
+
+
+def build_bedrock_request(model_id: str, full_prompt: str) -> Dict[str, Any]:
+    """
+    Request body in the format the model family expects
+    Supports Titan, Claude v2 (legacy) and Claude 3+ (Messages API)
+    """
+    # Check model type and use appropriate API format
+    if 'amazon.titan' in model_id.lower():
+        # Use Titan API format
+        return {
+            "inputText": full_prompt,
+            "textGenerationConfig": {
+                "maxTokenCount": 2048,
                 "temperature": 0.3,
-                "top_p": 0.9,
-                "stop_sequences": ["\n\nHuman:"]
+                "topP": 0.9,
+                "stopSequences": []
             }
-        
+        }
+    elif 'claude-3' in model_id.lower() or 'claude-sonnet-4' in model_id.lower():
+        # Use Messages API for Claude 3+
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 2048,
+            "temperature": 0.3,
+            "top_p": 0.9,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": full_prompt
+                }
+            ]
+        }
+    else:
+        # Use legacy format for Claude v2
+        return {
+            "prompt": f"\n\nHuman: {full_prompt}\n\nAssistant:",
+            "max_tokens_to_sample": 1024,
+            "temperature": 0.3,
+            "top_p": 0.9,
+            "stop_sequences": ["\n\nHuman:"]
+        }
+
+
+def extract_bedrock_text(model_id: str, response_body: Dict[str, Any]) -> str:
+    """
+    Extract generated text based on model type and response format
+    """
+    if 'amazon.titan' in model_id.lower():
+        # Titan format: {"results": [{"outputText": "..."}]}
+        output_text = response_body.get('results', [{}])[0].get('outputText', '')
+    elif 'content' in response_body:
+        # Claude 3+ Messages API format
+        output_text = response_body['content'][0]['text']
+    elif 'completion' in response_body:
+        # Claude v2 legacy format
+        output_text = response_body['completion']
+    else:
+        # Fallback: try to find text content
+        output_text = str(response_body)
+    return output_text.strip()
+
+
+class ModelOutput(str):
+    """Raw model text that also carries the token counts Bedrock reported"""
+
+    def __new__(cls, text: str, usage: Optional[Dict[str, int]] = None):
+        output = super().__new__(cls, text)
+        output.usage = usage or {}
+        return output
+
+
+def extract_bedrock_usage(model_id: str, response_body: Dict[str, Any],
+                          headers: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    """
+    Input and output token counts of one invocation
+    Claude 3+ reports `usage`, Titan `inputTextTokenCount` / `tokenCount`; every
+    model also gets them as X-Amzn-Bedrock-*-Token-Count headers (Claude v2 only there)
+    """
+    if 'amazon.titan' in model_id.lower():
+        input_tokens = response_body.get('inputTextTokenCount')
+        output_tokens = sum(r.get('tokenCount', 0) for r in response_body.get('results', [])) \
+            if response_body.get('results') else None
+    else:
+        usage = response_body.get('usage') or {}
+        input_tokens, output_tokens = usage.get('input_tokens'), usage.get('output_tokens')
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    if input_tokens is None:
+        input_tokens = headers.get('x-amzn-bedrock-input-token-count')
+    if output_tokens is None:
+        output_tokens = headers.get('x-amzn-bedrock-output-token-count')
+    return {'input_tokens': int(input_tokens or 0), 'output_tokens': int(output_tokens or 0)}
+
+
+def request_usage(model_id: str, output: str, latency: float) -> Dict[str, Any]:
+    """Usage stored with the reframe item and rolled up by usage_stats"""
+    return {
+        'model_id': model_id,
+        **getattr(output, 'usage', {'input_tokens': 0, 'output_tokens': 0}),
+        'latency_ms': int(latency * 1000),
+        'output_chars': len(output)
+    }
+
+
+def invoke_bedrock_reframe(system_prompt: str, user_input: str, model_id: Optional[str] = None) -> str:
+    """
+    Invoke Amazon Bedrock to generate reframes (MODEL_ID unless another model is given)
+    Returns raw model output (should be JSON string) as a ModelOutput with its token usage
+    """
+    model_id = model_id or MODEL_ID
+    full_prompt = build_full_prompt(system_prompt, user_input)
+    
+    try:
         response = bedrock_runtime.invoke_model(
-            modelId=MODEL_ID,
-            body=json.dumps(request_body)
+            modelId=model_id,
+            body=json.dumps(build_bedrock_request(model_id, full_prompt))
         )
         
         response_body = json.loads(response['body'].read())
-        
-        # Extract text based on model type and response format
-        if 'amazon.titan' in MODEL_ID.lower():
-            # Titan format: {"results": [{"outputText": "..."}]}
-            output_text = response_body.get('results', [{}])[0].get('outputText', '')
-        elif 'content' in response_body:
-            # Claude 3+ Messages API format
-            output_text = response_body['content'][0]['text']
-        elif 'completion' in response_body:
-            # Claude v2 legacy format
-            output_text = response_body['completion']
-        else:
-            # Fallback: try to find text content
-            output_text = str(response_body)
+        output_text = extract_bedrock_text(model_id, response_body)
+        usage = extract_bedrock_usage(model_id, response_body,
+                                      response.get('ResponseMetadata', {}).get('HTTPHeaders'))
         
         print(f"Bedrock raw response: {output_text}")
-        return output_text.strip()
+        print(f"Bedrock usage ({model_id}): {usage}")
+        return ModelOutput(output_text, usage)
         
     except ClientError as e:
         print(f"Bedrock invocation error: {e}")
@@ -392,28 +811,23 @@ def parse_reframe_response(response_text: str) -> Dict[str, Any]:
     return data
 
 
-def store_reframe(user_id: str, user_input: str, reframe_data: Dict[str, Any]) -> str:
+def build_reframe_item(user_id: str, user_input: str, reframe_data: Dict[str, Any],
+                       tone: str = 'gentle') -> Dict[str, Any]:
+    """
+    Build the ReframesTable item for a new reframe (compact-encoded when enabled)
+    """
+    return new_reframe_item(user_id, user_input, reframe_data, tone=tone)
+
+
+def store_reframe(user_id: str, user_input: str, reframe_data: Dict[str, Any], tone: str = 'gentle') -> str:
     """
     Store reframe to DynamoDB (and eventually AgentCore Memory)
     """
     try:
-        table = dynamodb.Table(REFRAMES_TABLE)
+        item = build_reframe_item(user_id, user_input, reframe_data, tone)
+        reframe_id = item['reframe_id']
         
-        reframe_id = f"{user_id}_{int(datetime.utcnow().timestamp() * 1000)}"
-        
-        item = {
-            'reframe_id': reframe_id,
-            'user_id': user_id,
-            'source_input': user_input,
-            'models_used': reframe_data.get('model_selection', []),
-            'reframes': reframe_data.get('reframes', []),
-            'summary': reframe_data.get('summary', ''),
-            'follow_up': reframe_data.get('follow_up', ''),
-            'created_at': datetime.utcnow().isoformat(),
-            'ttl': int(datetime.utcnow().timestamp()) + (90 * 24 * 60 * 60)  # 90 days
-        }
-        
-        table.put_item(Item=item)
+        repository().put_reframe(item)
         print(f"Stored reframe {reframe_id} for user {user_id}")
         
         return reframe_id
@@ -423,39 +837,114 @@ def store_reframe(user_id: str, user_input: str, reframe_data: Dict[str, Any]) -
         raise
 
 
-def handle_history(user_id: str) -> Dict[str, Any]:
+def handle_history(user_id: str, before: Optional[str] = None, limit: int = 20,
+                   since: Optional[str] = None, if_none_match: Optional[str] = None) -> Dict[str, Any]:
     """
-    Retrieve user's reframe history
+    Retrieve user's reframe history, newest first
+    Pass the returned next_before cursor as `before` to page further back;
+    once the hot table runs out, pages continue from the archive tier.
+
+    `etag` identifies the history version (newest created_at and count) and
+    page; when it equals if_none_match the result is just `not_modified` and
+    no reframes are read. `since` returns only reframes newer than the
+    client's last sync (the oldest `limit` of them, with `next_since` when
+    there are more).
     """
+    repo = repository()
+    # Read before the items: a write in between makes the next ETag differ, never the reverse
     try:
-        table = dynamodb.Table(REFRAMES_TABLE)
-        response = table.query(
-            IndexName='UserIdIndex',
-            KeyConditionExpression='user_id = :uid',
-            ExpressionAttributeValues={':uid': user_id},
-            ScanIndexForward=False,
-            Limit=20
-        )
-        
-        return {
-            'user_id': user_id,
-            'history': response.get('Items', [])
-        }
+        etag = history_etag(repo.history_version(user_id), before)
+    except ClientError as e:
+        print(f"Error reading history version: {e}")
+        etag = None
+    if etag and if_none_match == etag:
+        return {'user_id': user_id, 'etag': etag, 'not_modified': True}
+
+    try:
+        items = repo.recent_reframes(user_id, limit=limit, before=before, since=since)
     except ClientError as e:
         print(f"Error retrieving history: {e}")
         return {'user_id': user_id, 'history': []}
 
+    if since:
+        result = {'user_id': user_id, 'history': items, 'etag': etag}
+        if len(items) >= limit:
+            result['next_since'] = items[0]['created_at']
+        return result
+
+    if len(items) < limit and reframe_archive.archive_enabled():
+        cursor = items[-1]['created_at'] if items else before
+        seen = {item['reframe_id'] for item in items}
+        try:
+            archived = reframe_archive.read_archived(user_id, before=cursor, limit=limit - len(items))
+            items.extend(item for item in archived if item['reframe_id'] not in seen)
+        except Exception as e:
+            print(f"Error reading archived history: {e}")
+    
+    result = {
+        'user_id': user_id,
+        'history': items,
+        'etag': etag
+    }
+    if len(items) >= limit:
+        result['next_before'] = items[-1]['created_at']
+    return result
+
+
+def history_etag(version: Optional[tuple], before: Optional[str] = None) -> Optional[str]:
+    """
+    Strong ETag for a history page from the user's history version
+    (newest created_at, count) and the page cursor; None when the version is unknown
+    """
+    if version is None:
+        return None
+    newest, count = version
+    digest = hashlib.sha256(f"{newest}|{count}|{before or ''}".encode('utf-8')).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Case-insensitive API Gateway request header"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def handle_stats(user_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Daily usage counters (reframes, mental models, tone) for a user or globally
+    Served from pre-aggregated counter items, never from a scan
+    """
+    scope = body.get('scope', 'user')
+    days = body.get('days', 7)
+    return usage_stats.read_stats(scope, user_id=user_id, days=days, end_date=body.get('end_date'),
+                                  model_id=body.get('model_id'))
+
+
+def handle_usage(user_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Bedrock tokens per request, latency and estimated cost per 1K requests,
+    for a user, a model (`model_id`) or globally, from the same daily counters as stats
+    """
+    scope = body.get('scope', 'user')
+    stats = usage_stats.read_stats(scope, user_id=user_id, days=body.get('days', 7),
+                                   end_date=body.get('end_date'), model_id=body.get('model_id'))
+    result = {k: v for k, v in stats.items() if k not in ('days', 'totals')}
+    result['days'] = [{'date': day['date'], **day['usage']} for day in stats['days']]
+    result['totals'] = stats['totals']['usage']
+    return result
+
 
 def handle_get_user(user_id: str) -> Dict[str, Any]:
     """
     Get or create user profile
     """
     try:
-        table = dynamodb.Table(USERS_TABLE)
-        response = table.get_item(Key={'user_id': user_id})
+        existing = repository().get_user(user_id)
         
-        if 'Item' in response:
-            return response['Item']
+        if existing:
+            return existing
         else:
             # Create new user
             user = {
@@ -467,7 +956,7 @@ def handle_get_user(user_id: str) -> Dict[str, Any]:
                     'timezone': 'UTC'
                 }
             }
-            table.put_item(Item=user)
+            repository().put_user(user)
             return user
             
     except ClientError as e:
@@ -479,7 +968,8 @@ def handle_get_user(user_id: str) -> Dict[str, Any]:
         }
 
 
-def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
+def create_response(status_code: int, body: Optional[Dict[str, Any]],
+                    headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     Create API Gateway response with CORS headers
     """
@@ -488,9 +978,12 @@ def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
         'headers': {
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS'
+            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match',
+            'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
+            'Access-Control-Expose-Headers': 'Retry-After,ETag',
+            **(headers or {})
         },
-        'body': json.dumps(body, default=str)
+        # 304 carries no body
+        'body': json.dumps(body, default=str) if body is not None else ''
     }
 
@@ -0,0 +1,214 @@
+"""
+Degraded Mode
+Local, template-based reframe engine used when the model path is too slow or fails.
+
+A small TF-IDF classifier over hand-written keyword profiles picks two of the
+eight mental models from build_system_prompt; precomputed reframe and
+action-step templates are then filled in. No network, no model: responses
+are produced in microseconds and pass parse_reframe_response unchanged.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Any, List, Tuple
+
+from text_tokens import stem, tokenize
+
+# Keyword profile per mental model (stems are matched after light suffix stripping)
+MODEL_KEYWORDS = {
+    'Inversion': [
+        'fail', 'failure', 'disaster', 'ruin', 'wrong', 'mess', 'screw', 'mistake', 'collapse',
+        'launch', 'doom', 'worst', 'never', 'crash', 'flop', 'avoid'
+    ],
+    'First Principles': [
+        'should', 'must', 'suppose', 'everyone', 'always', 'rule', 'assume', 'expect', 'normal',
+        'stuck', 'confus', 'complicat', 'understand', 'why', 'sense', 'logic', 'believe'
+    ],
+    'Dichotomy of Control': [
+        'control', 'they', 'boss', 'other', 'people', 'think', 'judge', 'opinion', 'economy',
+        'uncertain', 'depend', 'wait', 'decision', 'react', 'worry', 'anxious', 'news', 'luck'
+    ],
+    '5 Whys': [
+        'keep', 'again', 'always', 'procrastinat', 'repeat', 'pattern', 'habit', 'cause', 'reason',
+        'lazy', 'motivat', 'avoid', 'delay', 'start', 'finish', 'stop'
+    ],
+    'Outcome Forecasting': [
+        'will', 'future', 'happen', 'chance', 'likely', 'probably', 'predict', 'outcome', 'result',
+        'sure', 'certain', 'forever', 'reject', 'lose', 'fired', 'interview'
+    ],
+    'Cost-Benefit': [
+        'choose', 'choice', 'decide', 'option', 'quit', 'stay', 'leave', 'worth', 'money', 'cost',
+        'risk', 'trade', 'offer', 'move', 'switch', 'between', 'or'
+    ],
+    'Scaling': [
+        'overwhelm', 'too', 'much', 'huge', 'big', 'everything', 'embarrass', 'humiliat', 'matter',
+        'ashamed', 'meeting', 'present', 'deadline', 'exam', 'mountain', 'impossible'
+    ],
+    'Premortem': [
+        'project', 'plan', 'presentation', 'prepare', 'pitch', 'deliver', 'ship', 'release',
+        'perform', 'go', 'event', 'talk', 'test', 'nervous', 'ready', 'upcoming'
+    ]
+}
+
+DEFAULT_MODELS = ['Dichotomy of Control', 'Scaling']
+
+# Precomputed templates: {topic} is a short phrase lifted from the user's input
+TEMPLATES = {
+    'Inversion': {
+        'reframe': "Instead of imagining {topic} failing, list the fastest ways it could fail and stop doing those things.",
+        'explanation': "Inversion helps identify avoidable errors by thinking backward from worst outcomes.",
+        'action_steps': [
+            "List top 3 actions that would guarantee a bad outcome",
+            "Write one mitigation next to each failure path",
+            "Schedule a 30-minute check-in to review mitigations"
+        ]
+    },
+    'First Principles': {
+        'reframe': "Strip {topic} down to what you know is true, then rebuild your conclusion from those facts only.",
+        'explanation': "First Principles separates facts from assumptions so the reasoning stops leaning on fears.",
+        'action_steps': [
+            "Write down 3 facts you are certain of",
+            "Circle every assumption you cannot prove",
+            "Spend 10 minutes rebuilding the conclusion from the facts alone"
+        ]
+    },
+    'Dichotomy of Control': {
+        'reframe': "Separate what you control about {topic} from what you don't; focus on the controllables first.",
+        'explanation': "This reduces anxiety by directing energy toward elements you can directly change.",
+        'action_steps': [
+            "Write two lists: what you control and what you don't",
+            "Pick one controllable item and work on it for 20 minutes"
+        ]
+    },
+    '5 Whys': {
+        'reframe': "Ask 'why?' five times about {topic} to reach the root cause, not the symptom.",
+        'explanation': "Repeated why-questions uncover the root cause, which is usually smaller and more fixable.",
+        'action_steps': [
+            "Write the problem at the top of a page and answer 'why' five times",
+            "Choose one small change that addresses the last answer",
+            "Try that change for the next 15 minutes"
+        ]
+    },
+    'Outcome Forecasting': {
+        'reframe': "Forecast {topic} honestly: write the realistic best, worst and most likely outcomes.",
+        'explanation': "Spelling out the likely case usually shows the feared outcome is one possibility, not a certainty.",
+        'action_steps': [
+            "Write realistic best, worst and likely scenarios in 10 minutes",
+            "Estimate how likely each scenario really is",
+            "Plan one step that improves the likely case"
+        ]
+    },
+    'Cost-Benefit': {
+        'reframe': "Put {topic} on paper: list the costs and benefits of each path side by side.",
+        'explanation': "Making the trade-offs explicit turns a looping worry into a decision you can reason about.",
+        'action_steps': [
+            "Draw a two-column table of costs and benefits for each option",
+            "Mark the one factor that matters most to you",
+            "Set a timer for 15 minutes and make a provisional choice"
+        ]
+    },
+    'Scaling': {
+        'reframe': "Zoom out: how important will {topic} feel in 6 months? Focus on learning, not perfection.",
+        'explanation': "Scaling helps reduce emotional weight by expanding time perspective.",
+        'action_steps': [
+            "Write down one learning goal (not perfection)",
+            "Remind yourself of a past challenge that felt scary but turned out fine"
+        ]
+    },
+    'Premortem': {
+        'reframe': "Imagine {topic} went badly: what specifically happened? Prepare for those scenarios now.",
+        'explanation': "Premortem identifies concrete risks ahead of time so you can address them proactively.",
+        'action_steps': [
+            "List 3 things that could go wrong",
+            "Rehearse a response to each for 10 minutes",
+            "Prepare one fallback plan"
+        ]
+    }
+}
+
+SUMMARIES = {
+    'gentle': "You've already taken a good step by naming this; {first} and {second} give you a calmer way forward.",
+    'direct': "Use {first} and {second}: act on the steps below.",
+    'balanced': "{first} and {second} turn this worry into concrete next steps."
+}
+
+_TOPIC = re.compile(r"\b(my|the|this|our|your)\s+([a-z'-]+(?:\s+[a-z'-]+)?)", re.I)
+_TOPIC_STOP = {
+    'will', 'would', 'is', 'was', 'are', 'be', 'and', 'or', 'but', 'to', 'so', 'if', 'because',
+    'tomorrow', 'today', 'tonight', 'again', 'keeps', 'going', 'at', 'in', 'on', 'for', 'with',
+    'hates', 'thinks', 'says', 'feels', 'seems', "won't", "doesn't", "isn't", "can't", 'never'
+}
+
+
+def _build_index() -> Tuple[Dict[str, Dict[str, float]], Dict[str, float]]:
+    """TF-IDF weights of each keyword stem in each model profile (computed once at import)"""
+    documents = {model: Counter(stem(k) for k in keywords) for model, keywords in MODEL_KEYWORDS.items()}
+    df = Counter(term for terms in documents.values() for term in terms)
+    idf = {term: math.log(1 + len(documents) / count) for term, count in df.items()}
+    weights = {}
+    for model, terms in documents.items():
+        weights[model] = {term: tf * idf[term] for term, tf in terms.items()}
+    return weights, idf
+
+
+MODEL_WEIGHTS, IDF = _build_index()
+
+
+def classify(text: str, k: int = 2) -> List[str]:
+    """Top-k mental models for the text; falls back to safe defaults for unmatched input"""
+    stems = tokenize(text)
+    scores = {
+        model: sum(weights.get(s, 0.0) for s in stems)
+        for model, weights in MODEL_WEIGHTS.items()
+    }
+    ranked = [m for m, score in sorted(scores.items(), key=lambda kv: -kv[1]) if score > 0]
+    for model in DEFAULT_MODELS:
+        if len(ranked) >= k:
+            break
+        if model not in ranked:
+            ranked.append(model)
+    return ranked[:k]
+
+
+def extract_topic(text: str) -> str:
+    """Short noun phrase to personalise templates ('my presentation'); 'this' when none is found"""
+    match = _TOPIC.search(text)
+    if not match:
+        return 'this'
+    words = []
+    for word in match.group(2).split():
+        if word.lower() in _TOPIC_STOP:
+            break
+        words.append(word)
+    if not words:
+        return 'this'
+    return f"{match.group(1).lower()} {' '.join(words)}"
+
+
+def generate(user_input: str, tone: str = 'gentle') -> Dict[str, Any]:
+    """
+    Degraded-mode reframe in the same shape as a parsed model response, flagged degraded
+    """
+    models = classify(user_input)
+    topic = extract_topic(user_input)
+
+    reframes = []
+    for model in models:
+        template = TEMPLATES[model]
+        reframes.append({
+            'model': model,
+            'reframe': template['reframe'].format(topic=topic),
+            'explanation': template['explanation'],
+            'action_steps': list(template['action_steps'])
+        })
+
+    summary = SUMMARIES.get(tone, SUMMARIES['balanced']).format(first=models[0], second=models[1])
+    return {
+        'input': user_input,
+        'model_selection': models,
+        'reframes': reframes,
+        'summary': summary[0].upper() + summary[1:],
+        'follow_up': '24 hours',
+        'degraded': True
+    }
@@ -0,0 +1,109 @@
+"""
+Long Input
+Map-reduce preparation of long journal entries for one reframe.
+
+The entry is cut into sentence-aligned chunks; a short extraction prompt per
+chunk (run in parallel by the caller) pulls out the candidate stuck beliefs,
+and the distilled list replaces the entry as the input of the usual reframe
+call. The number of chunks is capped, so an entry of any accepted length
+costs one parallel extraction wave plus the final call.
+"""
+
+import json
+import math
+import os
+import re
+from typing import List
+
+# Inputs up to MAX_INPUT_CHARS take the normal path; longer ones up to LONG_INPUT_MAX_CHARS are distilled
+MAX_INPUT_CHARS = 500
+LONG_INPUT_MAX_CHARS = int(os.environ.get('LONG_INPUT_MAX_CHARS', '8000'))
+CHUNK_CHARS = int(os.environ.get('LONG_INPUT_CHUNK_CHARS', '800'))
+# Chunks grow past CHUNK_CHARS rather than exceed this, so extraction stays one wave
+MAX_CHUNKS = 12
+MAX_BELIEFS = 8
+BELIEFS_PER_CHUNK = 3
+
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+EXTRACTION_PROMPT = (
+    "You read one part of a longer journal entry. Extract the stuck beliefs or worries "
+    f"the writer holds, at most {BELIEFS_PER_CHUNK}, each as one short first-person sentence "
+    "in their own words. Skip background facts and events. If there are none, return an empty list.\n\n"
+    'Respond ONLY with JSON: {"beliefs": ["..."]}'
+)
+
+
+def is_long(text: str) -> bool:
+    return len(text) > MAX_INPUT_CHARS
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+
+
+def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS, max_chunks: int = MAX_CHUNKS) -> List[str]:
+    """
+    Sentence-aligned chunks of about chunk_chars (more when that would exceed max_chunks)
+    A sentence longer than a chunk is split at word boundaries
+    """
+    size = max(chunk_chars, math.ceil(len(text) / max_chunks))
+    pieces = []
+    for sentence in split_sentences(text):
+        while len(sentence) > size:
+            cut = sentence.rfind(' ', 0, size)
+            cut = cut if cut > 0 else size
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+
+    chunks = []
+    current = ''
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > size:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def parse_beliefs(response_text: str) -> List[str]:
+    """Beliefs from an extraction response; tolerates prose around the JSON"""
+    start, end = response_text.find('{'), response_text.rfind('}')
+    if start == -1 or end == -1:
+        raise ValueError("No JSON object found in extraction response")
+    beliefs = json.loads(response_text[start:end + 1]).get('beliefs', [])
+    if not isinstance(beliefs, list):
+        raise ValueError("Extraction response 'beliefs' must be a list")
+    return [str(b).strip() for b in beliefs if str(b).strip()][:BELIEFS_PER_CHUNK]
+
+
+def distill(per_chunk: List[List[str]], limit: int = MAX_BELIEFS) -> List[str]:
+    """
+    Merge chunk beliefs in entry order, dropping repeats
+    When over the limit, every chunk keeps its first belief before any keeps a second
+    """
+    seen = set()
+    unique = []
+    for beliefs in per_chunk:
+        kept = []
+        for belief in beliefs:
+            key = re.sub(r'[^a-z0-9 ]', '', belief.lower()).strip()
+            if key and key not in seen:
+                seen.add(key)
+                kept.append(belief)
+        unique.append(kept)
+
+    ranked = sorted(((rank, index, belief) for index, beliefs in enumerate(unique)
+                     for rank, belief in enumerate(beliefs)))[:limit]
+    return [belief for _, _, belief in sorted(ranked, key=lambda r: (r[1], r[0]))]
+
+
+def distilled_input(beliefs: List[str]) -> str:
+    """Input for the final reframe call in place of the full entry"""
+    lines = "\n".join(f"- {belief}" for belief in beliefs)
+    return f"Stuck beliefs distilled from a longer journal entry:\n{lines}"
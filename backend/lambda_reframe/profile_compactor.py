@@ -0,0 +1,228 @@
+"""
+Profile Compactor
+Folds each user's reframes into a fixed-size rolling profile summary on the user item,
+so prompts carry long-term patterns without growing with history length
+"""
+
+import heapq
+import os
+import re
+import boto3
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+from botocore.exceptions import ClientError
+
+from reframe_codec import unpack_item
+from repository import DynamoRepository
+
+dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+
+REFRAMES_TABLE = os.environ.get('REFRAMES_TABLE', 'CognitiveReframer-Reframes')
+USERS_TABLE = os.environ.get('USERS_TABLE', 'CognitiveReframer-Users')
+
+# Retained counters are capped; a few times more than we show keeps the top entries stable
+THEME_CAPACITY = 30
+ACTION_CAPACITY = 20
+MODEL_CAPACITY = 16
+# Ids of the latest folds kept for dedup; must outlast how far out of order the stream delivers
+RECENT_ID_CAPACITY = 200
+MAX_CONFLICT_RETRIES = 3
+
+STOPWORDS = {
+    'about', 'after', 'again', 'also', 'always', 'because', 'been', 'before', 'being',
+    'cannot', 'could', 'does', 'doing', 'done', 'even', 'ever', 'every', 'feel', 'feeling',
+    'from', 'going', 'have', 'having', 'into', 'just', 'keep', 'know', 'like', 'make',
+    'more', 'much', 'myself', 'need', 'never', 'only', 'other', 'really', 'should', 'some',
+    'still', 'sure', 'that', 'their', 'them', 'then', 'there', 'they', 'thing', 'things',
+    'think', 'this', 'those', 'today', 'very', 'want', 'were', 'what', 'when', 'which',
+    'will', 'with', 'worried', 'would', 'your'
+}
+
+
+def empty_summary() -> Dict[str, Any]:
+    """Summary for a user with no reframes yet"""
+    return {
+        'reframe_count': 0,
+        'themes': {},
+        'model_counts': {},
+        'action_steps': {},
+        'recent_reframe_ids': [],
+        'last_reframe_at': ''
+    }
+
+
+def extract_themes(text: str) -> List[str]:
+    """
+    Cheap theme extraction: distinct content words of 4+ letters
+    """
+    words = re.findall(r"[a-z][a-z']{3,}", (text or '').lower())
+    seen = []
+    for word in words:
+        word = word.strip("'")
+        if word in STOPWORDS or word in seen:
+            continue
+        seen.append(word)
+    return seen
+
+
+def normalize_action_step(step: str) -> str:
+    """
+    Normalize an action step so near-identical steps count together
+    """
+    step = re.sub(r'[^a-z ]+', ' ', (step or '').lower())
+    words = step.split()[:8]
+    return ' '.join(words)
+
+
+def _bump(counter: Dict[str, Any], key: str, capacity: int) -> None:
+    if not key:
+        return
+    counter[key] = int(counter.get(key, 0)) + 1
+    if len(counter) > capacity:
+        # Evict the weakest other entry so a new key gets a chance to climb
+        weakest = min((k for k in counter if k != key), key=lambda k: int(counter[k]))
+        del counter[weakest]
+
+
+def fold_reframe(summary: Dict[str, Any], item: Dict[str, Any]) -> bool:
+    """
+    Fold one stored reframe item into the summary in place
+    Returns False if the item was already folded: its reframe_id is among the
+    recent ones, so an item arriving out of order is still counted
+    """
+    created_at = item.get('created_at', '')
+    recent = summary.setdefault('recent_reframe_ids', [])
+    reframe_id = item.get('reframe_id')
+    if reframe_id in recent:
+        return False
+    # Summaries from before the id list only have the created_at watermark
+    if not recent and created_at and created_at <= summary.get('last_reframe_at', ''):
+        return False
+    if reframe_id:
+        recent.append(reframe_id)
+        del recent[:-RECENT_ID_CAPACITY]
+
+    summary['reframe_count'] = int(summary.get('reframe_count', 0)) + 1
+
+    for theme in extract_themes(item.get('source_input', '')):
+        _bump(summary['themes'], theme, THEME_CAPACITY)
+
+    for model in item.get('models_used', []) or []:
+        _bump(summary['model_counts'], str(model), MODEL_CAPACITY)
+
+    for reframe in item.get('reframes', []) or []:
+        for step in reframe.get('action_steps', []) or []:
+            _bump(summary['action_steps'], normalize_action_step(step), ACTION_CAPACITY)
+
+    summary['last_reframe_at'] = max(created_at, summary.get('last_reframe_at', ''))
+    return True
+
+
+def top_entries(counter: Dict[str, Any], limit: int) -> List[tuple]:
+    """Highest-count entries first, ties broken alphabetically"""
+    return sorted(((k, int(v)) for k, v in counter.items()), key=lambda kv: (-kv[1], kv[0]))[:limit]
+
+
+def fold_items(user_id: str, items: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Fold a batch of new reframe items into the user's stored summary
+    Uses a version check so concurrent compactions never lose updates
+    """
+    items = sorted(items, key=lambda i: i.get('created_at', ''))
+    table = dynamodb.Table(USERS_TABLE)
+
+    for _ in range(MAX_CONFLICT_RETRIES):
+        response = table.get_item(
+            Key={'user_id': user_id},
+            ProjectionExpression='profile_summary, profile_version',
+            ConsistentRead=True
+        )
+        stored = response.get('Item', {})
+        summary = _from_dynamo(stored.get('profile_summary')) or empty_summary()
+        version = int(stored.get('profile_version', 0))
+
+        changed = [fold_reframe(summary, item) for item in items]
+        if not any(changed):
+            return summary
+
+        try:
+            table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='SET profile_summary = :summary, profile_version = :next',
+                ConditionExpression='attribute_not_exists(profile_version) OR profile_version = :current',
+                ExpressionAttributeValues={
+                    ':summary': summary,
+                    ':next': version + 1,
+                    ':current': version
+                }
+            )
+            return summary
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+            print(f"Profile version conflict for user {user_id}, retrying")
+
+    print(f"Giving up on profile compaction for user {user_id} after {MAX_CONFLICT_RETRIES} conflicts")
+    return None
+
+
+def process_records(records: List[Dict[str, Any]]) -> int:
+    """
+    Fold a batch of deserialized stream INSERT images, grouped per user
+    Returns the number of users updated
+    """
+    by_user = defaultdict(list)
+    for item in records:
+        if item.get('user_id'):
+            by_user[item['user_id']].append(item)
+
+    for user_id, items in by_user.items():
+        fold_items(user_id, items)
+    return len(by_user)
+
+
+def _shard_items(table, shard: str):
+    """One UserShardIndex partition, oldest first"""
+    query_kwargs = {
+        'IndexName': 'UserShardIndex',
+        'KeyConditionExpression': 'user_shard = :shard',
+        'ExpressionAttributeValues': {':shard': shard},
+        'ScanIndexForward': True
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def rebuild_profile(user_id: str) -> Dict[str, Any]:
+    """
+    Recompute a user's summary from their full history (backfill / periodic sweep)
+    """
+    table = dynamodb.Table(REFRAMES_TABLE)
+    summary = empty_summary()
+    # A hot user's shards are merged back into one oldest-first history
+    shards = [_shard_items(table, shard) for shard in DynamoRepository(dynamodb).user_shard_keys(user_id)]
+    for item in heapq.merge(*shards, key=lambda i: i['created_at']):
+        fold_reframe(summary, unpack_item(item))
+
+    dynamodb.Table(USERS_TABLE).update_item(
+        Key={'user_id': user_id},
+        UpdateExpression='SET profile_summary = :summary ADD profile_version :one',
+        ExpressionAttributeValues={':summary': summary, ':one': 1}
+    )
+    return summary
+
+
+def _from_dynamo(summary: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not summary:
+        return None
+    result = empty_summary()
+    result.update(summary)
+    result['reframe_count'] = int(result['reframe_count'])
+    for field in ('themes', 'model_counts', 'action_steps'):
+        result[field] = {k: int(v) if isinstance(v, Decimal) else v for k, v in result[field].items()}
+    return result
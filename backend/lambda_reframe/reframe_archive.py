@@ -0,0 +1,264 @@
+"""
+Reframe Archive
+Cold tier for reframes leaving DynamoDB through the 90-day TTL.
+
+Expiring items are written in large batches as gzip NDJSON objects to a local
+directory or S3-compatible bucket, partitioned by user hash and month:
+
+    user_hash=3f/month=2025-01/part-<epoch ms>-<uuid>.ndjson.gz
+
+Within a part each user's rows are one gzip member, and a zero-byte pointer
+per (user, part) records that member's byte range:
+
+    index/user=<user digest>/month=2025-01/part-<...>.ndjson.gz@<offset>+<length>
+
+so a user's history reads list their own pointers and range-read only their
+own rows, never the other users sharing the hash bucket.
+
+handle_history pages into the archive once the hot table has no older items.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+import uuid
+import boto3
+from botocore.exceptions import ClientError
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+
+from blob_store import open_blob_store
+from reframe_codec import unpack_item
+
+dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+
+REFRAMES_TABLE = os.environ.get('REFRAMES_TABLE', 'CognitiveReframer-Reframes')
+ARCHIVE_URI = os.environ.get('ARCHIVE_URI', '')  # Empty disables the archive tier
+
+TTL_PRINCIPAL = 'dynamodb.amazonaws.com'
+
+
+def archive_enabled() -> bool:
+    return bool(ARCHIVE_URI)
+
+
+def _store():
+    return open_blob_store(ARCHIVE_URI)
+
+
+def user_hash(user_id: str) -> str:
+    """256 hash buckets keep partitions evenly sized however skewed the users"""
+    return hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:2]
+
+
+def partition_prefix(user_id: str, month: Optional[str] = None) -> str:
+    prefix = f"user_hash={user_hash(user_id)}/"
+    return f"{prefix}month={month}/" if month else prefix
+
+
+def index_prefix(user_id: str) -> str:
+    """Prefix of one user's member pointers"""
+    return f"index/user={hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:32]}/"
+
+
+def _pointer_key(user_id: str, month: str, part_name: str, offset: int, length: int) -> str:
+    return f"{index_prefix(user_id)}month={month}/{part_name}@{offset}+{length}"
+
+
+def is_ttl_delete(record: Dict[str, Any]) -> bool:
+    """REMOVE records issued by the TTL service (not by application deletes)"""
+    identity = record.get('userIdentity') or {}
+    return (
+        record.get('eventName') == 'REMOVE'
+        and identity.get('type') == 'Service'
+        and identity.get('principalId') == TTL_PRINCIPAL
+    )
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def _gzip_member(items: List[Dict[str, Any]]) -> bytes:
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as gz:
+        for item in items:
+            gz.write((json.dumps(item, default=_json_default, ensure_ascii=False) + '\n').encode('utf-8'))
+    return buffer.getvalue()
+
+
+def archive_items(items: List[Dict[str, Any]], store=None) -> int:
+    """
+    Write items to the archive, one object per (user hash, month) partition
+    plus one member pointer per user in it
+    Returns the number of part objects written
+    """
+    store = store or _store()
+    partitions = defaultdict(lambda: defaultdict(list))
+    for item in items:
+        if not item.get('user_id') or not item.get('created_at'):
+            continue
+        month = item['created_at'][:7]
+        partitions[(partition_prefix(item['user_id'], month), month)][item['user_id']].append(unpack_item(item))
+
+    for (prefix, month), users in partitions.items():
+        # Concatenated gzip members are still one valid gzip stream for bulk readers
+        part_name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.ndjson.gz"
+        data = b''
+        pointers = []
+        for user_id, batch in users.items():
+            member = _gzip_member(batch)
+            pointers.append(_pointer_key(user_id, month, part_name, len(data), len(member)))
+            data += member
+        # Part first, so a pointer never names a missing object
+        store.put(prefix + part_name, data)
+        for pointer in pointers:
+            store.put(pointer, b'')
+
+    return len(partitions)
+
+
+def process_records(records: List[Dict[str, Any]], deserialize) -> int:
+    """
+    Archive the old images of TTL deletes in a stream batch
+    deserialize converts a stream image to plain Python values
+    """
+    if not archive_enabled():
+        return 0
+    expired = [
+        deserialize(record['dynamodb']['OldImage'])
+        for record in records
+        if is_ttl_delete(record) and record.get('dynamodb', {}).get('OldImage')
+    ]
+    if not expired:
+        return 0
+    archive_items(expired)
+    return len(expired)
+
+
+def sweep_expiring(horizon_seconds: int = 24 * 60 * 60, batch_size: int = 5000) -> int:
+    """
+    Pre-expiry sweep: archive items whose TTL falls within the horizon
+    Alternative to the stream path; readers de-duplicate by reframe_id, so
+    overlapping with stream archival is harmless. Swept items are marked
+    with archived_at, so later sweeps skip them.
+    """
+    if not archive_enabled():
+        return 0
+
+    table = dynamodb.Table(REFRAMES_TABLE)
+    scan_kwargs = {
+        'FilterExpression': '#t < :cutoff AND attribute_not_exists(archived_at)',
+        'ExpressionAttributeNames': {'#t': 'ttl'},
+        'ExpressionAttributeValues': {':cutoff': int(time.time()) + horizon_seconds}
+    }
+    pending = []
+    archived = 0
+
+    while True:
+        response = table.scan(**scan_kwargs)
+        pending.extend(response.get('Items', []))
+        if len(pending) >= batch_size:
+            archive_items(pending)
+            mark_archived(table, pending)
+            archived += len(pending)
+            pending = []
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    if pending:
+        archive_items(pending)
+        mark_archived(table, pending)
+        archived += len(pending)
+
+    print(f"Archived {archived} expiring reframes")
+    return archived
+
+
+def mark_archived(table, items: List[Dict[str, Any]]) -> None:
+    """SET archived_at on swept items, after their part is written; items the TTL already removed stay gone"""
+    archived_at = int(time.time())
+    for item in items:
+        try:
+            table.update_item(
+                Key={'reframe_id': item['reframe_id']},
+                UpdateExpression='SET archived_at = :now',
+                ConditionExpression='attribute_exists(reframe_id)',
+                ExpressionAttributeValues={':now': archived_at}
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+
+
+def _decode(data: Optional[bytes]) -> List[Dict[str, Any]]:
+    if not data:
+        return []
+    with gzip.GzipFile(fileobj=io.BytesIO(data)) as gz:
+        return [json.loads(line) for line in gz if line.strip()]
+
+
+def read_archived(user_id: str, before: Optional[str] = None, limit: int = 20,
+                  store=None) -> List[Dict[str, Any]]:
+    """
+    A user's archived reframes older than `before`, newest first
+    Lists the user's own member pointers and range-reads only those members;
+    months are read newest-first and reading stops once a full month boundary
+    yields enough items, so recent pages never touch old months
+    """
+    store = store or _store()
+    prefix = index_prefix(user_id)
+
+    months = defaultdict(list)
+    for key in store.list(prefix):
+        month, _, pointer = key[len(prefix):].partition('/')
+        if month.startswith('month=') and '@' in pointer:
+            months[month[len('month='):]].append(pointer)
+
+    found = {}
+    for month in sorted(months, reverse=True):
+        if before and month > before[:7]:
+            continue
+        for pointer in months[month]:
+            part_name, _, span = pointer.rpartition('@')
+            offset, _, length = span.partition('+')
+            data = store.get_range(partition_prefix(user_id, month) + part_name, int(offset), int(length))
+            for item in _decode(data):
+                if item.get('user_id') != user_id:
+                    continue
+                if before and item.get('created_at', '') >= before:
+                    continue
+                found[item['reframe_id']] = item
+        if len(found) >= limit:
+            break
+
+    items = sorted(found.values(), key=lambda i: i.get('created_at', ''), reverse=True)
+    return items[:limit]
+
+
+def index_existing(store=None) -> int:
+    """
+    One-off migration: pointers for parts written before member pointers existed
+    Those parts are a single member, so each user's pointer spans the whole
+    object (read, then filtered by user_id). Re-running is harmless.
+    Returns the number of pointers written
+    """
+    store = store or _store()
+    written = 0
+    for key in store.list('user_hash='):
+        _, month, part_name = key.split('/', 2)
+        data = store.get(key) or b''
+        for user_id in {item.get('user_id') for item in _decode(data) if item.get('user_id')}:
+            store.put(_pointer_key(user_id, month[len('month='):], part_name, 0, len(data)), b'')
+            written += 1
+    print(f"Wrote {written} archive pointers")
+    return written
@@ -0,0 +1,231 @@
+"""
+Shadow Mode
+Mirrors a sample of real reframe requests to candidate Bedrock models, off the
+user's path, and keeps daily per-model counters (latency, tokens, parse rate,
+output size) next to the primary model's on the same requests.
+
+The reframe Lambda hands a sampled request (system prompt, input and the
+primary's outcome) to an asynchronous invocation of itself; that invocation
+calls every candidate in parallel and folds the outcomes into one stats item
+per day (shadow#<day>), so the comparison report is a single BatchGetItem.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import boto3
+from botocore.config import Config
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+
+import usage_stats
+
+# An Event invocation only queues the payload; a short timeout caps what a slow queue can cost the user
+SHADOW_DISPATCH_TIMEOUT = float(os.environ.get('SHADOW_DISPATCH_TIMEOUT', '1'))
+
+lambda_client = boto3.client(
+    'lambda', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+    config=Config(connect_timeout=SHADOW_DISPATCH_TIMEOUT, read_timeout=SHADOW_DISPATCH_TIMEOUT,
+                  retries={'total_max_attempts': 1})
+)
+
+SHADOW_MODEL_IDS = [m.strip() for m in os.environ.get('SHADOW_MODEL_IDS', '').split(',') if m.strip()]
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', '0'))
+# Function that runs the candidates; the reframe Lambda itself by default
+SHADOW_FUNCTION_NAME = os.environ.get('SHADOW_FUNCTION_NAME') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', '')
+# A model is only recommended once it parses this often over at least SHADOW_MIN_SAMPLES requests
+SHADOW_MIN_PARSE_RATE = float(os.environ.get('SHADOW_MIN_PARSE_RATE', '0.98'))
+SHADOW_MIN_SAMPLES = int(os.environ.get('SHADOW_MIN_SAMPLES', '50'))
+
+# Per-model counters ('shadow_requests:<model_id>'); errors are calls that never answered
+SHADOW_COUNTERS = ('requests', 'parsed', 'errors', 'latency_ms', 'input_tokens', 'output_tokens', 'output_chars')
+# Upper bounds of the latency histogram the percentiles are read from
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000, 30000)
+
+
+def shadow_key(day: str) -> str:
+    return f"shadow#{day}"
+
+
+def sampled(rate: Optional[float] = None) -> bool:
+    """Whether to mirror this request; never without candidates"""
+    rate = SHADOW_SAMPLE_RATE if rate is None else rate
+    return bool(SHADOW_MODEL_IDS) and rate > 0 and random.random() < rate
+
+
+def outcome(model_id: str, result: Any, elapsed: float) -> Dict[str, Any]:
+    """
+    One model's outcome on a request from what model_reframe returned or raised
+    A parse failure carries the call's usage (the model answered); any other
+    exception means the model never answered (throttling, timeout, ...)
+    """
+    usage = result.get('usage') if isinstance(result, dict) else getattr(result, 'usage', None)
+    if not usage:
+        return {'model_id': model_id, 'parsed': False, 'error': type(result).__name__,
+                'latency_ms': int(elapsed * 1000)}
+    return {
+        'model_id': model_id,
+        'parsed': isinstance(result, dict),
+        'latency_ms': int(usage.get('latency_ms', elapsed * 1000)),
+        'input_tokens': int(usage.get('input_tokens') or 0),
+        'output_tokens': int(usage.get('output_tokens') or 0),
+        'output_chars': int(usage.get('output_chars') or 0)
+    }
+
+
+def latency_bucket(latency_ms: int) -> str:
+    for bound in LATENCY_BUCKETS_MS:
+        if latency_ms <= bound:
+            return str(bound)
+    return 'inf'
+
+
+def outcome_counters(result: Dict[str, Any], primary: bool = False) -> Counter:
+    model_id = result['model_id']
+    counters = Counter({f"shadow_requests:{model_id}": 1})
+    if primary:
+        counters[f"shadow_primary:{model_id}"] += 1
+    if result.get('error'):
+        counters[f"shadow_errors:{model_id}"] += 1
+        return counters
+    counters[f"shadow_parsed:{model_id}"] += int(result['parsed'])
+    for counter in ('latency_ms', 'input_tokens', 'output_tokens', 'output_chars'):
+        counters[f"shadow_{counter}:{model_id}"] += result[counter]
+    counters[f"shadow_latency_le_{latency_bucket(result['latency_ms'])}:{model_id}"] += 1
+    return counters
+
+
+def dispatch(system_prompt: str, user_input: str, primary: Dict[str, Any]) -> None:
+    """
+    Hand a sampled request to an asynchronous shadow invocation; never raises
+    Called inline: Lambda freezes the environment once the handler returns, so
+    a background thread could lose the dispatch. The Event invocation returns
+    as soon as the payload is queued.
+    """
+    payload = {'shadow': {'system_prompt': system_prompt, 'user_input': user_input,
+                          'primary': primary, 'candidates': SHADOW_MODEL_IDS,
+                          'day': datetime.utcnow().strftime('%Y-%m-%d')}}
+    try:
+        lambda_client.invoke(FunctionName=SHADOW_FUNCTION_NAME, InvocationType='Event',
+                             Payload=json.dumps(payload).encode('utf-8'))
+    except Exception as e:
+        print(f"Error dispatching shadow request: {e}")
+
+
+def run(request: Dict[str, Any], call: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Shadow invocation: call(model_id) every candidate in parallel on the
+    mirrored request and record them with the primary's outcome
+    """
+    candidates = [m for m in request.get('candidates', []) if m != request['primary']['model_id']]
+
+    def measure(model_id):
+        started = time.monotonic()
+        try:
+            result = call(model_id)
+        except Exception as e:
+            result = e
+        return outcome(model_id, result, time.monotonic() - started)
+
+    with ThreadPoolExecutor(max_workers=max(len(candidates), 1)) as pool:
+        outcomes = list(pool.map(measure, candidates))
+
+    totals = outcome_counters(request['primary'], primary=True)
+    for result in outcomes:
+        totals.update(outcome_counters(result))
+    usage_stats.apply_counters({shadow_key(request['day']): totals})
+    print(f"Shadowed request on {len(candidates)} candidates: {outcomes}")
+    return {'primary': request['primary'], 'candidates': outcomes}
+
+
+def latency_percentile(counters: Counter, model_id: str, answered: int, q: float) -> Optional[int]:
+    """Upper bound (ms) of the histogram bucket holding the q-quantile; None above the last bucket"""
+    seen = 0
+    for bound in LATENCY_BUCKETS_MS:
+        seen += counters.get(f"shadow_latency_le_{bound}:{model_id}", 0)
+        if answered and seen >= q * answered:
+            return bound
+    return None
+
+
+def model_comparison(counters: Counter, model_id: str) -> Dict[str, Any]:
+    figures = {c: counters.get(f"shadow_{c}:{model_id}", 0) for c in SHADOW_COUNTERS}
+    requests = figures['requests']
+    answered = requests - figures['errors']
+    comparison = {
+        'role': 'primary' if counters.get(f"shadow_primary:{model_id}") else 'candidate',
+        'requests': requests,
+        'parse_rate': round(figures['parsed'] / requests, 4) if requests else 0,
+        'error_rate': round(figures['errors'] / requests, 4) if requests else 0,
+        'avg_latency_ms': round(figures['latency_ms'] / answered) if answered else None,
+        'p50_latency_ms': latency_percentile(counters, model_id, answered, 0.5),
+        'p95_latency_ms': latency_percentile(counters, model_id, answered, 0.95),
+        'avg_input_tokens': round(figures['input_tokens'] / answered, 1) if answered else 0,
+        'avg_output_tokens': round(figures['output_tokens'] / answered, 1) if answered else 0,
+        'avg_output_chars': round(figures['output_chars'] / answered) if answered else 0
+    }
+    cost = usage_stats.usage_figures(answered, figures['input_tokens'], figures['output_tokens'],
+                                     figures['latency_ms'], model_id=model_id).get('cost_per_1k_requests_usd')
+    if cost is not None:
+        comparison['cost_per_1k_requests_usd'] = cost
+    return comparison
+
+
+def compare(days: int = 7, end_date: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Primary and candidates side by side over the last `days` days of shadowed requests
+    The recommendation is the fastest model (p95, then mean latency) that parses at
+    least SHADOW_MIN_PARSE_RATE of at least SHADOW_MIN_SAMPLES requests
+    """
+    day_list = usage_stats.day_range(days, end_date)
+    totals = Counter()
+    for counters in usage_stats.fetch_counters([shadow_key(day) for day in day_list]).values():
+        totals.update(counters)
+
+    model_ids = sorted(k[len('shadow_requests:'):] for k in totals if k.startswith('shadow_requests:'))
+    models = {model_id: model_comparison(totals, model_id) for model_id in model_ids}
+    eligible = [m for m, figures in models.items()
+                if figures['requests'] >= SHADOW_MIN_SAMPLES and figures['parse_rate'] >= SHADOW_MIN_PARSE_RATE
+                and figures['avg_latency_ms'] is not None]
+    recommended = min(eligible, key=lambda m: (models[m]['p95_latency_ms'] or float('inf'),
+                                               models[m]['avg_latency_ms']), default=None)
+    return {'days': len(day_list), 'from': day_list[0], 'to': day_list[-1],
+            'models': models, 'recommended': recommended}
+
+
+def format_report(comparison: Dict[str, Any]) -> str:
+    """Plain-text side-by-side table of the shadowed models"""
+    lines = [f"Shadow traffic {comparison['from']} .. {comparison['to']}",
+             f"{'model':<46}{'role':>10}{'requests':>10}{'parsed':>8}{'errors':>8}{'avg ms':>8}"
+             f"{'p95 ms':>8}{'out tok':>9}{'chars':>7}{'$/1K req':>10}"]
+    for model_id, m in sorted(comparison['models'].items(), key=lambda item: item[1]['role'] != 'primary'):
+        cost = m.get('cost_per_1k_requests_usd')
+        lines.append(f"{model_id:<46}{m['role']:>10}{m['requests']:>10}{m['parse_rate']:>8.1%}{m['error_rate']:>8.1%}"
+                     f"{m['avg_latency_ms'] if m['avg_latency_ms'] is not None else '-':>8}"
+                     f"{m['p95_latency_ms'] or '>' + str(LATENCY_BUCKETS_MS[-1]):>8}{m['avg_output_tokens']:>9}"
+                     f"{m['avg_output_chars']:>7}{cost if cost is not None else '-':>10}")
+    lines.append(f"Recommended: {comparison['recommended'] or 'none yet'} "
+                 f"(fastest p95 with parse rate >= {SHADOW_MIN_PARSE_RATE:.0%} over >= {SHADOW_MIN_SAMPLES} requests)")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the primary model with shadowed candidates')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--end-date')
+    parser.add_argument('--json', action='store_true', help='Print the raw comparison instead of a table')
+    args = parser.parse_args(argv)
+
+    comparison = compare(args.days, args.end_date)
+    print(json.dumps(comparison, indent=2) if args.json else format_report(comparison))
+    return 0
+
+
+if __name__ == '__main__':
+    # Usage: python shadow_mode.py [--days N] [--end-date YYYY-MM-DD] [--json]
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Single-flight request coalescing
+Identical in-flight reframe requests share one Bedrock invocation:
+within a container via a per-key waiter, across containers via a DynamoDB lease item
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from botocore.exceptions import ClientError
+
+
+def request_key(user_id: str, user_input: str, tone: str) -> str:
+    """
+    Stable key for a (user_id, input, tone) request
+    Whitespace is collapsed so trivially re-typed submissions coalesce too
+    """
+    normalized = ' '.join(user_input.split())
+    raw = json.dumps([user_id, normalized, tone], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    """A single in-flight call that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    In-process coalescing: the first caller for a key runs the function,
+    concurrent callers with the same key block and receive the same result
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn once per in-flight key
+        Returns (result, shared) where shared is True for followers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self) -> int:
+        """Number of keys currently being computed"""
+        with self._lock:
+            return len(self._calls)
+
+
+class DynamoLease:
+    """
+    Cross-container coalescing backed by a short-lived DynamoDB item
+
+    The leader wins a conditional put on the request key, computes the result
+    and writes it back onto the item. Followers poll the item with consistent
+    reads and return the stored result. If the leader fails, its lease runs
+    out or the follower's own wait limit passes, followers fall back to
+    computing the result themselves.
+    """
+
+    def __init__(self, table, lease_seconds: float = 15, result_ttl: float = 60,
+                 poll_interval: float = 0.25):
+        self.table = table
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+
+    def run(self, key: str, fn: Callable[[], Dict[str, Any]],
+            max_wait: Optional[float] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Run fn under the lease for key
+        A follower waits at most max_wait seconds (None: until the lease expires)
+        Returns (result, shared) where shared is True when another container's result was used
+        """
+        try:
+            acquired = self._acquire(key)
+        except ClientError as e:
+            print(f"Lease unavailable, computing directly: {e}")
+            return fn(), False
+
+        if not acquired:
+            result = self._wait_for_result(key, max_wait)
+            if result is not None:
+                return result, True
+            print(f"Lease for {key[:12]} gave no result in time, computing directly")
+            return fn(), False
+
+        try:
+            result = fn()
+        except Exception:
+            self._release(key)
+            raise
+
+        self._publish(key, result)
+        return result, False
+
+    def _acquire(self, key: str) -> bool:
+        now = time.time()
+        try:
+            self.table.put_item(
+                Item={
+                    'request_key': key,
+                    'status': 'pending',
+                    'lease_expires': int((now + self.lease_seconds) * 1000),
+                    'ttl': int(now + self.lease_seconds + self.result_ttl)
+                },
+                ConditionExpression='attribute_not_exists(request_key) OR lease_expires < :now',
+                ExpressionAttributeValues={':now': int(now * 1000)}
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def _wait_for_result(self, key: str, max_wait: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while True:
+            try:
+                item = self.table.get_item(Key={'request_key': key}, ConsistentRead=True).get('Item')
+            except ClientError as e:
+                print(f"Error polling lease: {e}")
+                return None
+
+            if not item:
+                # Leader failed and released the lease
+                return None
+            if item.get('status') == 'done':
+                return json.loads(item['result'])
+            if int(item.get('lease_expires', 0)) < time.time() * 1000:
+                return None
+            if deadline is not None and time.monotonic() + self.poll_interval > deadline:
+                return None
+
+            time.sleep(self.poll_interval)
+
+    def _publish(self, key: str, result: Dict[str, Any]) -> None:
+        # Done items keep the lease until the result expires, so late
+        # duplicates (client retries) read the stored result as well
+        now = time.time()
+        try:
+            self.table.update_item(
+                Key={'request_key': key},
+                UpdateExpression='SET #s = :done, #r = :result, lease_expires = :expires, #t = :ttl',
+                ExpressionAttributeNames={'#s': 'status', '#r': 'result', '#t': 'ttl'},
+                ExpressionAttributeValues={
+                    ':done': 'done',
+                    ':result': json.dumps(result, default=str),
+                    ':expires': int((now + self.result_ttl) * 1000),
+                    ':ttl': int(now + self.result_ttl)
+                }
+            )
+        except ClientError as e:
+            print(f"Error publishing lease result: {e}")
+
+    def _release(self, key: str) -> None:
+        try:
+            self.table.delete_item(Key={'request_key': key})
+        except ClientError as e:
+            print(f"Error releasing lease: {e}")
@@ -0,0 +1,169 @@
+"""
+Reframes Stream Consumer Lambda
+Single reader of the ReframesTable stream that fans each batch out to the
+incremental background jobs (profile compaction, usage statistics, archival,
+near-duplicate indexing)
+"""
+
+import json
+import os
+import boto3
+from typing import Dict, Any, List
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError, BotoCoreError
+
+import profile_compactor
+import reframe_archive
+import usage_stats
+from reframe_codec import unpack_item
+from repository import DynamoRepository
+import near_duplicate
+
+dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+streams = boto3.client('dynamodbstreams', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+sqs = boto3.client('sqs', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+
+# On-failure destination of the stream mapping: batches that exhausted their retries
+STREAM_FAILURE_QUEUE_URL = os.environ.get('STREAM_FAILURE_QUEUE_URL', '')
+
+_deserializer = TypeDeserializer()
+
+
+def lambda_handler(event, context):
+    """
+    Handler for DynamoDB stream batches and manual maintenance invocations
+    """
+    if 'Records' in event:
+        return process_batch(event['Records'])
+
+    # Manual / scheduled sweep: {"action": "rebuild_profiles", "user_ids": [...]}
+    action = event.get('action')
+    if action == 'rebuild_profiles':
+        user_ids = event.get('user_ids', [])
+        for user_id in user_ids:
+            profile_compactor.rebuild_profile(user_id)
+        return {'rebuilt': user_ids}
+
+    # Scheduled replay of batches sent to the failure queue: {"action": "replay_failures"}
+    if action == 'replay_failures':
+        return replay_failures(int(event.get('max_messages', 10)))
+
+    # Scheduled pre-expiry sweep: {"action": "sweep_expiring", "horizon_seconds": 86400}
+    if action == 'sweep_expiring':
+        archived = reframe_archive.sweep_expiring(int(event.get('horizon_seconds', 24 * 60 * 60)))
+        return {'archived': archived}
+
+    # One-off migration for archive parts written before member pointers: {"action": "index_archive"}
+    if action == 'index_archive':
+        return {'pointers': reframe_archive.index_existing()}
+
+    print(f"Unknown stream consumer event: {json.dumps(event)[:500]}")
+    return {'error': f'Unknown action: {action}'}
+
+
+def process_batch(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fan one batch of stream records out to the background jobs"""
+    inserted = inserted_items(records)
+    users = profile_compactor.process_records(inserted)
+    archived = reframe_archive.process_records(records, deserialize_image)
+    indexed = index_near_duplicates(inserted)
+    # Last, so a failing job above raises before any counter moves; the
+    # per-batch marker makes a retry of this same batch skip applied keys
+    stat_updates = usage_stats.process_records(inserted, usage_stats.batch_id(records))
+    print(f"Stream batch: {len(records)} records, {len(inserted)} inserts, "
+          f"{users} profiles updated, {stat_updates} stat items updated, {archived} archived, "
+          f"{indexed} near-duplicate index entries")
+    return {'processed': len(records)}
+
+
+def failed_batch_records(batch_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Re-read the records of a failed batch from the stream
+    batch_info is the DDBStreamBatchInfo of an on-failure message; stream
+    records are kept for 24 hours, so replay has to happen within that window
+    """
+    iterator = streams.get_shard_iterator(
+        StreamArn=batch_info['streamArn'],
+        ShardId=batch_info['shardId'],
+        ShardIteratorType='AT_SEQUENCE_NUMBER',
+        SequenceNumber=batch_info['startSequenceNumber']
+    )['ShardIterator']
+    end = int(batch_info['endSequenceNumber'])
+
+    records = []
+    while iterator:
+        response = streams.get_records(ShardIterator=iterator, Limit=1000)
+        for record in response.get('Records', []):
+            sequence_number = int(record['dynamodb']['SequenceNumber'])
+            if sequence_number > end:
+                return records
+            records.append(record)
+            if sequence_number == end:
+                return records
+        if not response.get('Records'):
+            break
+        iterator = response.get('NextShardIterator')
+    return records
+
+
+def replay_failures(max_messages: int = 10) -> Dict[str, Any]:
+    """
+    Re-run batches that exhausted their stream retries
+    A message is deleted only once its batch has been processed; the stat
+    updates are deduplicated by batch id, so a partly applied batch is safe to replay
+    """
+    if not STREAM_FAILURE_QUEUE_URL:
+        return {'replayed': 0}
+
+    replayed = failed = 0
+    while replayed + failed < max_messages:
+        response = sqs.receive_message(QueueUrl=STREAM_FAILURE_QUEUE_URL,
+                                       MaxNumberOfMessages=min(10, max_messages - replayed - failed))
+        messages = response.get('Messages', [])
+        if not messages:
+            break
+        for message in messages:
+            try:
+                batch_info = json.loads(message['Body'])['DDBStreamBatchInfo']
+                process_batch(failed_batch_records(batch_info))
+            except (ClientError, BotoCoreError, KeyError, ValueError) as e:
+                # Left on the queue: visible again after its timeout, dropped at retention
+                print(f"Error replaying failed stream batch: {e}")
+                failed += 1
+                continue
+            sqs.delete_message(QueueUrl=STREAM_FAILURE_QUEUE_URL, ReceiptHandle=message['ReceiptHandle'])
+            replayed += 1
+
+    print(f"Replayed {replayed} failed stream batches, {failed} still failing")
+    return {'replayed': replayed, 'failed': failed}
+
+
+def index_near_duplicates(items: List[Dict[str, Any]]) -> int:
+    """Add new reframes' signature bands to the per-user near-duplicate index"""
+    entries = near_duplicate.index_entries(items)
+    if not entries:
+        return 0
+    try:
+        DynamoRepository(dynamodb).add_near_duplicate_entries(entries)
+    except (ClientError, BotoCoreError) as e:
+        # The index is best effort; failing here would replay the whole batch for the other jobs
+        print(f"Error indexing near-duplicates: {e}")
+        return 0
+    return len(entries)
+
+
+def deserialize_image(image: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a stream image from DynamoDB JSON to plain Python values"""
+    return {k: _deserializer.deserialize(v) for k, v in image.items()}
+
+
+def inserted_items(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """New images of INSERT records in the batch"""
+    items = []
+    for record in records:
+        if record.get('eventName') != 'INSERT':
+            continue
+        image = record.get('dynamodb', {}).get('NewImage')
+        if image:
+            items.append(unpack_item(deserialize_image(image)))
+    return items
@@ -0,0 +1,360 @@
+"""
+Usage Statistics
+Per-user, per-Bedrock-model and global daily counters (reframes, mental models, tone,
+degraded, model tokens and latency) maintained incrementally from the ReframesTable
+stream, so dashboards never scan reframes
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import boto3
+from botocore.exceptions import ClientError
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Iterable, Optional
+
+dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+
+REFRAMES_TABLE = os.environ.get('REFRAMES_TABLE', 'CognitiveReframer-Reframes')
+STATS_TABLE = os.environ.get('STATS_TABLE', 'CognitiveReframer-Stats')
+
+MAX_STATS_DAYS = 90
+BATCH_GET_LIMIT = 100
+
+# Set attribute older stat items used to hold the stream batches folded in; removed on their next update
+BATCHES_ATTRIBUTE = 'batches'
+# A marker item (batch#<id>#<stat_key>) records that a batch was folded into a stat item.
+# It outlives stream retention and the failure queue (both 24 h) before TTL removes it
+BATCH_MARKER_TTL_SECONDS = 7 * 24 * 60 * 60
+
+SCOPES = ('user', 'model', 'global')
+
+# On-demand USD per 1K (input, output) tokens, matched against the model id;
+# MODEL_PRICES (JSON, same shape) overrides or adds entries
+DEFAULT_MODEL_PRICES = {
+    'anthropic.claude-v2': (0.008, 0.024),
+    'anthropic.claude-instant': (0.0008, 0.0024),
+    'anthropic.claude-3-haiku': (0.00025, 0.00125),
+    'anthropic.claude-3-5-haiku': (0.0008, 0.004),
+    'anthropic.claude-3-sonnet': (0.003, 0.015),
+    'anthropic.claude-3-5-sonnet': (0.003, 0.015),
+    'anthropic.claude-3-7-sonnet': (0.003, 0.015),
+    'anthropic.claude-sonnet-4': (0.003, 0.015),
+    'anthropic.claude-3-opus': (0.015, 0.075),
+    'amazon.titan-text-lite': (0.00015, 0.0002),
+    'amazon.titan-text-express': (0.0002, 0.0006)
+}
+MODEL_PRICES = {**DEFAULT_MODEL_PRICES, **json.loads(os.environ.get('MODEL_PRICES') or '{}')}
+
+# Token counters, overall and per Bedrock model ('input_tokens:<model_id>')
+USAGE_COUNTERS = ('usage_requests', 'input_tokens', 'output_tokens', 'latency_ms')
+
+
+def stat_key(scope: str, day: str, subject: Optional[str] = None) -> str:
+    """
+    Partition key of a daily counter item, e.g. user#alice#2025-01-15,
+    model#anthropic.claude-v2#2025-01-15 or global#2025-01-15
+    """
+    if scope in ('user', 'model'):
+        return f"{scope}#{subject}#{day}"
+    return f"global#{day}"
+
+
+def item_counters(item: Dict[str, Any]) -> Counter:
+    """Counter increments contributed by one stored reframe"""
+    counters = Counter({'reframes': 1})
+    for model in item.get('models_used', []) or []:
+        counters[f"model:{model}"] += 1
+    counters[f"tone:{item.get('tone') or 'unknown'}"] += 1
+    if item.get('degraded'):
+        counters['degraded'] += 1
+    usage = item.get('usage')
+    if usage and usage.get('model_id'):
+        for counter in USAGE_COUNTERS:
+            amount = 1 if counter == 'usage_requests' else int(usage.get(counter) or 0)
+            counters[counter] += amount
+            counters[f"{counter}:{usage['model_id']}"] += amount
+        # Long entries also pay for their belief extraction calls
+        extraction = usage.get('extraction') or {}
+        for counter in ('input_tokens', 'output_tokens'):
+            amount = int(extraction.get(counter) or 0)
+            counters[counter] += amount
+            if extraction.get('model_id'):
+                counters[f"{counter}:{extraction['model_id']}"] += amount
+    return counters
+
+
+def aggregate(items: Iterable[Dict[str, Any]]) -> Dict[str, Counter]:
+    """Sum counters per stat key over a batch of reframe items"""
+    totals: Dict[str, Counter] = defaultdict(Counter)
+    for item in items:
+        user_id = item.get('user_id')
+        day = (item.get('created_at') or '')[:10]
+        if not user_id or not day:
+            continue
+        counters = item_counters(item)
+        totals[stat_key('user', day, user_id)].update(counters)
+        totals[stat_key('global', day)].update(counters)
+        if counters['usage_requests']:
+            totals[stat_key('model', day, item['usage']['model_id'])].update(counters)
+    return totals
+
+
+def batch_id(records: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Stable id of a stream batch from its records' sequence numbers
+    A retried batch gets the same id; None when the records carry no sequence numbers
+    """
+    sequence_numbers = sorted(r.get('dynamodb', {}).get('SequenceNumber', '') for r in records)
+    if not any(sequence_numbers):
+        return None
+    return hashlib.blake2b(','.join(sequence_numbers).encode('ascii'), digest_size=8).hexdigest()
+
+
+def apply_counters(totals: Dict[str, Counter], batch: Optional[str] = None) -> int:
+    """
+    One atomic ADD update per stat key for the whole batch
+    With a batch id each update is a transaction with a conditional put of the
+    batch's marker item for that key, so a retried stream batch never
+    double-counts, even when it failed half-way through its keys, while the
+    stat item itself stays small.
+    Returns the number of stat items updated
+    """
+    table = dynamodb.Table(STATS_TABLE)
+    expires = int(time.time()) + BATCH_MARKER_TTL_SECONDS
+    updated = 0
+    for key, counters in totals.items():
+        names = {'#batches': BATCHES_ATTRIBUTE}
+        values = {}
+        clauses = []
+        for i, (counter, amount) in enumerate(sorted(counters.items())):
+            names[f"#c{i}"] = counter
+            values[f":v{i}"] = amount
+            clauses.append(f"#c{i} :v{i}")
+        update = {
+            'Key': {'stat_key': key},
+            'UpdateExpression': 'ADD ' + ', '.join(clauses) + ' REMOVE #batches',
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values
+        }
+        if not batch:
+            table.update_item(**update)
+            updated += 1
+            continue
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=[
+                {'Put': {'TableName': STATS_TABLE,
+                         'Item': {'stat_key': batch_marker_key(batch, key), 'ttl': expires},
+                         'ConditionExpression': 'attribute_not_exists(stat_key)'}},
+                {'Update': {'TableName': STATS_TABLE, **update}}
+            ])
+            updated += 1
+        except ClientError as e:
+            reasons = e.response.get('CancellationReasons') or []
+            if not reasons or reasons[0].get('Code') != 'ConditionalCheckFailed':
+                raise
+            print(f"Stats batch {batch} already applied to {key}; skipping")
+    return updated
+
+
+def batch_marker_key(batch: str, key: str) -> str:
+    return f"batch#{batch}#{key}"
+
+
+def process_records(records: List[Dict[str, Any]], batch: Optional[str] = None) -> int:
+    """Fold a batch of deserialized stream INSERT images into the counters"""
+    return apply_counters(aggregate(records), batch)
+
+
+def day_range(days: int, end_date: Optional[str] = None) -> List[str]:
+    """The last `days` days (at most MAX_STATS_DAYS) ending today or end_date, oldest first"""
+    days = max(1, min(int(days), MAX_STATS_DAYS))
+    end = datetime.strptime(end_date, '%Y-%m-%d') if end_date else datetime.utcnow()
+    return [(end - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(days - 1, -1, -1)]
+
+
+def fetch_counters(keys: List[str]) -> Dict[str, Counter]:
+    """Counters of each stat item, one BatchGetItem per 100 keys; missing items are empty"""
+    found = {}
+    for start in range(0, len(keys), BATCH_GET_LIMIT):
+        request = {STATS_TABLE: {'Keys': [{'stat_key': k} for k in keys[start:start + BATCH_GET_LIMIT]]}}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(STATS_TABLE, []):
+                found[item['stat_key']] = item
+            request = response.get('UnprocessedKeys') or None
+    return {key: Counter({k: int(v) for k, v in found.get(key, {}).items()
+                          if k not in ('stat_key', BATCHES_ATTRIBUTE)})
+            for key in keys}
+
+
+def read_stats(scope: str, user_id: Optional[str] = None, days: int = 7,
+               end_date: Optional[str] = None, model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Daily counters for the last `days` days (ending today or end_date)
+    Cost is one BatchGetItem per 100 days, independent of data volume
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown stats scope: {scope}")
+    if scope == 'user' and not user_id:
+        raise ValueError("user_id is required for user stats")
+    if scope == 'model' and not model_id:
+        raise ValueError("model_id is required for model stats")
+    day_list = day_range(days, end_date)
+    subject = model_id if scope == 'model' else user_id
+    keys = {stat_key(scope, day, subject): day for day in day_list}
+    found = fetch_counters(list(keys))
+
+    daily = []
+    totals = Counter()
+    for key, day in keys.items():
+        counters = found[key]
+        totals.update(counters)
+        daily.append(format_counters(counters, date=day))
+
+    result = {'scope': scope, 'days': daily, 'totals': format_counters(totals)}
+    if scope == 'user':
+        result['user_id'] = user_id
+    elif scope == 'model':
+        result['model_id'] = model_id
+    return result
+
+
+def format_counters(counters: Counter, **extra) -> Dict[str, Any]:
+    """Split flat counter attributes into reframes / degraded / models / tones / usage"""
+    formatted = dict(extra)
+    formatted['reframes'] = counters.get('reframes', 0)
+    formatted['degraded'] = counters.get('degraded', 0)
+    formatted['models'] = {k[len('model:'):]: v for k, v in counters.items() if k.startswith('model:')}
+    formatted['tones'] = {k[len('tone:'):]: v for k, v in counters.items() if k.startswith('tone:')}
+    formatted['usage'] = usage_summary(counters)
+    return formatted
+
+
+def model_price(model_id: str) -> Optional[tuple]:
+    """
+    (input, output) USD per 1K tokens; the longest entry the id contains wins,
+    so cross-region inference profiles ('us.anthropic...') price like their model
+    """
+    matches = [prefix for prefix in MODEL_PRICES if prefix in model_id]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def usage_figures(requests: int, input_tokens: int, output_tokens: int, latency_ms: int,
+                  model_id: Optional[str] = None) -> Dict[str, Any]:
+    """Per-request averages, plus the estimated cost when the model's price is known"""
+    figures = {
+        'requests': requests,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'tokens_per_request': round((input_tokens + output_tokens) / requests, 1) if requests else 0,
+        'avg_latency_ms': round(latency_ms / requests) if requests else 0
+    }
+    price = model_price(model_id) if model_id else None
+    if price:
+        cost = input_tokens / 1000 * price[0] + output_tokens / 1000 * price[1]
+        figures['estimated_cost_usd'] = round(cost, 6)
+        figures['cost_per_1k_requests_usd'] = round(cost / requests * 1000, 4) if requests else 0
+    return figures
+
+
+def usage_summary(counters: Counter) -> Dict[str, Any]:
+    """
+    Bedrock token usage and latency, overall and per model
+    Cost covers the models with a known price (see MODEL_PRICES)
+    """
+    per_model = {}
+    for key in counters:
+        if key.startswith('usage_requests:'):
+            model_id = key[len('usage_requests:'):]
+            per_model[model_id] = usage_figures(*(counters.get(f"{c}:{model_id}", 0) for c in USAGE_COUNTERS),
+                                                model_id=model_id)
+    summary = usage_figures(*(counters.get(c, 0) for c in USAGE_COUNTERS))
+    priced = [m for m in per_model.values() if 'estimated_cost_usd' in m]
+    if priced:
+        cost = sum(m['estimated_cost_usd'] for m in priced)
+        requests = sum(m['requests'] for m in priced)
+        summary['estimated_cost_usd'] = round(cost, 6)
+        summary['cost_per_1k_requests_usd'] = round(cost / requests * 1000, 4) if requests else 0
+    summary['models'] = per_model
+    return summary
+
+
+def backfill() -> int:
+    """
+    Rebuild all counters from a full scan of ReframesTable
+    Counters are overwritten (SET), so re-running is safe; run it while the
+    stream consumer is paused to avoid racing with live ADD updates
+    """
+    reframes = dynamodb.Table(REFRAMES_TABLE)
+    totals: Dict[str, Counter] = defaultdict(Counter)
+
+    scan_kwargs = {
+        'ProjectionExpression': 'user_id, created_at, models_used, tone, degraded, #usage',
+        # USAGE is a reserved word
+        'ExpressionAttributeNames': {'#usage': 'usage'}
+    }
+    while True:
+        response = reframes.scan(**scan_kwargs)
+        for key, counters in aggregate(response.get('Items', [])).items():
+            totals[key].update(counters)
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    stats = dynamodb.Table(STATS_TABLE)
+    with stats.batch_writer() as batch:
+        for key, counters in totals.items():
+            batch.put_item(Item={'stat_key': key, **counters})
+
+    print(f"Backfilled {len(totals)} stat items")
+    return len(totals)
+
+
+def format_report(stats: Dict[str, Any]) -> str:
+    """Plain-text table of daily token usage and estimated cost"""
+    lines = [f"{'date':<12}{'requests':>10}{'tokens/req':>12}{'in':>10}{'out':>10}"
+             f"{'latency ms':>12}{'$/1K req':>10}"]
+    for row in stats['days'] + [dict(stats['totals'], date='total')]:
+        usage = row['usage']
+        cost = usage.get('cost_per_1k_requests_usd')
+        lines.append(f"{row['date']:<12}{usage['requests']:>10}{usage['tokens_per_request']:>12}"
+                     f"{usage['input_tokens']:>10}{usage['output_tokens']:>10}{usage['avg_latency_ms']:>12}"
+                     f"{cost if cost is not None else '-':>10}")
+    for model_id, usage in sorted(stats['totals']['usage']['models'].items()):
+        cost = usage.get('cost_per_1k_requests_usd')
+        lines.append(f"  {model_id}: {usage['requests']} requests, {usage['tokens_per_request']} tokens/request, "
+                     f"${cost if cost is not None else '?'} per 1K requests")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Usage counters: backfill and token/cost report')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('backfill', help='Rebuild all counters from a scan of ReframesTable')
+
+    report = sub.add_parser('report', help='Daily Bedrock tokens per request and estimated cost per 1K requests')
+    report.add_argument('--scope', choices=SCOPES, default='global')
+    report.add_argument('--user-id')
+    report.add_argument('--model-id')
+    report.add_argument('--days', type=int, default=7)
+    report.add_argument('--end-date')
+    report.add_argument('--json', action='store_true', help='Print the raw stats instead of a table')
+
+    args = parser.parse_args(argv)
+    if args.command == 'backfill':
+        backfill()
+        return 0
+    stats = read_stats(args.scope, user_id=args.user_id, days=args.days,
+                       end_date=args.end_date, model_id=args.model_id)
+    print(json.dumps(stats, indent=2) if args.json else format_report(stats))
+    return 0
+
+
+if __name__ == '__main__':
+    # Usage: python usage_stats.py backfill | report [--scope global|user|model] [--days N]
+    sys.exit(main())
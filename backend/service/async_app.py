@@ -0,0 +1,475 @@
+"""
+Async Reframe Service
+asyncio variant of the reframe, history and memory-tool flows for running the
+same code as a long-lived container service behind a load balancer.
+
+One process keeps a single tuned aiobotocore client (and connection pool) per
+AWS service, so hundreds of concurrent requests share keep-alive connections
+while they mostly wait on Bedrock. Prompt construction, response parsing and
+item building are reused from the Lambda modules unchanged.
+"""
+
+import asyncio
+import heapq
+import json
+import os
+import time
+from contextlib import AsyncExitStack
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+import app as reframe_app
+import degraded_mode
+import long_input
+import memory_tool
+import reframe_archive
+import user_shards
+from reframe_codec import unpack_items
+from repository import merge_history_versions
+
+REGION = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
+PORT = int(os.environ.get('PORT', '8080'))
+
+# Connection pool tuning: one pool per AWS service per process
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '256'))
+CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '30'))
+KEEPALIVE_TIMEOUT = float(os.environ.get('AWS_KEEPALIVE_TIMEOUT', '60'))
+
+# Optional endpoint overrides for local stand-ins (DynamoDB Local, fake Bedrock)
+DYNAMODB_ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL') or None
+BEDROCK_ENDPOINT_URL = os.environ.get('BEDROCK_ENDPOINT_URL') or None
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def client_config() -> AioConfig:
+    """Pool size, keep-alive and timeouts shared by every client in the process"""
+    return AioConfig(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        tcp_keepalive=True,
+        retries={'max_attempts': 3, 'mode': 'adaptive'},
+        connector_args={'keepalive_timeout': KEEPALIVE_TIMEOUT}
+    )
+
+
+def to_dynamo(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _serializer.serialize(v) for k, v in item.items()}
+
+
+def from_dynamo(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+
+class AsyncSingleFlight:
+    """Identical in-flight requests await one shared task"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, factory):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # Shield so one cancelled caller does not cancel the shared work
+        return await asyncio.shield(task)
+
+
+class ReframeService:
+    """
+    Reframe, history and memory flows over low-level async clients
+    Mirrors handle_reframe / handle_history / memory_tool in the Lambdas
+    """
+
+    def __init__(self, dynamodb, bedrock):
+        self.dynamodb = dynamodb
+        self.bedrock = bedrock
+        self.flight = AsyncSingleFlight()
+
+    async def reframe(self, user_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        user_input, tone = reframe_app.validate_reframe_input(body)
+        if reframe_app.is_self_harm_risk(user_input):
+            return reframe_app.safety_response()
+
+        key = reframe_app.request_key(user_id, user_input, tone)
+        return await self.flight.do(key, lambda: self.generate(user_id, user_input, tone))
+
+    async def generate(self, user_id: str, user_input: str, tone: str) -> Dict[str, Any]:
+        started = time.monotonic()
+        memory_context = await self.query_user(user_id, limit=3)
+        profile_summary = await self.load_profile_summary(user_id) if memory_context else None
+
+        system_prompt = reframe_app.build_system_prompt(tone, memory_context, profile_summary)
+        if long_input.is_long(user_input):
+            model_call = self.long_reframe(system_prompt, user_input, started)
+        else:
+            model_call = self.model_reframe(system_prompt, user_input)
+        try:
+            reframe_data = await asyncio.wait_for(model_call, reframe_app.remaining_budget(started))
+        except Exception as e:
+            if not reframe_app.DEGRADED_FALLBACK:
+                raise
+            print(f"Model path unavailable ({type(e).__name__}: {e}); serving degraded reframe")
+            reframe_data = degraded_mode.generate(user_input, tone)
+
+        item = reframe_app.build_reframe_item(user_id, user_input, reframe_data, tone)
+        await self.store_item(item)
+
+        return {
+            'reframe_id': item['reframe_id'],
+            'user_id': user_id,
+            'created_at': item['created_at'],
+            **reframe_data
+        }
+
+    async def model_reframe(self, system_prompt: str, user_input: str) -> Dict[str, Any]:
+        call_started = time.monotonic()
+        reframe_response = await self.invoke_bedrock(system_prompt, user_input)
+        latency = time.monotonic() - call_started
+        try:
+            reframe_data = reframe_app.parse_reframe_response(reframe_response)
+            reframe_data['input'] = user_input
+        except json.JSONDecodeError as e:
+            print(f"Failed to parse Bedrock response as JSON: {reframe_response}")
+            raise ValueError(f"Model returned invalid JSON: {str(e)}")
+        reframe_data['usage'] = reframe_app.request_usage(reframe_app.MODEL_ID, reframe_response, latency)
+        return reframe_data
+
+    async def extract_beliefs(self, chunk: str) -> tuple:
+        """As reframe_app.extract_beliefs: (beliefs, usage)"""
+        output = await self.invoke_bedrock(long_input.EXTRACTION_PROMPT, chunk,
+                                           model_id=reframe_app.EXTRACTION_MODEL_ID or reframe_app.MODEL_ID)
+        return long_input.parse_beliefs(output), getattr(output, 'usage', {})
+
+    async def long_reframe(self, system_prompt: str, user_input: str, started: float) -> Dict[str, Any]:
+        """
+        As reframe_app.long_reframe: every chunk's extraction concurrently on the
+        event loop, then one reframe call on the distilled beliefs
+        """
+        chunks = long_input.chunk_text(user_input)
+        tasks = [asyncio.ensure_future(self.extract_beliefs(chunk)) for chunk in chunks]
+        done, pending = await asyncio.wait(tasks, timeout=reframe_app.remaining_budget(started))
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"Belief extraction ran out of latency budget on {len(pending)} chunks")
+
+        per_chunk = []
+        extraction = {'model_id': reframe_app.EXTRACTION_MODEL_ID or reframe_app.MODEL_ID, 'calls': len(chunks),
+                      'input_tokens': 0, 'output_tokens': 0}
+        # Chunk order, so distill keeps the entry's order of beliefs
+        for task in tasks:
+            if task not in done:
+                continue
+            if task.exception():
+                print(f"Belief extraction failed for one chunk: {task.exception()}")
+                continue
+            beliefs, usage = task.result()
+            per_chunk.append(beliefs)
+            extraction['input_tokens'] += usage.get('input_tokens', 0)
+            extraction['output_tokens'] += usage.get('output_tokens', 0)
+
+        beliefs = long_input.distill(per_chunk)
+        if not beliefs:
+            raise ValueError(f"No beliefs extracted from {len(chunks)} chunks")
+        print(f"Distilled {len(beliefs)} beliefs from {len(chunks)} chunks")
+
+        reframe_data = await self.model_reframe(system_prompt, long_input.distilled_input(beliefs))
+        reframe_data['input'] = user_input
+        reframe_data['distilled_beliefs'] = beliefs
+        reframe_data['usage']['extraction'] = extraction
+        return reframe_data
+
+    async def store_item(self, item: Dict[str, Any]) -> None:
+        """Put a reframe, then advance the user's history version (as DynamoRepository.put_reframe)"""
+        user_id = item['user_id']
+        shard, promoted = user_shards.shard_map.shard_for_write(user_id, await self.user_shard_count(user_id))
+        if promoted:
+            await self.dynamodb.update_item(
+                TableName=reframe_app.USERS_TABLE,
+                Key={'user_id': {'S': user_id}},
+                UpdateExpression='SET user_shards = if_not_exists(user_shards, :n)',
+                ExpressionAttributeValues={':n': {'N': str(user_shards.shard_map.shards)}}
+            )
+        await self.dynamodb.put_item(TableName=reframe_app.REFRAMES_TABLE, Item=to_dynamo(dict(item, user_shard=shard)))
+        # The version lives on the shard's own Users item, so hot users' writes spread here too
+        await self.dynamodb.update_item(
+            TableName=reframe_app.USERS_TABLE,
+            Key={'user_id': {'S': shard}},
+            UpdateExpression='SET history_newest = :newest ADD history_count :count',
+            ExpressionAttributeValues={':newest': {'S': item['created_at']}, ':count': {'N': '1'}}
+        )
+
+    async def user_shard_count(self, user_id: str) -> int:
+        """As DynamoRepository.user_shard_count"""
+        known = user_shards.shard_map.known_count(user_id)
+        if known is not None:
+            return known
+        try:
+            response = await self.dynamodb.get_item(
+                TableName=reframe_app.USERS_TABLE,
+                Key={'user_id': {'S': user_id}},
+                ProjectionExpression='user_shards'
+            )
+        except ClientError as e:
+            print(f"Error reading user shards: {e}")
+            return 1
+        return user_shards.shard_map.remember(user_id, from_dynamo(response.get('Item', {})).get('user_shards'))
+
+    async def query_user(self, user_id: str, limit: int, before: Optional[str] = None,
+                         since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """As read_user, but a failed query reads as no reframes"""
+        try:
+            return await self.read_user(user_id, limit, before=before, since=since)
+        except ClientError as e:
+            print(f"Error querying reframes: {e}")
+            return []
+
+    async def read_user(self, user_id: str, limit: int, before: Optional[str] = None,
+                        since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Newest first (oldest `limit` after `since`); a hot user's shards are queried concurrently and merged"""
+        key_condition = 'user_shard = :shard'
+        values = {}
+        if since:
+            key_condition += ' AND created_at > :since'
+            values[':since'] = {'S': since}
+        elif before:
+            key_condition += ' AND created_at < :before'
+            values[':before'] = {'S': before}
+
+        async def query_shard(shard: str) -> List[Dict[str, Any]]:
+            response = await self.dynamodb.query(
+                TableName=reframe_app.REFRAMES_TABLE,
+                IndexName='UserShardIndex',
+                KeyConditionExpression=key_condition,
+                ExpressionAttributeValues=dict(values, **{':shard': {'S': shard}}),
+                ScanIndexForward=bool(since),
+                Limit=limit
+            )
+            return [from_dynamo(item) for item in response.get('Items', [])]
+
+        shards = user_shards.shard_keys(user_id, await self.user_shard_count(user_id))
+        per_shard = await asyncio.gather(*(query_shard(shard) for shard in shards))
+        merged = heapq.merge(*per_shard, key=lambda i: i['created_at'], reverse=not since)
+        items = unpack_items([item for _, item in zip(range(limit), merged)])
+        return items[::-1] if since else items
+
+    async def history_version(self, user_id: str) -> Optional[tuple]:
+        """As DynamoRepository.history_version: the shards' version items, merged"""
+        async def read_version(key: str) -> Dict[str, Any]:
+            response = await self.dynamodb.get_item(
+                TableName=reframe_app.USERS_TABLE,
+                Key={'user_id': {'S': key}},
+                ProjectionExpression='history_newest, history_count'
+            )
+            return from_dynamo(response.get('Item', {}))
+
+        shards = user_shards.shard_keys(user_id, await self.user_shard_count(user_id))
+        try:
+            versions = await asyncio.gather(*(read_version(shard) for shard in shards))
+        except ClientError as e:
+            print(f"Error reading history version: {e}")
+            return None
+        return merge_history_versions(versions)
+
+    async def load_profile_summary(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = await self.dynamodb.get_item(
+                TableName=reframe_app.USERS_TABLE,
+                Key={'user_id': {'S': user_id}},
+                ProjectionExpression='profile_summary'
+            )
+        except ClientError as e:
+            print(f"Error loading profile summary: {e}")
+            return None
+        return from_dynamo(response.get('Item', {})).get('profile_summary')
+
+    async def invoke_bedrock(self, system_prompt: str, user_input: str, model_id: Optional[str] = None) -> str:
+        model_id = model_id or reframe_app.MODEL_ID
+        full_prompt = reframe_app.build_full_prompt(system_prompt, user_input)
+        try:
+            response = await self.bedrock.invoke_model(
+                modelId=model_id,
+                body=json.dumps(reframe_app.build_bedrock_request(model_id, full_prompt))
+            )
+            async with response['body'] as stream:
+                response_body = json.loads(await stream.read())
+        except ClientError as e:
+            print(f"Bedrock invocation error: {e}")
+            raise Exception(f"Failed to invoke Bedrock: {str(e)}")
+        usage = reframe_app.extract_bedrock_usage(model_id, response_body,
+                                                  response.get('ResponseMetadata', {}).get('HTTPHeaders'))
+        return reframe_app.ModelOutput(reframe_app.extract_bedrock_text(model_id, response_body), usage)
+
+    async def history(self, user_id: str, before: Optional[str] = None, limit: int = 20,
+                      since: Optional[str] = None, if_none_match: Optional[str] = None) -> Dict[str, Any]:
+        etag = reframe_app.history_etag(await self.history_version(user_id), before)
+        if etag and if_none_match == etag:
+            return {'user_id': user_id, 'etag': etag, 'not_modified': True}
+
+        items = await self.query_user(user_id, limit=limit, before=before, since=since)
+        if since:
+            result = {'user_id': user_id, 'history': items, 'etag': etag}
+            if len(items) >= limit:
+                result['next_since'] = items[0]['created_at']
+            return result
+
+        if len(items) < limit and reframe_archive.archive_enabled():
+            cursor = items[-1]['created_at'] if items else before
+            seen = {item['reframe_id'] for item in items}
+            try:
+                # Archive reads are blocking blob-store calls; keep them off the event loop
+                archived = await asyncio.to_thread(
+                    reframe_archive.read_archived, user_id, cursor, limit - len(items)
+                )
+                items.extend(item for item in archived if item['reframe_id'] not in seen)
+            except Exception as e:
+                print(f"Error reading archived history: {e}")
+
+        result = {'user_id': user_id, 'history': items, 'etag': etag}
+        if len(items) >= limit:
+            result['next_before'] = items[-1]['created_at']
+        return result
+
+    async def memory(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Memory tool invocation format: {action, parameters}"""
+        action = event.get('action', event.get('tool_name', 'recall'))
+        params = event.get('parameters', event.get('tool_input', {}))
+
+        if action in ('recall', 'search'):
+            if not params.get('user_id'):
+                raise ValueError("user_id is required")
+            top_k = 5 if action == 'search' else memory_tool.parse_top_k(params.get('top_k', 3))
+            # Failures surface as errors, as in the memory tool Lambda
+            items = await self.read_user(params['user_id'], limit=top_k)
+            return {'success': True, 'result': [memory_tool.format_memory(item) for item in items]}
+
+        if action == 'recall_many':
+            keyed, fetch = memory_tool.recall_plan(params.get('requests'))
+            limit = asyncio.Semaphore(memory_tool.RECALL_MANY_CONCURRENCY)
+
+            async def recall(user_id: str) -> List[Dict[str, Any]]:
+                async with limit:
+                    return await self.read_user(user_id, limit=fetch[user_id])
+
+            users = list(fetch)
+            recalled = dict(zip(users, await asyncio.gather(*(recall(u) for u in users), return_exceptions=True)))
+            # As memory_tool.memory_recall_many: a failed user shows up under `errors`
+            results, errors = {}, {}
+            for key, (user_id, top_k) in keyed.items():
+                if isinstance(recalled[user_id], Exception):
+                    print(f"Error recalling memories for {user_id}: {recalled[user_id]}")
+                    errors[key] = str(recalled[user_id])
+                    continue
+                results[key] = [memory_tool.format_memory(item) for item in recalled[user_id][:top_k]]
+            return {'success': True, 'result': {'results': results, 'errors': errors, 'queries': len(fetch)}}
+
+        if action == 'store':
+            user_id = params.get('user_id')
+            reframe_data = params.get('reframe_data', {})
+            if not user_id or not reframe_data:
+                raise ValueError("user_id and reframe_data are required")
+            item = memory_tool.build_memory_item(user_id, reframe_data)
+            await self.store_item(item)
+            return {'success': True, 'result': {'stored': True, 'reframe_id': item['reframe_id']}}
+
+        raise LookupError(f'Unknown action: {action}')
+
+
+SERVICE_KEY = web.AppKey('service', ReframeService)
+
+
+def json_response(status: int, body: Optional[Dict[str, Any]],
+                  headers: Optional[Dict[str, str]] = None) -> web.Response:
+    """Same status, headers and body encoding as app.create_response"""
+    lambda_response = reframe_app.create_response(status, body, headers=headers)
+    return web.Response(status=status, text=lambda_response['body'], headers=lambda_response['headers'])
+
+
+async def handle_api(request: web.Request) -> web.Response:
+    """POST /reframe, /history: same body contract as the API Gateway routes"""
+    service: ReframeService = request.app[SERVICE_KEY]
+    try:
+        body = await request.json()
+        action = body.get('action', 'reframe')
+        user_id = body.get('user_id', 'demo_user')
+
+        if action == 'reframe':
+            response = await service.reframe(user_id, body)
+        elif action == 'history':
+            response = await service.history(user_id, before=body.get('before'), since=body.get('since'),
+                                             if_none_match=request.headers.get('If-None-Match'))
+            etag = response.pop('etag', None)
+            headers = {'ETag': etag} if etag else None
+            if response.pop('not_modified', False):
+                return json_response(304, None, headers=headers)
+            return json_response(200, response, headers=headers)
+        else:
+            return json_response(400, {'error': f'Unknown action: {action}'})
+        return json_response(200, response)
+
+    except Exception as e:
+        print(f"Error in async handler: {str(e)}")
+        return json_response(500, {'error': str(e)})
+
+
+async def handle_memory(request: web.Request) -> web.Response:
+    """POST /memory: memory tool invocation"""
+    service: ReframeService = request.app[SERVICE_KEY]
+    try:
+        return json_response(200, await service.memory(await request.json()))
+    except (LookupError, ValueError) as e:
+        return json_response(400, {'error': str(e)})
+    except Exception as e:
+        print(f"Error in memory tool: {str(e)}")
+        return json_response(500, {'error': str(e)})
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.json_response({'status': 'ok'})
+
+
+async def aws_clients(app: web.Application):
+    """Create the process-wide clients on startup and close their pools on shutdown"""
+    session = get_session()
+    config = client_config()
+    async with AsyncExitStack() as stack:
+        dynamodb = await stack.enter_async_context(session.create_client(
+            'dynamodb', region_name=REGION, endpoint_url=DYNAMODB_ENDPOINT_URL, config=config
+        ))
+        bedrock = await stack.enter_async_context(session.create_client(
+            'bedrock-runtime', region_name=REGION, endpoint_url=BEDROCK_ENDPOINT_URL, config=config
+        ))
+        app[SERVICE_KEY] = ReframeService(dynamodb, bedrock)
+        yield
+
+
+def create_app(service: Optional[ReframeService] = None) -> web.Application:
+    """
+    Build the web application
+    Pass a service to run against injected clients (tests); otherwise AWS clients are created on startup
+    """
+    app = web.Application()
+    if service is not None:
+        app[SERVICE_KEY] = service
+    else:
+        app.cleanup_ctx.append(aws_clients)
+    for path in ('/reframe', '/history'):
+        app.router.add_post(path, handle_api)
+    app.router.add_post('/memory', handle_memory)
+    app.router.add_get('/health', handle_health)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), port=PORT, backlog=1024)
@@ -0,0 +1,203 @@
+"""
+Async Service Load Test
+Drives the async service against local stand-ins and reports latency percentiles.
+
+Bedrock is replaced by an in-process HTTP server answering
+/model/{modelId}/invoke after a fixed delay, so the test measures how many
+slow model calls one process can keep in flight. DynamoDB is either DynamoDB
+Local (--dynamodb-endpoint) or an in-memory fake.
+
+    python load_test.py --requests 2000 --concurrency 200 --bedrock-latency 0.5
+    python load_test.py --dynamodb-endpoint http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Dict, Any, List
+
+import aiohttp
+from aiohttp import web
+
+FAKE_REFRAME = {
+    'model_selection': ['Dichotomy of Control', 'Scaling'],
+    'reframes': [
+        {'model': 'Dichotomy of Control', 'reframe': 'Focus on what you can change.',
+         'explanation': 'Reduces anxiety.', 'action_steps': ['List 3 controllables']},
+        {'model': 'Scaling', 'reframe': 'Will this matter in 6 months?',
+         'explanation': 'Expands time perspective.', 'action_steps': ['Write down one learning goal']}
+    ],
+    'summary': 'Focus on controllables and zoom out.',
+    'follow_up': 'Check in tomorrow.'
+}
+
+
+STATS_KEY = web.AppKey('stats', dict)
+
+
+def fake_bedrock_app(latency: float = 0.5) -> web.Application:
+    """Bedrock runtime stand-in: every invoke sleeps `latency` then returns a canned reframe"""
+    app = web.Application()
+    app[STATS_KEY] = {'invocations': 0}
+
+    async def invoke(request: web.Request) -> web.Response:
+        await request.read()
+        app[STATS_KEY]['invocations'] += 1
+        await asyncio.sleep(latency)
+        text = json.dumps(FAKE_REFRAME)
+        if 'claude-3' in request.match_info['model_id'] or 'claude-sonnet-4' in request.match_info['model_id']:
+            body = {'content': [{'type': 'text', 'text': text}]}
+        else:
+            body = {'completion': text}
+        return web.json_response(body)
+
+    app.router.add_post('/model/{model_id}/invoke', invoke)
+    return app
+
+
+class FakeDynamoDB:
+    """
+    In-memory stand-in for the low-level async DynamoDB client
+    Implements only the calls the service makes
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    async def put_item(self, TableName, Item, **kwargs):
+        await asyncio.sleep(self.latency)
+        key = Item.get('reframe_id', Item.get('user_id'))['S']
+        self.tables.setdefault(TableName, {})[key] = Item
+        return {}
+
+    async def get_item(self, TableName, Key, **kwargs):
+        await asyncio.sleep(self.latency)
+        item = self.tables.get(TableName, {}).get(Key['user_id']['S'])
+        return {'Item': item} if item else {}
+
+    async def update_item(self, TableName, Key, ExpressionAttributeValues, **kwargs):
+        """
+        Only the user-item updates: the history version
+        (SET history_newest = :newest ADD history_count :count) and shard promotion (:n)
+        """
+        await asyncio.sleep(self.latency)
+        item = self.tables.setdefault(TableName, {}).setdefault(Key['user_id']['S'], dict(Key))
+        if ':n' in ExpressionAttributeValues:
+            item.setdefault('user_shards', ExpressionAttributeValues[':n'])
+            return {}
+        item['history_newest'] = ExpressionAttributeValues[':newest']
+        count = int(item.get('history_count', {}).get('N', 0)) + int(ExpressionAttributeValues[':count']['N'])
+        item['history_count'] = {'N': str(count)}
+        return {}
+
+    async def query(self, TableName, ExpressionAttributeValues, Limit=None, ScanIndexForward=True, **kwargs):
+        """Only UserShardIndex queries"""
+        await asyncio.sleep(self.latency)
+        shard = ExpressionAttributeValues[':shard']['S']
+        before = ExpressionAttributeValues.get(':before', {}).get('S')
+        since = ExpressionAttributeValues.get(':since', {}).get('S')
+        items = [
+            item for item in self.tables.get(TableName, {}).values()
+            if item.get('user_shard', {}).get('S') == shard and (not before or item['created_at']['S'] < before)
+            and (not since or item['created_at']['S'] > since)
+        ]
+        items.sort(key=lambda i: i['created_at']['S'], reverse=not ScanIndexForward)
+        return {'Items': items[:Limit] if Limit else items}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_load(base_url: str, requests: int, concurrency: int, users: int) -> Dict[str, Any]:
+    """Fire `requests` reframe calls with at most `concurrency` in flight"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def one(i: int):
+            nonlocal errors
+            payload = {
+                'action': 'reframe',
+                'user_id': f'load_user_{i % users}',
+                'input': f'I am worried about deadline number {i}'
+            }
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(f'{base_url}/reframe', json=payload) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1)
+    }
+
+
+async def main(args) -> Dict[str, Any]:
+    bedrock_runner = web.AppRunner(fake_bedrock_app(args.bedrock_latency))
+    await bedrock_runner.setup()
+    await web.TCPSite(bedrock_runner, '127.0.0.1', args.bedrock_port).start()
+    os.environ['BEDROCK_ENDPOINT_URL'] = f'http://127.0.0.1:{args.bedrock_port}'
+    if args.dynamodb_endpoint:
+        os.environ['DYNAMODB_ENDPOINT_URL'] = args.dynamodb_endpoint
+
+    # Import after the endpoint overrides are in place
+    import async_app
+
+    app = async_app.create_app()
+    if not args.dynamodb_endpoint:
+        app.cleanup_ctx.clear()
+        bedrock_client = async_app.get_session().create_client(
+            'bedrock-runtime', region_name=async_app.REGION,
+            endpoint_url=os.environ['BEDROCK_ENDPOINT_URL'], config=async_app.client_config()
+        )
+        bedrock = await bedrock_client.__aenter__()
+        app[async_app.SERVICE_KEY] = async_app.ReframeService(FakeDynamoDB(), bedrock)
+
+    service_runner = web.AppRunner(app)
+    await service_runner.setup()
+    await web.TCPSite(service_runner, '127.0.0.1', args.port).start()
+
+    try:
+        result = await run_load(f'http://127.0.0.1:{args.port}', args.requests, args.concurrency, args.users)
+    finally:
+        await service_runner.cleanup()
+        if not args.dynamodb_endpoint:
+            await bedrock_client.__aexit__(None, None, None)
+        await bedrock_runner.cleanup()
+
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the async reframe service against local stand-ins')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--bedrock-latency', type=float, default=0.5, help='Seconds per fake model call')
+    parser.add_argument('--dynamodb-endpoint', default='', help='DynamoDB Local URL (default: in-memory fake)')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--bedrock-port', type=int, default=8091)
+    asyncio.run(main(parser.parse_args()))
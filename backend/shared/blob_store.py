@@ -0,0 +1,135 @@
+"""
+Blob Store
+Minimal object storage used by exports and archives: a local directory
+or any S3-compatible bucket, selected by URI
+"""
+
+import os
+import boto3
+from typing import List, Optional
+from botocore.exceptions import ClientError
+
+
+class LocalBlobStore:
+    """Blobs as files under a root directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        path = os.path.join(self.root, *key.split('/'))
+        root = os.path.abspath(self.root)
+        if os.path.commonpath([root, os.path.abspath(path)]) != root:
+            raise ValueError(f"Blob key escapes the store root: {key!r}")
+        return path
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so readers never see a partial blob
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get_range(self, key: str, start: int, length: int) -> Optional[bytes]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                f.seek(start)
+                return f.read(length)
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix: str = '') -> List[str]:
+        keys = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, name), self.root)
+                key = rel.replace(os.sep, '/')
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self):
+        return f"LocalBlobStore({self.root})"
+
+
+class S3BlobStore:
+    """Blobs as objects under a bucket prefix (AWS S3 or any S3-compatible endpoint)"""
+
+    def __init__(self, bucket: str, prefix: str = '', client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client or boto3.client(
+            's3',
+            region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+            return response['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def get_range(self, key: str, start: int, length: int) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key),
+                                              Range=f"bytes={start}-{start + length - 1}")
+            return response['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def list(self, prefix: str = '') -> List[str]:
+        keys = []
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get('Contents', []):
+                keys.append(obj['Key'][strip:])
+        return sorted(keys)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def __repr__(self):
+        return f"S3BlobStore(s3://{self.bucket}/{self.prefix})"
+
+
+def open_blob_store(uri: str):
+    """
+    Open a blob store from a URI:
+    s3://bucket/prefix, file:///path or a plain local path
+    """
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3BlobStore(bucket, prefix)
+    if uri.startswith('file://'):
+        uri = uri[len('file://'):]
+    return LocalBlobStore(uri)
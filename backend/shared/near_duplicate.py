@@ -0,0 +1,145 @@
+"""
+Near-Duplicate Thoughts
+MinHash signatures of a thought's normalised content words, with LSH banding
+so a user's earlier near-duplicates are found without scanning their history.
+
+A signature is NUM_PERM minimum hashes of the word set, stored with each
+reframe (`minhash`, base64). It is cut into BANDS bands of ROWS values; two
+thoughts whose word sets have Jaccard similarity s share at least one band
+with probability 1 - (1 - s^ROWS)^BANDS (about 0.5 at s = 0.5, 0.98 at
+s = 0.7). The per-user index maps each band hash to the reframes that have
+it, so a lookup reads BANDS index entries plus the few candidates they name,
+whatever the size of the history.
+"""
+
+import base64
+import hashlib
+import os
+import random
+import struct
+from typing import Dict, Any, List, Optional, Tuple
+
+from text_tokens import stem, words
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Estimated Jaccard similarity at which two thoughts count as the same worry
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', '0.5'))
+
+SIGNATURE_ATTRIBUTE = 'minhash'
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+_rng = random.Random(20240611)  # fixed seed: signatures must be stable across deployments
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_STOP_WORDS = {
+    'a', 'about', 'after', 'again', 'all', 'am', 'an', 'and', 'are', 'at', 'be', 'because', 'been',
+    'but', 'by', 'can', 'could', 'did', 'do', 'for', 'from', 'get', 'go', 'going', 'got', 'had',
+    'has', 'have', 'i', 'if', 'in', 'is', 'it', 'its', 'just', 'll', 'm', 'me', 'must', 'my', 'myself',
+    'now', 'of', 'on', 'or', 'our', 're', 's', 'since', 'so', 'that', 'the', 'their', 'them', 'then',
+    'there', 'they', 'think', 'this', 'to', 'too', 'up', 'very', 've', 'was', 'way', 'we', 'what',
+    'when', 'whether', 'will', 'with', 'would', 'you', 'your', 'feel', 'feeling', 'really', 'probably',
+    'lately', 'own', 'making', 'many', 'lots', 'much', 'haven', 'didn', 't', 'how', 'why'
+}
+# Feelings people use interchangeably for the same worry
+_SYNONYMS = {
+    'nervous': 'worri', 'anxious': 'worri', 'scared': 'worri', 'afraid': 'worri', 'stressed': 'worri',
+    'worried': 'worri', 'worry': 'worri', 'fear': 'worri', 'terrified': 'worri',
+    'quitting': 'quit', 'failed': 'fail', 'failing': 'fail', 'failure': 'fail'
+}
+
+
+def shingles(text: str) -> set:
+    """Normalised content words of a thought"""
+    content = set()
+    for word in words(text):
+        # Contractions split into their parts: "i'm" -> "i", "m"
+        for token in word.split("'"):
+            if token and token not in _STOP_WORDS:
+                content.add(_SYNONYMS.get(token) or stem(token))
+    return content
+
+
+def _hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def signature(text: str) -> List[int]:
+    """NUM_PERM 32-bit minimum hashes; an empty thought has an all-max signature"""
+    hashes = [_hash(word) for word in shingles(text)]
+    if not hashes:
+        return [_MASK] * NUM_PERM
+    return [min(((a * h + b) % _PRIME) & _MASK for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of the word sets behind two signatures"""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERM
+
+
+def encode_signature(values: List[int]) -> str:
+    return base64.b64encode(struct.pack(f'<{NUM_PERM}I', *values)).decode('ascii')
+
+
+def decode_signature(encoded) -> Optional[List[int]]:
+    """Stored signature (base64 text) back to its values; None when absent or malformed"""
+    try:
+        return list(struct.unpack(f'<{NUM_PERM}I', base64.b64decode(encoded)))
+    except (TypeError, ValueError, struct.error):
+        return None
+
+
+def band_keys(values: List[int]) -> List[str]:
+    """One short hash per band: '<band>:<hex>'"""
+    keys = []
+    for band in range(BANDS):
+        chunk = struct.pack(f'<{ROWS}I', *values[band * ROWS:(band + 1) * ROWS])
+        keys.append(f"{band:02d}:{hashlib.blake2b(chunk, digest_size=6).hexdigest()}")
+    return keys
+
+
+def index_entries(items: List[Dict[str, Any]]) -> List[Tuple[str, str, str]]:
+    """(user_id, band_key, reframe_id) rows for the stored items that carry a signature"""
+    entries = []
+    for item in items:
+        values = decode_signature(item.get(SIGNATURE_ATTRIBUTE))
+        if values is None:
+            continue
+        entries.extend((item['user_id'], key, item['reframe_id']) for key in band_keys(values))
+    return entries
+
+
+def find_near_duplicate(repository, user_id: str, text: str,
+                        threshold: Optional[float] = None,
+                        projection: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    The user's most similar earlier reframe at or above the threshold, or None
+    Adds `similarity` to the returned item. Costs one index read and one
+    candidate read regardless of history size.
+    """
+    threshold = NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+    values = signature(text)
+    candidate_ids = repository.near_duplicate_candidates(user_id, band_keys(values))
+    if not candidate_ids:
+        return None
+
+    fields = list(projection) + [SIGNATURE_ATTRIBUTE] if projection else None
+    matches = []
+    for item in repository.get_reframes(candidate_ids, projection=fields):
+        stored = decode_signature(item.get(SIGNATURE_ATTRIBUTE))
+        if stored is None:
+            continue
+        score = similarity(values, stored)
+        if score >= threshold:
+            matches.append(dict(item, similarity=score))
+    if not matches:
+        return None
+
+    # Most similar first; the newest wins ties
+    best = max(matches, key=lambda m: (m['similarity'], m.get('created_at', '')))
+    if projection:
+        best.pop(SIGNATURE_ATTRIBUTE, None)
+    return best
@@ -0,0 +1,241 @@
+"""
+Profiling
+On-demand sampled profiling of Lambda handler invocations.
+
+`@profiled(name)` wraps a handler. A sampled invocation (PROFILE_SAMPLE_RATE,
+or an X-Profile header matching PROFILE_TOKEN) runs under cProfile and
+tracemalloc. A gzipped JSON artifact with its function stats, peak traced
+memory and the top sites of memory still allocated when the handler returns
+(what a warm container keeps) goes to PROFILE_URI: a local path (/tmp by
+default) or any S3-compatible bucket. Artifacts are capped at PROFILE_MAX_BYTES
+by dropping the cheapest functions. Unsampled invocations cost one random() call.
+
+Merge and summarize the collected artifacts with:
+    python profiling.py summarize s3://bucket/profiles --handler reframe
+"""
+
+import argparse
+import cProfile
+import functools
+import gzip
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from blob_store import open_blob_store
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+# Requests with `X-Profile: <PROFILE_TOKEN>` are always profiled; empty ignores the header
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_HEADER = 'X-Profile'
+PROFILE_URI = os.environ.get('PROFILE_URI', '/tmp/profiles')
+PROFILE_MAX_BYTES = int(os.environ.get('PROFILE_MAX_BYTES', str(256 * 1024)))
+PROFILE_TOP_ALLOCATIONS = 25
+
+ARTIFACT_SUFFIX = '.json.gz'
+
+# cProfile allows one active profiler per process; concurrent samples are skipped
+_profiling = threading.Lock()
+_store = None
+
+
+def requested(event: Any) -> bool:
+    """Whether the request asks to be profiled with the configured token"""
+    if not PROFILE_TOKEN or not isinstance(event, dict):
+        return False
+    return any(key.lower() == PROFILE_HEADER.lower() and value == PROFILE_TOKEN
+               for key, value in (event.get('headers') or {}).items())
+
+
+def profiled(name: str) -> Callable:
+    """Decorator sampling a `handler(event, context)` for profiling under `name`"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            sampled = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+            if not (sampled or requested(event)) or not _profiling.acquire(blocking=False):
+                return handler(event, context)
+            try:
+                return profile_call(name, handler, event, context)
+            finally:
+                _profiling.release()
+        return wrapper
+    return decorate
+
+
+def profile_call(name: str, handler: Callable, event: Any, context: Any) -> Any:
+    """Run the handler under cProfile and tracemalloc and write the artifact"""
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    started_at = datetime.utcnow()
+    started = time.monotonic()
+    profiler.enable()
+    try:
+        return handler(event, context)
+    finally:
+        profiler.disable()
+        duration = time.monotonic() - started
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if not tracing:
+            tracemalloc.stop()
+        try:
+            request_id = getattr(context, 'aws_request_id', None) or f"{os.getpid()}-{int(started * 1e6)}"
+            artifact = build_artifact(name, profiler, snapshot, duration, peak, started_at, request_id)
+            key = f"{name}/{started_at:%Y-%m-%d}/{started_at:%H%M%S%f}-{request_id}{ARTIFACT_SUFFIX}"
+            data = encode_artifact(artifact)
+            store().put(key, data)
+            print(f"Wrote profile {key} ({len(data)} bytes, {duration * 1000:.0f} ms)")
+        except Exception as e:
+            # Profiling must never fail the request
+            print(f"Error writing profile: {e}")
+
+
+def store():
+    global _store
+    if _store is None:
+        _store = open_blob_store(PROFILE_URI)
+    return _store
+
+
+def build_artifact(name: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot,
+                   duration: float, peak: int, started_at: datetime, request_id: str) -> Dict[str, Any]:
+    """Function stats (most cumulative time first) and the top sites of memory the call left allocated"""
+    functions = sorted(
+        ([filename, line, function, cc, nc, round(tt, 6), round(ct, 6)]
+         for (filename, line, function), (cc, nc, tt, ct, _) in pstats.Stats(profiler).stats.items()),
+        key=lambda row: row[6], reverse=True
+    )
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    allocations = [{'where': str(stat.traceback[0]), 'size_bytes': stat.size, 'count': stat.count}
+                   for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]]
+    return {
+        'handler': name,
+        'request_id': request_id,
+        'started_at': started_at.isoformat(),
+        'duration_ms': round(duration * 1000, 3),
+        'peak_traced_bytes': peak,
+        'functions': functions,
+        'allocations': allocations
+    }
+
+
+def encode_artifact(artifact: Dict[str, Any], max_bytes: Optional[int] = None) -> bytes:
+    """
+    Gzipped JSON of at most max_bytes: the cheapest functions are dropped
+    until it fits, and `functions_dropped` says how many
+    """
+    max_bytes = PROFILE_MAX_BYTES if max_bytes is None else max_bytes
+    functions = artifact['functions']
+    keep = len(functions)
+    while True:
+        trimmed = dict(artifact, functions=functions[:keep], functions_dropped=len(functions) - keep)
+        data = gzip.compress(json.dumps(trimmed, separators=(',', ':')).encode('utf-8'))
+        if len(data) <= max_bytes or keep == 0:
+            return data
+        keep //= 2
+
+
+def load_artifacts(uri: str, handler: Optional[str] = None) -> List[Dict[str, Any]]:
+    blobs = open_blob_store(uri)
+    keys = [k for k in blobs.list(f"{handler}/" if handler else '') if k.endswith(ARTIFACT_SUFFIX)]
+    return [json.loads(gzip.decompress(blobs.get(key))) for key in sorted(keys)]
+
+
+def merge(artifacts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum function stats and allocations over many artifacts"""
+    functions = defaultdict(lambda: [0, 0, 0.0, 0.0, 0])
+    allocations = defaultdict(lambda: [0, 0, 0])
+    for artifact in artifacts:
+        for filename, line, function, cc, nc, tt, ct in artifact['functions']:
+            totals = functions[(filename, line, function)]
+            totals[0] += cc
+            totals[1] += nc
+            totals[2] += tt
+            totals[3] += ct
+            totals[4] += 1
+        for allocation in artifact['allocations']:
+            totals = allocations[allocation['where']]
+            totals[0] += allocation['size_bytes']
+            totals[1] += allocation['count']
+            totals[2] += 1
+    durations = sorted(a['duration_ms'] for a in artifacts)
+    return {
+        'profiles': len(artifacts),
+        'handlers': dict(Counter(a['handler'] for a in artifacts)),
+        'duration_ms': {
+            'mean': round(sum(durations) / len(durations), 1) if durations else 0,
+            'p50': durations[len(durations) // 2] if durations else 0,
+            'max': durations[-1] if durations else 0
+        },
+        'mean_peak_traced_bytes': round(sum(a['peak_traced_bytes'] for a in artifacts) / len(artifacts))
+        if artifacts else 0,
+        'functions': functions,
+        'allocations': allocations
+    }
+
+
+def write_pstats(merged: Dict[str, Any], path: str) -> None:
+    """Merged stats as a .prof file for pstats or snakeviz (caller edges are not kept)"""
+    stats = {key: (cc, nc, tt, ct, {}) for key, (cc, nc, tt, ct, _) in merged['functions'].items()}
+    with open(path, 'wb') as f:
+        marshal.dump(stats, f)
+
+
+def format_summary(merged: Dict[str, Any], top: int = 25, sort: str = 'cumulative') -> str:
+    """Plain-text summary: per-request averages of the most expensive functions and allocation sites"""
+    profiles = merged['profiles'] or 1
+    index = {'cumulative': 3, 'tottime': 2, 'calls': 1}[sort]
+    duration = merged['duration_ms']
+    lines = [f"{merged['profiles']} profiles {merged['handlers']}; duration mean {duration['mean']} ms, "
+             f"p50 {duration['p50']} ms, max {duration['max']} ms; "
+             f"mean peak traced {merged['mean_peak_traced_bytes'] / 1024:.0f} KiB",
+             '',
+             f"{'cum ms/req':>11}{'own ms/req':>11}{'calls/req':>11}{'seen':>6}  function"]
+    ranked = sorted(merged['functions'].items(), key=lambda item: item[1][index], reverse=True)[:top]
+    for (filename, line, function), (cc, nc, tt, ct, seen) in ranked:
+        where = f"{os.path.basename(filename)}:{line}({function})" if line else function
+        lines.append(f"{ct * 1000 / profiles:>11.2f}{tt * 1000 / profiles:>11.2f}{nc / profiles:>11.1f}{seen:>6}  {where}")
+    lines += ['', f"{'KiB/req':>11}{'blocks/req':>11}{'seen':>6}  allocation site"]
+    ranked = sorted(merged['allocations'].items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for where, (size, count, seen) in ranked:
+        lines.append(f"{size / 1024 / profiles:>11.1f}{count / profiles:>11.1f}{seen:>6}  {where}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge and summarize sampled handler profiles')
+    sub = parser.add_subparsers(dest='command', required=True)
+    summarize = sub.add_parser('summarize', help='Per-request averages over the collected profiles')
+    summarize.add_argument('uri', nargs='?', default=PROFILE_URI, help='Local path or s3://bucket/prefix')
+    summarize.add_argument('--handler', help='Only this handler (reframe, memory_tool, schedule_tool)')
+    summarize.add_argument('--top', type=int, default=25)
+    summarize.add_argument('--sort', choices=('cumulative', 'tottime', 'calls'), default='cumulative')
+    summarize.add_argument('--output', help='Also write the merged stats as a .prof file')
+
+    args = parser.parse_args(argv)
+    merged = merge(load_artifacts(args.uri, args.handler))
+    if not merged['profiles']:
+        print(f"No profiles under {args.uri}")
+        return 1
+    print(format_summary(merged, top=args.top, sort=args.sort))
+    if args.output:
+        write_pstats(merged, args.output)
+        print(f"\nWrote {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    # Usage: python profiling.py summarize [URI] [--handler NAME] [--top N] [--sort cumulative|tottime|calls]
+    sys.exit(main())
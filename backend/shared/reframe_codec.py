@@ -0,0 +1,203 @@
+"""
+Reframe Codec
+Compact binary storage for the `reframes` payload of stored items.
+
+The nested map/list repeats the same keys (model, reframe, explanation,
+action_steps) and much of the same vocabulary in every item. Format v1 drops
+the keys (positional arrays) and compresses with zlib primed by a shared
+dictionary of that vocabulary, stored as a single Binary attribute
+`reframes_z` whose first byte is the format version. Items written in the
+old nested format are returned unchanged by unpack_item.
+"""
+
+import json
+import math
+import os
+import sys
+import zlib
+from decimal import Decimal
+from typing import Dict, Any, List
+
+COMPACT_ATTRIBUTE = 'reframes_z'
+FORMAT_VERSION = 1
+
+# Shared zlib dictionary: phrases that recur across model output, most frequent last
+SHARED_DICTIONARY = ' '.join([
+    'reduces anxiety by directing energy toward elements you can directly change',
+    'helps identify avoidable errors by thinking backward from worst outcomes',
+    'identifies concrete risks ahead of time so you can address them proactively',
+    'helps reduce emotional weight by expanding time perspective',
+    'Break down to fundamental truths and rebuild reasoning from scratch',
+    'Separate what you control from what you don\'t; focus on the controllables first',
+    'Imagine it went badly: what specifically happened? Prepare for those scenarios now',
+    'Zoom out: how important will this feel in 6 months? Focus on learning, not perfection',
+    'Instead of imagining failure, list the fastest ways to fail and stop doing those things',
+    'Write down one learning goal', 'Remind yourself of a past', 'that turned out fine',
+    'Schedule a 30-minute check-in to review', 'Block 2 hours to complete 1 high-impact task',
+    'List 3 things that could go wrong', 'List top 3 actions that would', 'for 10 minutes',
+    'for 15 minutes', 'for 20 minutes', 'for 30 minutes', 'Spend 10 minutes', 'Set a timer',
+    'realistic best, worst and likely scenarios', 'costs and benefits', 'root cause',
+    'Outcome Forecasting', 'Cost-Benefit', 'First Principles', '5 Whys', 'Inversion',
+    'Scaling', 'Premortem', 'Dichotomy of Control', 'This helps you', 'because it',
+    'what you can control', 'instead of', 'the worst case', 'one small step',
+    '"],["', '","', '"]]', '[["'
+]).encode('utf-8')
+
+_REFRAME_FIELDS = ('model', 'reframe', 'explanation', 'action_steps')
+
+
+def compact_storage_enabled() -> bool:
+    """Whether writers should store the compact format (readers always accept both)"""
+    return os.environ.get('COMPACT_STORAGE', 'false').lower() in ('1', 'true', 'yes')
+
+
+def encode_reframes(reframes: List[Dict[str, Any]]) -> bytes:
+    """
+    Pack a reframes list into the versioned compact format
+    Keys outside the standard four are kept in a trailing map so nothing is lost
+    """
+    rows = []
+    for reframe in reframes:
+        row = [reframe.get(field, '') for field in _REFRAME_FIELDS]
+        extra = {k: v for k, v in reframe.items() if k not in _REFRAME_FIELDS}
+        if extra:
+            row.append(extra)
+        rows.append(row)
+
+    raw = json.dumps(rows, separators=(',', ':'), ensure_ascii=False, default=_json_default).encode('utf-8')
+    compressor = zlib.compressobj(level=9, wbits=-15, zdict=SHARED_DICTIONARY)
+    return bytes([FORMAT_VERSION]) + compressor.compress(raw) + compressor.flush()
+
+
+def decode_reframes(blob) -> List[Dict[str, Any]]:
+    """Unpack a compact reframes payload (accepts bytes or boto3 Binary)"""
+    data = bytes(getattr(blob, 'value', blob))
+    if not data:
+        return []
+
+    version = data[0]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported reframes format version: {version}")
+
+    decompressor = zlib.decompressobj(wbits=-15, zdict=SHARED_DICTIONARY)
+    rows = json.loads(decompressor.decompress(data[1:]) + decompressor.flush())
+
+    reframes = []
+    for row in rows:
+        reframe = dict(zip(_REFRAME_FIELDS, row[:len(_REFRAME_FIELDS)]))
+        if len(row) > len(_REFRAME_FIELDS):
+            reframe.update(row[len(_REFRAME_FIELDS)])
+        reframes.append(reframe)
+    return reframes
+
+
+def pack_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the nested `reframes` attribute with its compact binary form"""
+    if 'reframes' not in item:
+        return item
+    packed = {k: v for k, v in item.items() if k != 'reframes'}
+    packed[COMPACT_ATTRIBUTE] = encode_reframes(item['reframes'] or [])
+    return packed
+
+
+def unpack_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the item with `reframes` decoded; old-format items pass through untouched"""
+    if COMPACT_ATTRIBUTE not in item:
+        return item
+    unpacked = {k: v for k, v in item.items() if k != COMPACT_ATTRIBUTE}
+    unpacked['reframes'] = decode_reframes(item[COMPACT_ATTRIBUTE])
+    return unpacked
+
+
+def unpack_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [unpack_item(item) for item in items]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+
+def estimate_item_size(value: Any) -> int:
+    """
+    DynamoDB item size in bytes (attribute names + values)
+    Follows the published sizing rules closely enough for capacity estimates
+    """
+    if isinstance(value, dict):
+        return sum(len(str(k).encode('utf-8')) + _value_size(v) for k, v in value.items())
+    return _value_size(value)
+
+
+def _value_size(value: Any) -> int:
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (int, float, Decimal)):
+        digits = len(str(value).lstrip('-').replace('.', '').lstrip('0')) or 1
+        return math.ceil(digits / 2) + 1
+    if isinstance(value, dict):
+        return 3 + sum(len(str(k).encode('utf-8')) + _value_size(v) + 1 for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 3 + sum(_value_size(v) + 1 for v in value)
+    if hasattr(value, 'value'):
+        return len(value.value)
+    return len(str(value).encode('utf-8'))
+
+
+def capacity_units(size: int) -> Dict[str, float]:
+    """Write and (strongly consistent) read capacity units for one item of `size` bytes"""
+    return {
+        'wcu': math.ceil(size / 1024) or 1,
+        'rcu': math.ceil(size / 4096) or 1
+    }
+
+
+def savings_report(fixtures: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Plain vs compact item size and capacity units for each reframe fixture"""
+    rows = []
+    for name, reframe_data in fixtures.items():
+        item = {
+            'reframe_id': 'user123_1705320000000',
+            'user_id': 'user123',
+            'source_input': reframe_data.get('input', ''),
+            'models_used': reframe_data.get('model_selection', []),
+            'reframes': reframe_data.get('reframes', []),
+            'summary': reframe_data.get('summary', ''),
+            'follow_up': reframe_data.get('follow_up', ''),
+            'tone': 'gentle',
+            'created_at': '2025-01-15T10:00:00.000000',
+            'ttl': 1713096000
+        }
+        plain = estimate_item_size(item)
+        compact = estimate_item_size(pack_item(item))
+        rows.append({
+            'fixture': name,
+            'plain_bytes': plain,
+            'compact_bytes': compact,
+            'saved_pct': round(100 * (plain - compact) / plain, 1),
+            'plain': capacity_units(plain),
+            'compact': capacity_units(compact)
+        })
+    return rows
+
+
+if __name__ == '__main__':
+    # Usage: python reframe_codec.py tests/mock_responses.json
+    if len(sys.argv) != 2:
+        print("Usage: python reframe_codec.py <fixtures.json>")
+        sys.exit(1)
+
+    with open(sys.argv[1]) as f:
+        report = savings_report(json.load(f))
+
+    print(f"{'fixture':<22}{'plain B':>9}{'compact B':>11}{'saved':>8}{'WCU':>7}{'RCU':>7}")
+    for row in report:
+        print(f"{row['fixture']:<22}{row['plain_bytes']:>9}{row['compact_bytes']:>11}{row['saved_pct']:>7}%"
+              f"{row['plain']['wcu']:>4}->{row['compact']['wcu']}{row['plain']['rcu']:>4}->{row['compact']['rcu']}")
+    total_plain = sum(r['plain_bytes'] for r in report)
+    total_compact = sum(r['compact_bytes'] for r in report)
+    print(f"{'total':<22}{total_plain:>9}{total_compact:>11}{round(100 * (total_plain - total_compact) / total_plain, 1):>7}%")
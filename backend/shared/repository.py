@@ -0,0 +1,616 @@
+"""
+Repository
+Data access for reframes, users and reminders behind one interface, with two backends:
+
+- DynamoRepository: the deployed tables (batch reads/writes, projections)
+- SqliteRepository: a single embedded database file in WAL mode, for
+  self-hosted/edge deployments and fast local test runs
+
+Both also hold the per-user LSH index of near-duplicate thoughts (see near_duplicate)
+and answer history_version(user_id), the (newest created_at, count) pair that
+history ETags are derived from.
+
+open_repository(url) selects the backend: '' or 'dynamodb' for DynamoDB,
+'sqlite:///path/to/reframer.db' (or 'sqlite://:memory:') for SQLite.
+"""
+
+import base64
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from reframe_codec import pack_item, unpack_item, unpack_items, compact_storage_enabled
+import near_duplicate
+import user_shards
+
+REFRAMES_TABLE = os.environ.get('REFRAMES_TABLE', 'CognitiveReframer-Reframes')
+USERS_TABLE = os.environ.get('USERS_TABLE', 'CognitiveReframer-Users')
+REMINDERS_TABLE = os.environ.get('REMINDERS_TABLE', 'CognitiveReframer-Reminders')
+NEAR_DUPLICATES_TABLE = os.environ.get('NEAR_DUPLICATES_TABLE', 'CognitiveReframer-NearDuplicates')
+
+REFRAME_TTL_SECONDS = 90 * 24 * 60 * 60
+
+# DynamoDB request limits
+BATCH_GET_MAX_KEYS = 100
+
+# Candidates read per near-duplicate lookup (most shared bands first)
+NEAR_DUPLICATE_MAX_CANDIDATES = 25
+
+# User item attributes advanced on every reframe write (history ETags)
+HISTORY_VERSION_FIELDS = ['history_newest', 'history_count']
+
+# Per-shard queries of hot users run in parallel (the table's client is thread-safe)
+_scatter_pool = ThreadPoolExecutor(max_workers=16)
+
+
+def new_reframe_item(user_id: str, user_input: str, reframe_data: Dict[str, Any],
+                     tone: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the stored item for a new reframe (compact-encoded when enabled)
+    """
+    now = datetime.utcnow()
+    item = {
+        'reframe_id': f"{user_id}_{int(now.timestamp() * 1000)}",
+        'user_id': user_id,
+        'source_input': user_input,
+        'models_used': reframe_data.get('model_selection', []),
+        'reframes': reframe_data.get('reframes', []),
+        'summary': reframe_data.get('summary', ''),
+        'follow_up': reframe_data.get('follow_up', ''),
+        'created_at': now.isoformat(),
+        'ttl': int(now.timestamp()) + REFRAME_TTL_SECONDS,
+        near_duplicate.SIGNATURE_ATTRIBUTE: near_duplicate.encode_signature(near_duplicate.signature(user_input))
+    }
+    if tone is not None:
+        item['tone'] = tone
+    if reframe_data.get('degraded'):
+        item['degraded'] = True
+    if reframe_data.get('usage'):
+        # Bedrock tokens and latency of the model call (see usage_stats)
+        item['usage'] = reframe_data['usage']
+
+    if compact_storage_enabled():
+        item = pack_item(item)
+    return item
+
+
+def reminder_bucket(scheduled_time: datetime) -> str:
+    """Hour bucket a reminder is due in; due reminders are read one bucket at a time"""
+    return scheduled_time.strftime('%Y-%m-%dT%H')
+
+
+def new_reminder_item(user_id: str, reframe_id: str, scheduled_time: datetime,
+                      method: str = 'notification') -> Dict[str, Any]:
+    """
+    Build the stored item for a follow-up reminder
+    """
+    now = datetime.utcnow()
+    return {
+        'reminder_id': f"{user_id}_{reframe_id}_{int(now.timestamp())}",
+        'user_id': user_id,
+        'reframe_id': reframe_id,
+        'scheduled_time': scheduled_time.isoformat(),
+        'bucket': reminder_bucket(scheduled_time),
+        'method': method,
+        'status': 'scheduled',
+        'created_at': now.isoformat()
+    }
+
+
+def history_changes(items: List[Dict[str, Any]]) -> Dict[str, Tuple[str, int]]:
+    """
+    Per history version key: newest created_at and number of items in a write
+    The key is the item's user_shard, so a hot user's version writes spread
+    over one Users item per shard like their index writes (shard 0 is the user item)
+    """
+    changes: Dict[str, Tuple[str, int]] = {}
+    for item in items:
+        key = item.get('user_shard') or item['user_id']
+        newest, count = changes.get(key, ('', 0))
+        changes[key] = (max(newest, item['created_at']), count + 1)
+    return changes
+
+
+def merge_history_versions(versions: Iterable[Dict[str, Any]]) -> Optional[Tuple[str, int]]:
+    """(newest created_at, count) over a user's per-shard version items; None when none is tracked"""
+    tracked = [v for v in versions if 'history_newest' in v]
+    if not tracked:
+        return None
+    return max(v['history_newest'] for v in tracked), sum(int(v.get('history_count', 0)) for v in tracked)
+
+
+def _rank_candidates(hits: Dict[str, int]) -> List[str]:
+    """Reframe ids by number of shared bands, capped at NEAR_DUPLICATE_MAX_CANDIDATES"""
+    ranked = sorted(hits, key=lambda reframe_id: (-hits[reframe_id], reframe_id))
+    return ranked[:NEAR_DUPLICATE_MAX_CANDIDATES]
+
+
+def _project(item: Optional[Dict[str, Any]], projection: Optional[Iterable[str]]) -> Optional[Dict[str, Any]]:
+    if item is None or not projection:
+        return item
+    return {k: v for k, v in item.items() if k in projection}
+
+
+class DynamoRepository:
+    """Repository over the DynamoDB tables"""
+
+    def __init__(self, dynamodb=None):
+        self.dynamodb = dynamodb or boto3.resource(
+            'dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
+        )
+
+    @staticmethod
+    def _projection_kwargs(projection: Optional[Iterable[str]]) -> Dict[str, Any]:
+        """ProjectionExpression with placeholder names (several attributes are reserved words)"""
+        if not projection:
+            return {}
+        names = {f"#p{i}": field for i, field in enumerate(projection)}
+        return {
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names
+        }
+
+    # Reframes
+
+    def put_reframe(self, item: Dict[str, Any]) -> None:
+        item = self._with_shard(item)
+        self.dynamodb.Table(REFRAMES_TABLE).put_item(Item=item)
+        self._advance_history([item])
+
+    def put_reframes(self, items: List[Dict[str, Any]]) -> None:
+        """Batched writes (25 items per request, unprocessed items retried by the writer)"""
+        items = [self._with_shard(item) for item in items]
+        with self.dynamodb.Table(REFRAMES_TABLE).batch_writer() as writer:
+            for item in items:
+                writer.put_item(Item=item)
+        self._advance_history(items)
+
+    def _with_shard(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """The item with its UserShardIndex key (see user_shards)"""
+        user_id = item['user_id']
+        key, promoted = user_shards.shard_map.shard_for_write(user_id, self.user_shard_count(user_id))
+        if promoted:
+            self.dynamodb.Table(USERS_TABLE).update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='SET user_shards = if_not_exists(user_shards, :n)',
+                ExpressionAttributeValues={':n': user_shards.shard_map.shards}
+            )
+        return dict(item, user_shard=key)
+
+    def user_shard_count(self, user_id: str) -> int:
+        def stored(uid):
+            return (self.get_user(uid, projection=['user_shards']) or {}).get('user_shards')
+        return user_shards.shard_map.count(user_id, stored)
+
+    def user_shard_keys(self, user_id: str) -> List[str]:
+        """UserShardIndex partition keys holding a user's reframes"""
+        return user_shards.shard_keys(user_id, self.user_shard_count(user_id))
+
+    def _advance_history(self, items: List[Dict[str, Any]]) -> None:
+        """
+        Move each user's history version on, after their reframes are stored
+        Written second so a reader never pairs a new version with old items
+        """
+        users = self.dynamodb.Table(USERS_TABLE)
+        for key, (newest, count) in history_changes(items).items():
+            users.update_item(
+                Key={'user_id': key},
+                UpdateExpression='SET history_newest = :newest ADD history_count :count',
+                ExpressionAttributeValues={':newest': newest, ':count': count}
+            )
+
+    def recent_reframes(self, user_id: str, limit: int = 20, before: Optional[str] = None,
+                        projection: Optional[List[str]] = None,
+                        since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        A user's reframes newest first, optionally older than `before`
+        With `since`, the oldest `limit` reframes newer than it (still returned newest first)
+        Hot users' shards are queried in parallel and merged
+        """
+        key_condition = 'user_shard = :shard'
+        values = {}
+        if since:
+            key_condition += ' AND created_at > :since'
+            values[':since'] = since
+        elif before:
+            key_condition += ' AND created_at < :before'
+            values[':before'] = before
+        fields = list(projection) + ['created_at'] if projection and 'created_at' not in projection else projection
+        table = self.dynamodb.Table(REFRAMES_TABLE)
+        kwargs = {
+            'IndexName': 'UserShardIndex',
+            'KeyConditionExpression': key_condition,
+            'ScanIndexForward': bool(since),
+            'Limit': limit,
+            **self._projection_kwargs(fields)
+        }
+
+        def query_shard(shard: str) -> List[Dict[str, Any]]:
+            response = table.query(ExpressionAttributeValues=dict(values, **{':shard': shard}), **kwargs)
+            return response.get('Items', [])
+
+        shards = self.user_shard_keys(user_id)
+        if len(shards) == 1:
+            items = query_shard(shards[0])
+        else:
+            # Each shard is sorted the way it was asked; merge and keep the first `limit`
+            per_shard = list(_scatter_pool.map(query_shard, shards))
+            merged = heapq.merge(*per_shard, key=lambda i: i['created_at'], reverse=not since)
+            items = [item for _, item in zip(range(limit), merged)]
+        items = unpack_items(items)
+        if fields is not projection:
+            items = [_project(item, projection) for item in items]
+        return items[::-1] if since else items
+
+    def history_version(self, user_id: str) -> Optional[Tuple[str, int]]:
+        """
+        (newest created_at, count) from the user item, merged with the
+        per-shard version items of a hot user; None before the first tracked write
+        """
+        shards = self.user_shard_keys(user_id)
+        if len(shards) == 1:
+            versions = [self.get_user(user_id, projection=HISTORY_VERSION_FIELDS) or {}]
+        else:
+            versions = self.get_users(shards, projection=HISTORY_VERSION_FIELDS)
+        return merge_history_versions(versions)
+
+    def get_reframes(self, reframe_ids: List[str],
+                     projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Point reads by reframe_id, 100 keys per BatchGetItem"""
+        keys = [{'reframe_id': reframe_id} for reframe_id in dict.fromkeys(reframe_ids)]
+        return unpack_items(self._batch_get(REFRAMES_TABLE, keys, projection))
+
+    # Users
+
+    def get_user(self, user_id: str, projection: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        response = self.dynamodb.Table(USERS_TABLE).get_item(
+            Key={'user_id': user_id},
+            **self._projection_kwargs(projection)
+        )
+        return response.get('Item')
+
+    def get_users(self, user_ids: List[str], projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        keys = [{'user_id': user_id} for user_id in dict.fromkeys(user_ids)]
+        return self._batch_get(USERS_TABLE, keys, projection)
+
+    def put_user(self, item: Dict[str, Any]) -> None:
+        self.dynamodb.Table(USERS_TABLE).put_item(Item=item)
+
+    # Reminders
+
+    def put_reminder(self, item: Dict[str, Any]) -> None:
+        self.dynamodb.Table(REMINDERS_TABLE).put_item(Item=item)
+
+    def put_reminders(self, items: List[Dict[str, Any]]) -> None:
+        with self.dynamodb.Table(REMINDERS_TABLE).batch_writer() as writer:
+            for item in items:
+                writer.put_item(Item=item)
+
+    def due_reminders(self, bucket: str, until: Optional[str] = None,
+                      projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Reminders in an hour bucket scheduled at or before `until`, earliest first"""
+        key_condition = 'bucket = :bucket'
+        values = {':bucket': bucket}
+        if until:
+            key_condition += ' AND scheduled_time <= :until'
+            values[':until'] = until
+        kwargs = {
+            'IndexName': 'BucketIndex',
+            'KeyConditionExpression': key_condition,
+            'ExpressionAttributeValues': values,
+            **self._projection_kwargs(projection)
+        }
+
+        items = []
+        table = self.dynamodb.Table(REMINDERS_TABLE)
+        while True:
+            response = table.query(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def user_reminders(self, user_id: str) -> List[Dict[str, Any]]:
+        response = self.dynamodb.Table(REMINDERS_TABLE).query(
+            IndexName='UserIdIndex',
+            KeyConditionExpression='user_id = :uid',
+            ExpressionAttributeValues={':uid': user_id}
+        )
+        return response.get('Items', [])
+
+    # Near-duplicate index: one item per (user, band hash) listing the reframes in that bucket
+
+    def add_near_duplicate_entries(self, entries: List[tuple]) -> None:
+        """Add (user_id, band_key, reframe_id) entries; buckets expire with the newest reframe in them"""
+        buckets: Dict[str, set] = {}
+        for user_id, band_key, reframe_id in entries:
+            buckets.setdefault(f"{user_id}#{band_key}", set()).add(reframe_id)
+        expires = int(time.time()) + REFRAME_TTL_SECONDS
+        table = self.dynamodb.Table(NEAR_DUPLICATES_TABLE)
+        for lsh_key, reframe_ids in buckets.items():
+            table.update_item(
+                Key={'lsh_key': lsh_key},
+                UpdateExpression='ADD reframe_ids :ids SET #ttl = :ttl',
+                ExpressionAttributeNames={'#ttl': 'ttl'},
+                ExpressionAttributeValues={':ids': reframe_ids, ':ttl': expires}
+            )
+
+    def near_duplicate_candidates(self, user_id: str, band_keys: List[str]) -> List[str]:
+        """Reframe ids sharing at least one band with the signature (one BatchGetItem)"""
+        keys = [{'lsh_key': f"{user_id}#{band_key}"} for band_key in dict.fromkeys(band_keys)]
+        hits: Dict[str, int] = {}
+        for bucket in self._batch_get(NEAR_DUPLICATES_TABLE, keys, projection=['reframe_ids']):
+            for reframe_id in bucket.get('reframe_ids', ()):
+                hits[reframe_id] = hits.get(reframe_id, 0) + 1
+        return _rank_candidates(hits)
+
+    def _batch_get(self, table_name: str, keys: List[Dict[str, Any]],
+                   projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        items = []
+        for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+            request = {table_name: {'Keys': keys[start:start + BATCH_GET_MAX_KEYS],
+                                    **self._projection_kwargs(projection)}}
+            attempt = 0
+            while request:
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                items.extend(response.get('Responses', {}).get(table_name, []))
+                request = response.get('UnprocessedKeys') or {}
+                if request:
+                    # Throttled keys come back unprocessed; back off before retrying them
+                    attempt += 1
+                    time.sleep(min(0.05 * (2 ** attempt), 1.0))
+        return items
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    return str(value)
+
+
+class SqliteRepository:
+    """
+    Repository over one SQLite file
+    Items are stored as JSON documents next to the columns they are queried by.
+    Reframes are kept decoded (no compact encoding): capacity units do not apply.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS reframes (
+            reframe_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            item TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS reframes_user_created ON reframes (user_id, created_at)",
+        """CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            item TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS reminders (
+            reminder_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            scheduled_time TEXT NOT NULL,
+            item TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS reminders_bucket_time ON reminders (bucket, scheduled_time)",
+        "CREATE INDEX IF NOT EXISTS reminders_user ON reminders (user_id)",
+        """CREATE TABLE IF NOT EXISTS near_duplicates (
+            user_id TEXT NOT NULL,
+            band_key TEXT NOT NULL,
+            reframe_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, band_key, reframe_id)
+        ) WITHOUT ROWID"""
+    ]
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One write connection shared by the process; the lock serialises writes across threads.
+        # Each thread reads on its own connection, so with WAL reads never wait on the lock
+        # (an in-memory database exists only on its one connection, so reads share it there)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('PRAGMA busy_timeout=5000')
+            for statement in self.SCHEMA:
+                self.conn.execute(statement)
+
+    @staticmethod
+    def _dumps(item: Dict[str, Any]) -> str:
+        return json.dumps(item, default=_json_default, ensure_ascii=False, separators=(',', ':'))
+
+    def _write_many(self, sql: str, rows: List[tuple], *more: tuple) -> None:
+        """executemany in one transaction; `more` adds further (sql, rows) pairs to it"""
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                for statement, statement_rows in ((sql, rows),) + more:
+                    self.conn.executemany(statement, statement_rows)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def _reader(self) -> Optional[sqlite3.Connection]:
+        """This thread's read connection; None for an in-memory database"""
+        if self.path == ':memory:':
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Used by this thread only; shared just so close() can reach it
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.execute('PRAGMA query_only=ON')
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _fetch(self, sql: str, params: tuple) -> List[tuple]:
+        reader = self._reader()
+        if reader is not None:
+            return reader.execute(sql, params).fetchall()
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _read(self, sql: str, params: tuple, projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        rows = self._fetch(sql, params)
+        return [_project(json.loads(row[0]), projection) for row in rows]
+
+    # Reframes
+
+    def put_reframe(self, item: Dict[str, Any]) -> None:
+        self.put_reframes([item])
+
+    def put_reframes(self, items: List[Dict[str, Any]]) -> None:
+        rows = []
+        for item in items:
+            item = unpack_item(item)
+            rows.append((item['reframe_id'], item['user_id'], item['created_at'], self._dumps(item)))
+        # No stream here: the near-duplicate index is written with the reframes
+        self._write_many('INSERT OR REPLACE INTO reframes VALUES (?, ?, ?, ?)', rows,
+                         ('INSERT OR IGNORE INTO near_duplicates VALUES (?, ?, ?)',
+                          near_duplicate.index_entries(items)))
+
+    def recent_reframes(self, user_id: str, limit: int = 20, before: Optional[str] = None,
+                        projection: Optional[List[str]] = None,
+                        since: Optional[str] = None) -> List[Dict[str, Any]]:
+        if since:
+            sql = ('SELECT item FROM reframes WHERE user_id = ? AND created_at > ? '
+                   'ORDER BY created_at LIMIT ?')
+            return self._read(sql, (user_id, since, limit), projection)[::-1]
+        if before:
+            sql = ('SELECT item FROM reframes WHERE user_id = ? AND created_at < ? '
+                   'ORDER BY created_at DESC LIMIT ?')
+            params = (user_id, before, limit)
+        else:
+            sql = 'SELECT item FROM reframes WHERE user_id = ? ORDER BY created_at DESC LIMIT ?'
+            params = (user_id, limit)
+        return self._read(sql, params, projection)
+
+    def history_version(self, user_id: str) -> Optional[Tuple[str, int]]:
+        """Read straight off the (user_id, created_at) index"""
+        [(newest, count)] = self._fetch(
+            'SELECT MAX(created_at), COUNT(*) FROM reframes WHERE user_id = ?', (user_id,)
+        )
+        return (newest, count) if count else None
+
+    def get_reframes(self, reframe_ids: List[str],
+                     projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        reframe_ids = list(dict.fromkeys(reframe_ids))
+        if not reframe_ids:
+            return []
+        placeholders = ', '.join('?' * len(reframe_ids))
+        return self._read(f'SELECT item FROM reframes WHERE reframe_id IN ({placeholders})',
+                          tuple(reframe_ids), projection)
+
+    # Users
+
+    def get_user(self, user_id: str, projection: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        items = self._read('SELECT item FROM users WHERE user_id = ?', (user_id,), projection)
+        return items[0] if items else None
+
+    def get_users(self, user_ids: List[str], projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return []
+        placeholders = ', '.join('?' * len(user_ids))
+        return self._read(f'SELECT item FROM users WHERE user_id IN ({placeholders})',
+                          tuple(user_ids), projection)
+
+    def put_user(self, item: Dict[str, Any]) -> None:
+        self._write_many('INSERT OR REPLACE INTO users VALUES (?, ?)', [(item['user_id'], self._dumps(item))])
+
+    # Reminders
+
+    def put_reminder(self, item: Dict[str, Any]) -> None:
+        self.put_reminders([item])
+
+    def put_reminders(self, items: List[Dict[str, Any]]) -> None:
+        rows = [
+            (item['reminder_id'], item['user_id'], item['bucket'], item['scheduled_time'], self._dumps(item))
+            for item in items
+        ]
+        self._write_many('INSERT OR REPLACE INTO reminders VALUES (?, ?, ?, ?, ?)', rows)
+
+    def due_reminders(self, bucket: str, until: Optional[str] = None,
+                      projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if until:
+            sql = ('SELECT item FROM reminders WHERE bucket = ? AND scheduled_time <= ? '
+                   'ORDER BY scheduled_time')
+            params = (bucket, until)
+        else:
+            sql = 'SELECT item FROM reminders WHERE bucket = ? ORDER BY scheduled_time'
+            params = (bucket,)
+        return self._read(sql, params, projection)
+
+    def user_reminders(self, user_id: str) -> List[Dict[str, Any]]:
+        return self._read('SELECT item FROM reminders WHERE user_id = ?', (user_id,))
+
+    # Near-duplicate index
+
+    def add_near_duplicate_entries(self, entries: List[tuple]) -> None:
+        self._write_many('INSERT OR IGNORE INTO near_duplicates VALUES (?, ?, ?)', list(entries))
+
+    def near_duplicate_candidates(self, user_id: str, band_keys: List[str]) -> List[str]:
+        band_keys = list(dict.fromkeys(band_keys))
+        if not band_keys:
+            return []
+        placeholders = ', '.join('?' * len(band_keys))
+        rows = self._fetch(
+            f'SELECT reframe_id, COUNT(*) FROM near_duplicates '
+            f'WHERE user_id = ? AND band_key IN ({placeholders}) GROUP BY reframe_id',
+            (user_id, *band_keys)
+        )
+        return _rank_candidates(dict(rows))
+
+    def close(self) -> None:
+        with self._readers_lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers = []
+        with self.lock:
+            self.conn.close()
+        self._local = threading.local()
+
+
+# One SQLite repository (and connection) per database path per process
+_sqlite_repositories: Dict[str, SqliteRepository] = {}
+_sqlite_lock = threading.Lock()
+
+
+def open_repository(url: str = '', dynamodb=None):
+    """
+    Open a repository from a URL:
+    '' or 'dynamodb' (optionally with the boto3 resource to use),
+    'sqlite:///abs/path.db', 'sqlite://relative.db' or 'sqlite://:memory:'
+    """
+    if not url or url == 'dynamodb':
+        return DynamoRepository(dynamodb)
+    if url.startswith('sqlite://'):
+        path = url[len('sqlite://'):] or ':memory:'
+        with _sqlite_lock:
+            if path not in _sqlite_repositories:
+                _sqlite_repositories[path] = SqliteRepository(path)
+            return _sqlite_repositories[path]
+    raise ValueError(f"Unsupported storage URL: {url}")
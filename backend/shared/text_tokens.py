@@ -0,0 +1,30 @@
+"""
+Text Tokens
+The one tokenizer and light suffix-stripping stemmer used by the local text
+features (degraded-mode classifier, near-duplicate signatures)
+"""
+
+import re
+from typing import List
+
+SUFFIXES = ('ations', 'ation', 'ings', 'ing', 'ied', 'ies', 'ed', 'es', 'ly', 's')
+
+_TOKEN = re.compile(r"[a-z']+")
+
+
+def stem(token: str) -> str:
+    """Strip the first matching suffix, keeping a stem of at least 3 letters"""
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def words(text: str) -> List[str]:
+    """Lower-cased words; contractions stay whole ("i'm"), surrounding quotes are dropped"""
+    return [t.strip("'") for t in _TOKEN.findall(text.lower()) if t.strip("'")]
+
+
+def tokenize(text: str) -> List[str]:
+    """Stemmed words"""
+    return [stem(word) for word in words(text)]
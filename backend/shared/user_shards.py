@@ -0,0 +1,164 @@
+"""
+User Shards
+Write sharding for hot user_ids on the reframes' per-user index.
+
+Every reframe carries `user_shard`, the partition key of UserShardIndex. For
+ordinary users it is the plain user_id. A hot user's writes pick one of
+HOT_USER_SHARDS keys at random ('<user_id>#<n>', shard 0 being the plain
+user_id), so their index writes spread over several partitions instead of
+throttling one. Readers query every shard of a hot user and merge newest first.
+
+Hot users come from HOT_USER_IDS (the anonymous `demo_user` by default) or,
+when HOT_USER_WRITES_PER_SECOND is set, from an in-process detector that
+promotes a user whose writes exceed that rate. A promotion is recorded on the
+user item (`user_shards`) so every container reads all shards from then on;
+other warm containers pick it up within SHARD_COUNT_CACHE_SECONDS. Users are
+never demoted: never shrink HOT_USER_SHARDS or drop a user from HOT_USER_IDS
+while their sharded reframes are still within the TTL.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+import boto3
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+HOT_USER_IDS = {u.strip() for u in os.environ.get('HOT_USER_IDS', 'demo_user').split(',') if u.strip()}
+HOT_USER_SHARDS = int(os.environ.get('HOT_USER_SHARDS', '8'))
+# Adaptive promotion; 0 disables it (and the user-item read it costs on the first write per user)
+HOT_USER_WRITES_PER_SECOND = float(os.environ.get('HOT_USER_WRITES_PER_SECOND', '0'))
+
+SHARD_COUNT_CACHE_SECONDS = 60
+DETECTOR_WINDOW_SECONDS = 10.0
+
+
+def shard_key(user_id: str, shard: int) -> str:
+    """UserShardIndex partition key of one shard; shard 0 is the plain user_id"""
+    return user_id if shard == 0 else f"{user_id}#{shard}"
+
+
+def shard_keys(user_id: str, shards: int) -> List[str]:
+    return [shard_key(user_id, shard) for shard in range(max(1, shards))]
+
+
+class WriteRateDetector:
+    """Per-user write rate over a sliding window, kept in the warm container"""
+
+    def __init__(self, writes_per_second: float, window: float = DETECTOR_WINDOW_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.limit = writes_per_second * window
+        self.window = window
+        self.clock = clock
+        self._writes: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, user_id: str) -> bool:
+        """Count one write; True once the user's rate is over the threshold"""
+        now = self.clock()
+        with self._lock:
+            writes = self._writes.setdefault(user_id, deque())
+            writes.append(now)
+            while writes and writes[0] <= now - self.window:
+                writes.popleft()
+            return len(writes) > self.limit
+
+
+class ShardMap:
+    """
+    Number of shards per user: the static hot list first, then promotions
+    recorded on the user item (looked up through the caller's repository)
+    """
+
+    def __init__(self, hot_user_ids=None, shards: Optional[int] = None,
+                 writes_per_second: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.hot_user_ids = HOT_USER_IDS if hot_user_ids is None else set(hot_user_ids)
+        self.shards = HOT_USER_SHARDS if shards is None else shards
+        rate = HOT_USER_WRITES_PER_SECOND if writes_per_second is None else writes_per_second
+        self.detector = WriteRateDetector(rate, clock=clock) if rate > 0 else None
+        self.clock = clock
+        self._counts: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def known_count(self, user_id: str) -> Optional[int]:
+        """Shards to read when known without a lookup (static list, disabled detector or fresh cache)"""
+        if user_id in self.hot_user_ids:
+            return self.shards
+        if self.detector is None:
+            return 1
+        with self._lock:
+            cached = self._counts.get(user_id)
+        # Promotions are permanent, so only unsharded entries go stale
+        if cached and (cached[0] > 1 or self.clock() - cached[1] < SHARD_COUNT_CACHE_SECONDS):
+            return cached[0]
+        return None
+
+    def remember(self, user_id: str, count: Optional[int]) -> int:
+        count = int(count or 1)
+        with self._lock:
+            self._counts[user_id] = (count, self.clock())
+        return count
+
+    def count(self, user_id: str, lookup: Callable[[str], Optional[int]]) -> int:
+        """
+        Shards to read for a user
+        lookup(user_id) returns the count stored on the user item (None when unsharded)
+        """
+        known = self.known_count(user_id)
+        return known if known is not None else self.remember(user_id, lookup(user_id))
+
+    def shard_for_write(self, user_id: str, count: int) -> Tuple[str, bool]:
+        """
+        Partition key for a new reframe of a user with `count` shards
+        Returns (key, promoted); on promotion the caller must record
+        `user_shards` on the user item before writing the reframe
+        """
+        promoted = count == 1 and self.detector is not None and self.detector.record(user_id)
+        if promoted:
+            count = self.remember(user_id, self.shards)
+            print(f"Promoted hot user {user_id} to {count} index shards")
+        return shard_key(user_id, random.randrange(count)), promoted
+
+
+def backfill(dynamodb=None, table_name: Optional[str] = None) -> int:
+    """
+    Give reframes written before sharding their `user_shard` (shard 0, the plain
+    user_id), so UserShardIndex sees them. Re-running is safe.
+    Returns the number of items updated
+    """
+    dynamodb = dynamodb or boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    table = dynamodb.Table(table_name or os.environ.get('REFRAMES_TABLE', 'CognitiveReframer-Reframes'))
+    scan_kwargs = {
+        'ProjectionExpression': 'reframe_id, user_id',
+        'FilterExpression': 'attribute_not_exists(user_shard)'
+    }
+    updated = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            table.update_item(
+                Key={'reframe_id': item['reframe_id']},
+                UpdateExpression='SET user_shard = if_not_exists(user_shard, :uid)',
+                ExpressionAttributeValues={':uid': item['user_id']}
+            )
+            updated += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    print(f"Backfilled user_shard on {updated} reframes")
+    return updated
+
+
+# One map per process, so detector state and cached counts survive warm invocations
+shard_map = ShardMap()
+
+
+if __name__ == '__main__':
+    # Usage: python user_shards.py backfill
+    if len(sys.argv) == 2 and sys.argv[1] == 'backfill':
+        backfill()
+    else:
+        print("Usage: python user_shards.py backfill")
+        sys.exit(1)
@@ -0,0 +1,358 @@
+"""
+Check-in Batch
+Personalized follow-up check-in messages for reminders, generated offline with
+Bedrock batch inference (batch-rate tokens) instead of one model call per reminder.
+
+prepare: collect scheduled reminders due within CHECKIN_HORIZON_HOURS that have
+         no check-in yet, write one JSONL job in the batch-inference input format
+         ({recordId, modelInput}) and submit it through a runner
+ingest:  once a job completes, read its output and write `checkin_message` onto
+         the reminder items with batched writes
+
+Runs daily (prepare) and hourly (ingest); a job can take up to a day, so the
+horizon leaves a day's lead before reminders are dispatched. Jobs, their
+manifests and outputs live under CHECKIN_BATCH_URI (s3:// or a local path).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import boto3
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable
+
+from blob_store import open_blob_store
+from repository import open_repository, reminder_bucket
+
+dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+
+STORAGE_URL = os.environ.get('STORAGE_URL', '')  # Empty uses DynamoDB; sqlite:///path for single-box deployments
+CHECKIN_BATCH_URI = os.environ.get('CHECKIN_BATCH_URI', '')
+CHECKIN_MODEL_ID = os.environ.get('CHECKIN_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+CHECKIN_RUNNER = os.environ.get('CHECKIN_RUNNER', 'bedrock')  # 'bedrock' or 'local'
+CHECKIN_BATCH_ROLE_ARN = os.environ.get('CHECKIN_BATCH_ROLE_ARN', '')
+CHECKIN_HORIZON_HOURS = int(os.environ.get('CHECKIN_HORIZON_HOURS', '48'))
+# Bedrock rejects smaller jobs; below it reminders wait for the next run
+CHECKIN_MIN_RECORDS = int(os.environ.get('CHECKIN_MIN_RECORDS', '100'))
+CHECKIN_MAX_RECORDS = 50000
+
+JOBS_PREFIX = 'jobs'
+MAX_TOKENS = 300
+
+
+def repository():
+    return open_repository(STORAGE_URL, dynamodb=dynamodb)
+
+
+def lambda_handler(event, context):
+    """
+    Scheduled handler
+    Supports: prepare (collect and submit), ingest (write finished jobs back)
+    """
+    print(f"Check-in batch invoked: {json.dumps(event)}")
+
+    try:
+        action = event.get('action', 'prepare')
+        destination = event.get('destination') or CHECKIN_BATCH_URI
+        if not destination:
+            raise ValueError("CHECKIN_BATCH_URI is not configured")
+        store = open_blob_store(destination)
+        runner = open_runner(CHECKIN_RUNNER)
+
+        if action == 'prepare':
+            result = prepare(store, runner)
+        elif action == 'ingest':
+            result = ingest(store, runner)
+        else:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': f'Unknown action: {action}'})
+            }
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'success': True,
+                'result': result
+            })
+        }
+
+    except Exception as e:
+        print(f"Error in check-in batch: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+# Runners
+
+class BedrockBatchRunner:
+    """Bedrock model-invocation jobs; the store must be S3 (Bedrock reads and writes it directly)"""
+
+    min_records = CHECKIN_MIN_RECORDS
+
+    def __init__(self, client=None, role_arn: Optional[str] = None):
+        self.client = client or boto3.client('bedrock', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+        self.role_arn = role_arn or CHECKIN_BATCH_ROLE_ARN
+
+    @staticmethod
+    def _s3_uri(store, key: str) -> str:
+        if not hasattr(store, 'bucket'):
+            raise ValueError("Bedrock batch jobs need an s3:// CHECKIN_BATCH_URI")
+        return f"s3://{store.bucket}/{store.prefix + '/' if store.prefix else ''}{key}"
+
+    def submit(self, store, job_name: str, input_key: str, output_prefix: str, model_id: str) -> str:
+        response = self.client.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=model_id,
+            inputDataConfig={'s3InputDataConfig': {'s3Uri': self._s3_uri(store, input_key)}},
+            outputDataConfig={'s3OutputDataConfig': {'s3Uri': self._s3_uri(store, output_prefix + '/')}}
+        )
+        return response['jobArn']
+
+    def status(self, job_id: str) -> str:
+        """Submitted, InProgress, Completed, PartiallyCompleted, Failed, Stopped, Expired, ..."""
+        return self.client.get_model_invocation_job(jobIdentifier=job_id)['status']
+
+
+class LocalBatchRunner:
+    """
+    Runs a job in-process against `respond(model_input) -> model_output`, writing
+    output the way Bedrock does (<output_prefix>/<job_id>/<input file>.out)
+    For tests and local development; the default reply is a canned check-in
+    """
+
+    min_records = 1
+
+    def __init__(self, respond: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        self.respond = respond or canned_checkin
+        self.jobs: Dict[str, str] = {}
+
+    def submit(self, store, job_name: str, input_key: str, output_prefix: str, model_id: str) -> str:
+        job_id = f"local-{job_name}"
+        lines = []
+        for line in store.get(input_key).decode('utf-8').splitlines():
+            record = json.loads(line)
+            try:
+                record['modelOutput'] = self.respond(record['modelInput'])
+            except Exception as e:
+                record['error'] = {'errorCode': 400, 'errorMessage': str(e)}
+            lines.append(json.dumps(record))
+        output_key = f"{output_prefix}/{job_id}/{input_key.rsplit('/', 1)[-1]}.out"
+        store.put(output_key, ('\n'.join(lines) + '\n').encode('utf-8'))
+        self.jobs[job_id] = 'Completed'
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        return self.jobs.get(job_id, 'Completed')
+
+
+def canned_checkin(model_input: Dict[str, Any]) -> Dict[str, Any]:
+    """Messages-API shaped reply naming the first action step in the prompt"""
+    prompt = model_input['messages'][0]['content'][0]['text']
+    steps = [line[2:] for line in prompt.splitlines() if line.startswith('- ')]
+    text = f"Checking in: how did \"{steps[0]}\" go?" if steps else "Checking in: how are you doing?"
+    return {
+        'content': [{'type': 'text', 'text': text}],
+        'usage': {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4}
+    }
+
+
+def open_runner(name: str):
+    if name == 'local':
+        return LocalBatchRunner()
+    if name == 'bedrock':
+        return BedrockBatchRunner()
+    raise ValueError(f"Unknown check-in runner: {name}")
+
+
+# Prepare
+
+def due_unprepared(repo, now: datetime, horizon_hours: int = CHECKIN_HORIZON_HOURS) -> List[Dict[str, Any]]:
+    """Scheduled reminders due from now to the horizon without a check-in, one bucket query per hour"""
+    until = now + timedelta(hours=horizon_hours)
+    reminders = []
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    while hour <= until:
+        for reminder in repo.due_reminders(reminder_bucket(hour), until=until.isoformat()):
+            if reminder.get('status') == 'scheduled' and 'checkin_status' not in reminder \
+                    and reminder['scheduled_time'] >= now.isoformat():
+                reminders.append(reminder)
+        hour += timedelta(hours=1)
+    return reminders
+
+
+def checkin_prompt(reframe: Dict[str, Any]) -> str:
+    """Prompt for one check-in, built from the original reframe's summary and action steps"""
+    steps = [step for r in reframe.get('reframes', []) for step in r.get('action_steps', [])]
+    lines = [
+        "You are a supportive coach following up on a cognitive reframing session.",
+        f"A few days ago the user wrote: \"{reframe.get('source_input', '')}\"",
+        f"The takeaway was: {reframe.get('summary', '')}",
+        "They planned these action steps:"
+    ]
+    lines += [f"- {step}" for step in steps[:5]]
+    lines.append("Write a warm check-in of 2-3 sentences that asks how one of the steps went. "
+                 "Plain text only, no greeting line, no advice lists.")
+    return '\n'.join(lines)
+
+
+def batch_record(record_id: str, reframe: Dict[str, Any]) -> Dict[str, Any]:
+    """One input line: Messages API body for the check-in model"""
+    return {
+        'recordId': record_id,
+        'modelInput': {
+            'anthropic_version': 'bedrock-2023-05-31',
+            'max_tokens': MAX_TOKENS,
+            'temperature': 0.5,
+            'messages': [{'role': 'user', 'content': [{'type': 'text', 'text': checkin_prompt(reframe)}]}]
+        }
+    }
+
+
+def prepare(store, runner, now: Optional[datetime] = None, model_id: Optional[str] = None,
+            repo=None) -> Dict[str, Any]:
+    """
+    Collect due reminders, write the job input and manifest, submit, and mark
+    the reminders pending so later runs skip them
+    """
+    repo = repo or repository()
+    now = now or datetime.utcnow()
+    model_id = model_id or CHECKIN_MODEL_ID
+
+    reminders = due_unprepared(repo, now)[:CHECKIN_MAX_RECORDS]
+    reframes = {r['reframe_id']: r for r in repo.get_reframes([rem['reframe_id'] for rem in reminders])}
+    # Reframes past their TTL (or never stored) have no steps to check in on
+    reminders = [rem for rem in reminders if rem['reframe_id'] in reframes]
+    if len(reminders) < max(1, runner.min_records):
+        print(f"{len(reminders)} reminders due; waiting for at least {runner.min_records}")
+        return {'submitted': False, 'records': len(reminders)}
+
+    job_name = f"checkins-{now.strftime('%Y%m%d-%H%M%S')}"
+    prefix = f"{JOBS_PREFIX}/{job_name}"
+    # Record ids are positional; the manifest maps them back to reminders
+    record_ids = [f"CHK{i:08d}" for i in range(len(reminders))]
+    lines = [json.dumps(batch_record(record_id, reframes[rem['reframe_id']]))
+             for record_id, rem in zip(record_ids, reminders)]
+    store.put(f"{prefix}/input/records.jsonl", ('\n'.join(lines) + '\n').encode('utf-8'))
+
+    job_id = runner.submit(store, job_name, f"{prefix}/input/records.jsonl", f"{prefix}/output", model_id)
+    manifest = {
+        'job_name': job_name,
+        'job_id': job_id,
+        'model_id': model_id,
+        'submitted_at': now.isoformat(),
+        'ingested': False,
+        'reminders': dict(zip(record_ids, reminders))
+    }
+    store.put(f"{prefix}/manifest.json", json.dumps(manifest, default=str).encode('utf-8'))
+
+    repo.put_reminders([dict(rem, checkin_status='pending', checkin_job=job_id) for rem in reminders])
+    print(f"Submitted check-in job {job_id} with {len(reminders)} records")
+    return {'submitted': True, 'job_id': job_id, 'records': len(reminders)}
+
+
+# Ingest
+
+def output_text(model_output: Dict[str, Any]) -> str:
+    """Check-in text from a Messages API response"""
+    return ''.join(block.get('text', '') for block in model_output.get('content', [])).strip()
+
+
+def read_outputs(store, output_prefix: str) -> Dict[str, Dict[str, Any]]:
+    """Output records by recordId, across the job's .out files"""
+    records = {}
+    for key in store.list(output_prefix + '/'):
+        if not key.endswith('.jsonl.out'):
+            continue
+        for line in store.get(key).decode('utf-8').splitlines():
+            if line.strip():
+                record = json.loads(line)
+                records[record.get('recordId')] = record
+    return records
+
+
+def ingest_job(store, manifest: Dict[str, Any], repo) -> Dict[str, int]:
+    """
+    Write a completed job's check-ins onto its reminders in one batched write
+    Reminders are rewritten from the manifest snapshot; nothing else updates a
+    scheduled reminder between prepare and dispatch
+    """
+    outputs = read_outputs(store, f"{JOBS_PREFIX}/{manifest['job_name']}/output")
+    updated = []
+    failed = 0
+    for record_id, reminder in manifest['reminders'].items():
+        record = outputs.get(record_id, {})
+        text = output_text(record.get('modelOutput') or {})
+        if text:
+            usage = record['modelOutput'].get('usage', {})
+            updated.append(dict(reminder, checkin_status='ready', checkin_message=text,
+                                checkin_job=manifest['job_id'], checkin_model=manifest['model_id'],
+                                checkin_usage={'input_tokens': int(usage.get('input_tokens', 0)),
+                                               'output_tokens': int(usage.get('output_tokens', 0))}))
+        else:
+            failed += 1
+            error = (record.get('error') or {}).get('errorMessage', 'no output')
+            updated.append(dict(reminder, checkin_status='failed', checkin_job=manifest['job_id'],
+                                checkin_error=str(error)[:500]))
+    repo.put_reminders(updated)
+    return {'ready': len(updated) - failed, 'failed': failed}
+
+
+def ingest(store, runner, repo=None) -> Dict[str, Any]:
+    """Ingest every finished, not yet ingested job"""
+    repo = repo or repository()
+    result = {'jobs': 0, 'ready': 0, 'failed': 0, 'pending_jobs': 0}
+    for key in store.list(f"{JOBS_PREFIX}/"):
+        if not key.endswith('/manifest.json'):
+            continue
+        manifest = json.loads(store.get(key))
+        if manifest.get('ingested'):
+            continue
+        status = runner.status(manifest['job_id'])
+        if status in ('Submitted', 'Validating', 'Scheduled', 'InProgress', 'Stopping'):
+            result['pending_jobs'] += 1
+            continue
+        # Failed, stopped or expired jobs still ingest: their reminders are marked failed
+        counts = ingest_job(store, manifest, repo)
+        manifest.update(ingested=True, status=status, ingested_at=datetime.utcnow().isoformat(), **counts)
+        store.put(key, json.dumps(manifest, default=str).encode('utf-8'))
+        result['jobs'] += 1
+        result['ready'] += counts['ready']
+        result['failed'] += counts['failed']
+        print(f"Ingested check-in job {manifest['job_id']} ({status}): {counts}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch-generate follow-up check-in messages')
+    parser.add_argument('command', choices=['prepare', 'ingest', 'run'],
+                        help="run = prepare, then ingest once the job finishes")
+    parser.add_argument('--destination', default=CHECKIN_BATCH_URI, help='s3://bucket/prefix or local directory')
+    parser.add_argument('--runner', choices=['bedrock', 'local'], default=CHECKIN_RUNNER)
+    parser.add_argument('--poll-seconds', type=int, default=60)
+
+    args = parser.parse_args(argv)
+    if not args.destination:
+        parser.error('--destination (or CHECKIN_BATCH_URI) is required')
+    store = open_blob_store(args.destination)
+    runner = open_runner(args.runner)
+
+    if args.command in ('prepare', 'run'):
+        print(json.dumps(prepare(store, runner)))
+    if args.command in ('ingest', 'run'):
+        while True:
+            result = ingest(store, runner)
+            print(json.dumps(result))
+            if args.command == 'ingest' or not result['pending_jobs']:
+                break
+            time.sleep(args.poll_seconds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""
+Export Tool
+Bulk export of reframes to gzip NDJSON chunks for analytics and user data requests:
+parallel segmented Scan for full-table dumps, paginated query for a single user.
+Chunks stream to a local directory or S3-compatible bucket and every segment
+checkpoints after each chunk, so an interrupted export resumes where it stopped.
+"""
+
+import argparse
+import base64
+import gzip
+import io
+import json
+import os
+import sys
+import time
+import boto3
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict, Any, Optional
+
+from blob_store import open_blob_store
+from reframe_codec import unpack_item
+from repository import DynamoRepository
+
+REFRAMES_TABLE = os.environ.get('REFRAMES_TABLE', 'CognitiveReframer-Reframes')
+
+# A chunk is flushed at the first page boundary past either limit
+CHUNK_MAX_ITEMS = int(os.environ.get('EXPORT_CHUNK_ITEMS', '5000'))
+CHUNK_MAX_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', str(8 * 1024 * 1024)))
+
+
+def lambda_handler(event, context):
+    """
+    Tool handler for exports
+    Supports: export_user (data requests), export_table (small tables; use the CLI for large ones)
+    """
+    print(f"Export tool invoked: {json.dumps(event)}")
+
+    try:
+        action = event.get('action', event.get('tool_name', 'export_user'))
+        parameters = event.get('parameters', event.get('tool_input', {}))
+        destination = parameters.get('destination')
+
+        if not destination:
+            raise ValueError("destination is required")
+
+        if action == 'export_user':
+            if not parameters.get('user_id'):
+                raise ValueError("user_id is required")
+            result = export_user(parameters['user_id'], open_blob_store(destination))
+        elif action == 'export_table':
+            result = export_table(
+                open_blob_store(destination),
+                total_segments=int(parameters.get('segments', 4))
+            )
+        else:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': f'Unknown action: {action}'})
+            }
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'success': True,
+                'result': result
+            })
+        }
+
+    except Exception as e:
+        print(f"Error in export tool: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if hasattr(value, 'value') and isinstance(value.value, bytes):
+        # boto3 Binary
+        return base64.b64encode(value.value).decode('ascii')
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    return str(value)
+
+
+def _resource():
+    # boto3 resources are not thread-safe, so every worker gets its own session
+    session = boto3.session.Session()
+    return session.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+
+
+def _table():
+    return _resource().Table(REFRAMES_TABLE)
+
+
+class ChunkWriter:
+    """
+    Accumulates NDJSON lines into one gzip chunk at a time
+    Memory is bounded by the chunk size, never by the dataset
+    """
+
+    def __init__(self, sink, prefix: str, next_part: int = 0):
+        self.sink = sink
+        self.prefix = prefix
+        self.next_part = next_part
+        self.bytes_written = 0
+        self._reset()
+
+    def _reset(self):
+        self._buffer = io.BytesIO()
+        self._gzip = gzip.GzipFile(fileobj=self._buffer, mode='wb', mtime=0)
+        self.pending_items = 0
+        self.pending_bytes = 0
+
+    def write(self, item: Dict[str, Any]) -> None:
+        line = (json.dumps(item, default=_json_default, ensure_ascii=False) + '\n').encode('utf-8')
+        self._gzip.write(line)
+        self.pending_items += 1
+        self.pending_bytes += len(line)
+
+    def full(self) -> bool:
+        return self.pending_items >= CHUNK_MAX_ITEMS or self.pending_bytes >= CHUNK_MAX_BYTES
+
+    def flush(self) -> Optional[str]:
+        if not self.pending_items:
+            return None
+        self._gzip.close()
+        data = self._buffer.getvalue()
+        key = f"{self.prefix}/part-{self.next_part:05d}.ndjson.gz"
+        self.sink.put(key, data)
+        self.next_part += 1
+        self.bytes_written += len(data)
+        self._reset()
+        return key
+
+
+def _checkpoint_key(name: str) -> str:
+    return f"_checkpoints/{name}.json"
+
+
+def _load_checkpoint(sink, name: str) -> Dict[str, Any]:
+    data = sink.get(_checkpoint_key(name))
+    return json.loads(data) if data else {}
+
+
+def _save_checkpoint(sink, name: str, state: Dict[str, Any]) -> None:
+    sink.put(_checkpoint_key(name), json.dumps(state, default=_json_default).encode('utf-8'))
+
+
+def _export_pages(sink, name: str, fetch_page) -> Dict[str, Any]:
+    """
+    Drive one paginated read (a scan segment or a user query) into chunks
+    fetch_page(exclusive_start_key) returns a DynamoDB page response
+    Chunks are only cut at page boundaries so LastEvaluatedKey is an exact resume point
+    """
+    state = _load_checkpoint(sink, name)
+    if state.get('done'):
+        return {'name': name, 'items': state.get('items', 0), 'skipped': True}
+
+    writer = ChunkWriter(sink, name, next_part=state.get('next_part', 0))
+    items = state.get('items', 0)
+    start_key = state.get('last_evaluated_key')
+
+    while True:
+        page = fetch_page(start_key)
+        for item in page.get('Items', []):
+            writer.write(unpack_item(item))
+        start_key = page.get('LastEvaluatedKey')
+
+        if writer.full() or not start_key:
+            items += writer.pending_items
+            writer.flush()
+            _save_checkpoint(sink, name, {
+                'last_evaluated_key': start_key,
+                'next_part': writer.next_part,
+                'items': items,
+                'done': not start_key
+            })
+        if not start_key:
+            break
+
+    return {'name': name, 'items': items, 'parts': writer.next_part,
+            'bytes': writer.bytes_written, 'skipped': False}
+
+
+def export_segment(sink, segment: int, total_segments: int, page_size: Optional[int] = None) -> Dict[str, Any]:
+    """Export one parallel-scan segment"""
+    table = _table()
+
+    def fetch_page(start_key):
+        kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+        if page_size:
+            kwargs['Limit'] = page_size
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        return table.scan(**kwargs)
+
+    return _export_pages(sink, f"segment-{segment:04d}-of-{total_segments:04d}", fetch_page)
+
+
+def export_table(sink, total_segments: int = 4, workers: Optional[int] = None,
+                 page_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Full-table dump with a parallel segmented Scan
+    Throughput scales with segment count up to the worker pool size
+    """
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=workers or total_segments) as pool:
+        futures = [pool.submit(export_segment, sink, seg, total_segments, page_size) for seg in range(total_segments)]
+        segments = [f.result() for f in futures]
+
+    result = {
+        'items': sum(s['items'] for s in segments),
+        'segments': segments,
+        'seconds': round(time.time() - started, 3)
+    }
+    sink.put('_manifest.json', json.dumps(result).encode('utf-8'))
+    print(f"Exported {result['items']} items in {total_segments} segments to {sink} ({result['seconds']}s)")
+    return result
+
+
+def export_user(user_id: str, sink, page_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Single user's full history via paginated query on UserShardIndex
+    A hot user's shards export (and resume) independently, each in created_at order
+    """
+    resource = _resource()
+    table = resource.Table(REFRAMES_TABLE)
+
+    def export_shard(shard: str) -> Dict[str, Any]:
+        def fetch_page(start_key):
+            kwargs = {
+                'IndexName': 'UserShardIndex',
+                'KeyConditionExpression': 'user_shard = :shard',
+                'ExpressionAttributeValues': {':shard': shard},
+                'ScanIndexForward': True
+            }
+            if page_size:
+                kwargs['Limit'] = page_size
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            return table.query(**kwargs)
+
+        # Encoded so a user_id can never add path segments ('/', '..') to the sink key
+        return _export_pages(sink, f"user-{quote(shard, safe='')}", fetch_page)
+
+    shards = [export_shard(shard) for shard in DynamoRepository(resource).user_shard_keys(user_id)]
+    result = shards[0] if len(shards) == 1 else {'items': sum(s['items'] for s in shards), 'shards': shards}
+    print(f"Exported {result['items']} items for user {user_id} to {sink}")
+    return result
+
+
+def read_export(sink, prefix: str = ''):
+    """Iterate items back out of exported chunks (verification and re-import)"""
+    for key in sink.list(prefix):
+        if not key.endswith('.ndjson.gz'):
+            continue
+        with gzip.GzipFile(fileobj=io.BytesIO(sink.get(key))) as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export reframes to gzip NDJSON chunks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    table_cmd = sub.add_parser('table', help='Full-table dump (parallel segmented scan)')
+    table_cmd.add_argument('destination', help='Local directory, file:// or s3://bucket/prefix')
+    table_cmd.add_argument('--segments', type=int, default=8)
+    table_cmd.add_argument('--workers', type=int, default=None)
+
+    user_cmd = sub.add_parser('user', help="One user's history (paginated query)")
+    user_cmd.add_argument('user_id')
+    user_cmd.add_argument('destination')
+
+    args = parser.parse_args(argv)
+    sink = open_blob_store(args.destination)
+    if args.command == 'table':
+        export_table(sink, total_segments=args.segments, workers=args.workers)
+    else:
+        export_user(args.user_id, sink)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
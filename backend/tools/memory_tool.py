@@ -6,17 +6,38 @@ Implements AgentCore tool interface for memory operations
 import json
 import os
 import boto3
-from typing import Dict, Any, List
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+import profiling
+from repository import open_repository, new_reframe_item
 
 dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
 REFRAMES_TABLE = os.environ.get('REFRAMES_TABLE', 'CognitiveReframer-Reframes')
+STORAGE_URL = os.environ.get('STORAGE_URL', '')  # Empty uses DynamoDB; sqlite:///path for single-box deployments
+
+# Attributes format_memory reads; recall skips the large reframes payload
+MEMORY_FIELDS = ['reframe_id', 'source_input', 'models_used', 'summary', 'created_at']
+
+# recall_many: queries in flight at once per invocation, and requests per invocation
+RECALL_MANY_CONCURRENCY = int(os.environ.get('RECALL_MANY_CONCURRENCY', '8'))
+RECALL_MANY_MAX_REQUESTS = 100
+# Larger top_k is served as this many; recall feeds a prompt, not an export
+RECALL_MAX_TOP_K = 50
+
+# Reused across warm invocations; bounds recall_many's parallelism
+recall_pool = ThreadPoolExecutor(max_workers=RECALL_MANY_CONCURRENCY)
+
 
+def repository():
+    return open_repository(STORAGE_URL, dynamodb=dynamodb)
 
+
+@profiling.profiled('memory_tool')
 def lambda_handler(event, context):
     """
     Tool handler for memory operations
-    Supports: recall, store, search
+    Supports: recall, recall_many, store, search
     """
     print(f"Memory tool invoked: {json.dumps(event)}")
     
@@ -27,6 +48,8 @@ def lambda_handler(event, context):
         
         if action == 'recall':
             result = memory_recall(parameters)
+        elif action == 'recall_many':
+            result = memory_recall_many(parameters)
         elif action == 'store':
             result = memory_store(parameters)
         elif action == 'search':
@@ -45,6 +68,12 @@ def lambda_handler(event, context):
             })
         }
         
+    except ValueError as e:
+        # Invalid parameters
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': str(e)})
+        }
     except Exception as e:
         print(f"Error in memory tool: {str(e)}")
         return {
@@ -60,36 +89,93 @@ def memory_recall(params: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     user_id = params.get('user_id')
     query = params.get('query', '')
-    top_k = params.get('top_k', 3)
+    top_k = parse_top_k(params.get('top_k', 3))
     
     if not user_id:
         raise ValueError("user_id is required")
     
-    table = dynamodb.Table(REFRAMES_TABLE)
-    
     # Simple query by user_id (in production, add semantic search via embeddings)
-    response = table.query(
-        IndexName='UserIdIndex',
-        KeyConditionExpression='user_id = :uid',
-        ExpressionAttributeValues={':uid': user_id},
-        ScanIndexForward=False,
-        Limit=top_k
-    )
-    
-    items = response.get('Items', [])
+    items = repository().recent_reframes(user_id, limit=top_k, projection=MEMORY_FIELDS)
     
     # Format for agent context
-    memories = []
-    for item in items:
-        memories.append({
-            'id': item.get('reframe_id'),
-            'input': item.get('source_input'),
-            'models': item.get('models_used', []),
-            'summary': item.get('summary'),
-            'created_at': item.get('created_at')
-        })
-    
-    return memories
+    return [format_memory(item) for item in items]
+
+
+def parse_top_k(value: Any) -> int:
+    """top_k as a positive int, capped at RECALL_MAX_TOP_K"""
+    try:
+        top_k = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"top_k must be an integer, got {value!r}")
+    if top_k < 1:
+        raise ValueError(f"top_k must be at least 1, got {top_k}")
+    return min(top_k, RECALL_MAX_TOP_K)
+
+
+def recall_plan(requests: List[Dict[str, Any]]) -> Tuple[Dict[str, Tuple[str, int]], Dict[str, int]]:
+    """
+    Key each request and collapse them to one query per user
+    Recall is recency-only, so every request for a user is a prefix of the
+    largest top_k asked for; the query text does not change the result yet.
+    Returns ({request key: (user_id, top_k)}, {user_id: top_k to fetch})
+    """
+    if not isinstance(requests, list) or not requests:
+        raise ValueError("requests must be a non-empty list")
+    if len(requests) > RECALL_MANY_MAX_REQUESTS:
+        raise ValueError(f"At most {RECALL_MANY_MAX_REQUESTS} requests per call")
+
+    keyed = {}
+    fetch: Dict[str, int] = {}
+    for index, request in enumerate(requests):
+        key = str(request.get('id', index))
+        if key in keyed:
+            raise ValueError(f"Duplicate request id: {key}")
+        user_id = request.get('user_id')
+        if not user_id:
+            raise ValueError(f"user_id is required (request {key})")
+        top_k = parse_top_k(request.get('top_k', 3))
+        keyed[key] = (user_id, top_k)
+        fetch[user_id] = max(fetch.get(user_id, 0), top_k)
+    return keyed, fetch
+
+
+def memory_recall_many(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Recall for several (user_id, query, top_k) requests in one invocation
+    params: {requests: [{id?: str, user_id: str, query: str, top_k: int}]}
+    One query per distinct user, RECALL_MANY_CONCURRENCY at a time, so a batch
+    takes about one query's latency. Results are keyed by request id (its
+    index when no id is given); a failed user shows up under `errors`.
+    """
+    keyed, fetch = recall_plan(params.get('requests'))
+    repo = repository()
+
+    def recall(user_id: str) -> List[Dict[str, Any]]:
+        items = repo.recent_reframes(user_id, limit=fetch[user_id], projection=MEMORY_FIELDS)
+        return [format_memory(item) for item in items]
+
+    futures = {user_id: recall_pool.submit(recall, user_id) for user_id in fetch}
+    results, errors = {}, {}
+    for key, (user_id, top_k) in keyed.items():
+        try:
+            results[key] = futures[user_id].result()[:top_k]
+        except Exception as e:
+            print(f"Error recalling memories for {user_id}: {e}")
+            errors[key] = str(e)
+    return {'results': results, 'errors': errors, 'queries': len(fetch)}
+
+
+def format_memory(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Format a stored reframe item for agent context
+    """
+    return {
+        'id': item.get('reframe_id'),
+        'input': item.get('source_input'),
+        'models': item.get('models_used', []),
+        'summary': item.get('summary'),
+        'created_at': item.get('created_at')
+    }
 
 
 def memory_store(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -103,30 +189,22 @@ def memory_store(params: Dict[str, Any]) -> Dict[str, Any]:
     if not user_id or not reframe_data:
         raise ValueError("user_id and reframe_data are required")
     
-    table = dynamodb.Table(REFRAMES_TABLE)
-    
-    reframe_id = f"{user_id}_{int(datetime.utcnow().timestamp() * 1000)}"
-    
-    item = {
-        'reframe_id': reframe_id,
-        'user_id': user_id,
-        'source_input': reframe_data.get('input', ''),
-        'models_used': reframe_data.get('model_selection', []),
-        'reframes': reframe_data.get('reframes', []),
-        'summary': reframe_data.get('summary', ''),
-        'follow_up': reframe_data.get('follow_up', ''),
-        'created_at': datetime.utcnow().isoformat(),
-        'ttl': int(datetime.utcnow().timestamp()) + (90 * 24 * 60 * 60)
-    }
-    
-    table.put_item(Item=item)
+    item = build_memory_item(user_id, reframe_data)
+    repository().put_reframe(item)
     
     return {
         'stored': True,
-        'reframe_id': reframe_id
+        'reframe_id': item['reframe_id']
     }
 
 
+def build_memory_item(user_id: str, reframe_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the DynamoDB item for a stored memory (packed when compact storage is on)
+    """
+    return new_reframe_item(user_id, reframe_data.get('input', ''), reframe_data)
+
+
 def memory_search(params: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Semantic search across memories (placeholder for vector search)
@@ -9,13 +9,22 @@ import boto3
 from typing import Dict, Any
 from datetime import datetime, timedelta
 
+import profiling
+from repository import open_repository, new_reminder_item
+
 sns = boto3.client('sns', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
 eventbridge = boto3.client('events', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
 dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
 
 REMINDERS_TABLE = os.environ.get('REMINDERS_TABLE', 'CognitiveReframer-Reminders')
+STORAGE_URL = os.environ.get('STORAGE_URL', '')  # Empty uses DynamoDB; sqlite:///path for single-box deployments
+
 
+def repository():
+    return open_repository(STORAGE_URL, dynamodb=dynamodb)
 
+
+@profiling.profiled('schedule_tool')
 def lambda_handler(event, context):
     """
     Tool handler for scheduling follow-ups
@@ -64,21 +73,11 @@ def schedule_followup(params: Dict[str, Any]) -> Dict[str, Any]:
     # Calculate reminder time
     reminder_time = datetime.utcnow() + timedelta(hours=hours_from_now)
     
-    # Store reminder in DynamoDB
-    table = dynamodb.Table(REMINDERS_TABLE)
-    reminder_id = f"{user_id}_{reframe_id}_{int(datetime.utcnow().timestamp())}"
-    
-    item = {
-        'reminder_id': reminder_id,
-        'user_id': user_id,
-        'reframe_id': reframe_id,
-        'scheduled_time': reminder_time.isoformat(),
-        'method': method,
-        'status': 'scheduled',
-        'created_at': datetime.utcnow().isoformat()
-    }
+    # Store reminder (hour-bucketed so due reminders are read per bucket)
+    item = new_reminder_item(user_id, reframe_id, reminder_time, method)
+    reminder_id = item['reminder_id']
     
-    table.put_item(Item=item)
+    repository().put_reminder(item)
     
     # For demo: return scheduled confirmation
     # In production: integrate with EventBridge scheduled events or SNS
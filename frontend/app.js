@@ -9,6 +9,8 @@ const USER_ID = 'demo_user_' + Math.random().toString(36).substring(7); // Demo
 
 // State
 let currentReframe = null;
+let historyCache = null; // { etag, items } from the last history load, newest first
+const HISTORY_PAGE_SIZE = 20;
 
 // DOM Elements
 const thoughtInput = document.getElementById('thought-input');
@@ -88,7 +90,10 @@ reframeBtn.addEventListener('click', async () => {
 
         const data = await response.json();
 
-        if (data.safety_response) {
+        if (response.status === 429) {
+            const wait = response.headers.get('Retry-After') || data.retry_after;
+            showToast(`You're going a bit fast. Please try again in ${wait} seconds.`, 'info');
+        } else if (data.safety_response) {
             showSafetyMessage(data);
         } else {
             currentReframe = data;
@@ -134,6 +139,14 @@ function displayReframes(data) {
 
     resultsSection.style.display = 'block';
     resultsSection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+
+    if (data.previously_worked_on) {
+        const when = new Date(data.previously_worked_on.created_at).toLocaleDateString();
+        showToast(`You've worked on a thought like this before (${when}).`, 'info');
+    }
+    if (data.degraded) {
+        showToast('Our AI service is busy, so this is a quick offline reframe.', 'info');
+    }
 }
 
 // Safety message
@@ -198,33 +211,24 @@ newReframeBtn.addEventListener('click', () => {
 });
 
 // Load history
+// Revalidates the cached list: a 304 costs no items, otherwise only reframes
+// newer than the cache (`since`) come back and are merged in
 async function loadHistory() {
     historyLoading.style.display = 'flex';
     historyContainer.innerHTML = '';
     historyEmpty.style.display = 'none';
 
     try {
-        const response = await fetch(`${API_ENDPOINT}/history`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                action: 'history',
-                user_id: USER_ID
-            })
-        });
-
-        const data = await response.json();
+        const items = await fetchHistory();
 
         historyLoading.style.display = 'none';
 
-        if (!data.history || data.history.length === 0) {
+        if (items.length === 0) {
             historyEmpty.style.display = 'block';
             return;
         }
 
-        data.history.forEach(item => {
+        items.forEach(item => {
             const card = createHistoryCard(item);
             historyContainer.appendChild(card);
         });
@@ -236,6 +240,44 @@ async function loadHistory() {
     }
 }
 
+async function fetchHistory(useCache = true) {
+    const cached = useCache ? historyCache : null;
+    const headers = { 'Content-Type': 'application/json' };
+    const body = { action: 'history', user_id: USER_ID };
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+        if (cached.items.length > 0) {
+            body.since = cached.items[0].created_at;
+        }
+    }
+
+    const response = await fetch(`${API_ENDPOINT}/history`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify(body)
+    });
+
+    if (response.status === 304 && cached) {
+        return cached.items;
+    }
+
+    const data = await response.json();
+    if (body.since && data.next_since) {
+        // More new reframes than one page: start over rather than leave a gap
+        return fetchHistory(false);
+    }
+
+    let items = data.history || [];
+    if (body.since) {
+        const fresh = new Set(items.map(item => item.reframe_id));
+        items = items.concat(cached.items.filter(item => !fresh.has(item.reframe_id))).slice(0, HISTORY_PAGE_SIZE);
+    }
+
+    const etag = response.headers.get('ETag');
+    historyCache = etag ? { etag, items } : null;
+    return items;
+}
+
 function createHistoryCard(item) {
     const card = document.createElement('div');
     card.className = 'history-card';
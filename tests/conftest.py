@@ -0,0 +1,126 @@
+"""
+Shared fixtures: local DynamoDB stand-in (moto) with the tables from infra/template.yaml
+"""
+
+import os
+import sys
+import pytest
+import boto3
+from moto import mock_dynamodb
+
+# Code from the shared Lambda layer (mounted at /opt/python in Lambda)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/shared'))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+
+def create_reframes_table(resource, name='CognitiveReframer-Reframes'):
+    return resource.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'reframe_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'reframe_id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_shard', 'AttributeType': 'S'},
+            {'AttributeName': 'created_at', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                'IndexName': 'UserIdIndex',
+                'KeySchema': [
+                    {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'UserShardIndex',
+                'KeySchema': [
+                    {'AttributeName': 'user_shard', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def create_users_table(resource, name='CognitiveReframer-Users'):
+    return resource.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def create_stats_table(resource, name='CognitiveReframer-Stats'):
+    return resource.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'stat_key', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'stat_key', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def create_reminders_table(resource, name='CognitiveReframer-Reminders'):
+    return resource.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'reminder_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'reminder_id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+            {'AttributeName': 'bucket', 'AttributeType': 'S'},
+            {'AttributeName': 'scheduled_time', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                'IndexName': 'UserIdIndex',
+                'KeySchema': [{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'BucketIndex',
+                'KeySchema': [
+                    {'AttributeName': 'bucket', 'KeyType': 'HASH'},
+                    {'AttributeName': 'scheduled_time', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def create_rate_limits_table(resource, name='CognitiveReframer-RateLimits'):
+    return resource.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'bucket_key', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'bucket_key', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def create_near_duplicates_table(resource, name='CognitiveReframer-NearDuplicates'):
+    return resource.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'lsh_key', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'lsh_key', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+@pytest.fixture
+def dynamo():
+    """A moto-backed DynamoDB resource with the Reframes, Users, Stats and Reminders tables created"""
+    with mock_dynamodb():
+        resource = boto3.resource('dynamodb', region_name='us-east-1')
+        create_reframes_table(resource)
+        create_users_table(resource)
+        create_stats_table(resource)
+        create_reminders_table(resource)
+        create_near_duplicates_table(resource)
+        yield resource
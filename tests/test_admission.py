@@ -0,0 +1,290 @@
+"""
+Tests for per-user and global token-bucket admission control
+"""
+
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import pytest
+from collections import deque
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import degraded_mode
+from admission import AdmissionController, BucketPolicy
+from conftest import create_rate_limits_table
+
+MODEL_OUTPUT = json.dumps(degraded_mode.generate('The launch will fail') | {'degraded': False})
+
+
+class FakeClock:
+    def __init__(self, start=1_700_000_000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class CountingTable:
+    """Pass-through table wrapper counting DynamoDB writes"""
+
+    def __init__(self, table):
+        self.table = table
+        self.writes = 0
+
+    def update_item(self, **kwargs):
+        self.writes += 1
+        return self.table.update_item(**kwargs)
+
+
+@pytest.fixture
+def limits_table(dynamo):
+    return create_rate_limits_table(dynamo)
+
+
+class TestTokenBucket:
+
+    def test_burst_then_refill(self, limits_table):
+        clock = FakeClock()
+        controller = AdmissionController(limits_table, BucketPolicy(rate_per_second=1, burst=3), clock=clock)
+
+        assert [controller.admit('alice').admitted for _ in range(4)] == [True, True, True, False]
+        denied = controller.admit('alice')
+        assert denied.scope == 'user' and 0 < denied.retry_after <= 1.0
+        assert denied.retry_after_seconds == 1
+
+        clock.advance(1.0)
+        assert controller.admit('alice').admitted
+        assert not controller.admit('alice').admitted
+        # Other users have their own bucket
+        assert controller.admit('bob').admitted
+
+    def test_containers_sharing_the_table_never_over_admit(self, limits_table):
+        clock = FakeClock()
+        policy = BucketPolicy(rate_per_second=2, burst=4)
+        containers = [AdmissionController(limits_table, policy, clock=clock) for _ in range(3)]
+
+        admitted = 0
+        for step in range(20):
+            for controller in containers:
+                admitted += controller.admit('alice').admitted
+            clock.advance(0.25)
+        # 4 burst + 2/s over the 4.75s between the first and last round
+        assert admitted <= 4 + int(4.75 * 2)
+        assert admitted >= 4 + int(4.75 * 2) - 1
+
+    def test_local_precheck_sheds_without_dynamodb(self, limits_table):
+        clock = FakeClock()
+        table = CountingTable(limits_table)
+        controller = AdmissionController(table, BucketPolicy(rate_per_second=1, burst=2), clock=clock)
+
+        for _ in range(2):
+            assert controller.admit('flood').admitted
+        assert table.writes == 2  # one conditional write per admitted request
+
+        assert not controller.admit('flood').admitted
+        writes = table.writes
+        decisions = [controller.admit('flood') for _ in range(100)]
+        assert not any(d.admitted for d in decisions)
+        assert all(d.source == 'local' for d in decisions)
+        assert table.writes == writes
+
+    def test_global_bucket(self, limits_table):
+        clock = FakeClock()
+        controller = AdmissionController(
+            limits_table, BucketPolicy(rate_per_second=10, burst=10),
+            global_policy=BucketPolicy(rate_per_second=1, burst=2), clock=clock
+        )
+        assert controller.admit('a').admitted
+        assert controller.admit('b').admitted
+        denied = controller.admit('c')
+        assert not denied.admitted and denied.scope == 'global'
+
+    def test_user_limit_still_applies_while_global_is_spent(self, limits_table):
+        clock = FakeClock()
+        controller = AdmissionController(
+            limits_table, BucketPolicy(rate_per_second=1, burst=3),
+            global_policy=BucketPolicy(rate_per_second=1, burst=2), clock=clock
+        )
+        controller.admit('a')
+        controller.admit('b')
+        # Global bucket now blocked locally; one user keeps hammering
+        decisions = [controller.admit('flood') for _ in range(200)]
+        assert [d.scope for d in decisions[:3]] == ['global'] * 3  # user tokens spent, served as overflow
+        assert all(d.scope == 'user' for d in decisions[3:])
+
+    def test_fails_open_when_dynamodb_errors(self):
+        class BrokenTable:
+            def update_item(self, **kwargs):
+                raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': ''}},
+                                  'UpdateItem')
+
+        controller = AdmissionController(BrokenTable(), BucketPolicy(rate_per_second=1, burst=1))
+        assert all(controller.admit('alice').admitted for _ in range(5))
+
+
+class TestHandler:
+
+    @pytest.fixture(autouse=True)
+    def no_storage(self):
+        with patch('app.recall_memories', return_value=[]), \
+                patch('app.store_reframe', return_value='user_1'):
+            yield
+
+    def request(self, user_id, text):
+        return {'body': json.dumps({'action': 'reframe', 'user_id': user_id, 'input': text})}
+
+    def test_over_user_limit_returns_429_with_retry_after(self, limits_table):
+        controller = AdmissionController(limits_table, BucketPolicy(rate_per_second=0.1, burst=1))
+        with patch('app.admission_controller', controller), \
+                patch('app.invoke_bedrock_reframe', return_value=MODEL_OUTPUT):
+            assert app.lambda_handler(self.request('alice', 'first worry'), None)['statusCode'] == 200
+            response = app.lambda_handler(self.request('alice', 'second worry'), None)
+
+        assert response['statusCode'] == 429
+        assert int(response['headers']['Retry-After']) >= 1
+        assert json.loads(response['body'])['scope'] == 'user'
+
+    def test_over_global_limit_routes_to_cheaper_model(self, limits_table):
+        controller = AdmissionController(limits_table, BucketPolicy(rate_per_second=10, burst=10),
+                                         global_policy=BucketPolicy(rate_per_second=0.1, burst=1))
+        models = []
+
+        def model(system_prompt, user_input, model_id=None):
+            models.append(model_id)
+            return MODEL_OUTPUT
+
+        with patch('app.admission_controller', controller), \
+                patch('app.OVERFLOW_MODEL_ID', 'amazon.titan-text-lite-v1'), \
+                patch('app.invoke_bedrock_reframe', side_effect=model):
+            assert app.lambda_handler(self.request('alice', 'first worry'), None)['statusCode'] == 200
+            assert app.lambda_handler(self.request('bob', 'second worry'), None)['statusCode'] == 200
+
+        assert models == [None, 'amazon.titan-text-lite-v1']
+
+
+class CapacityLimitedModel:
+    """Bedrock stand-in with a fixed number of concurrent slots; excess calls queue FIFO"""
+
+    def __init__(self, slots: int, service_time: float):
+        self.calls = []
+        self.free = slots
+        self.service_time = service_time
+        self.queue = deque()
+        self.cond = threading.Condition()
+
+    def __call__(self, system_prompt, user_input, model_id=None):
+        ticket = object()
+        with self.cond:
+            self.calls.append(model_id)
+            self.queue.append(ticket)
+            self.cond.wait_for(lambda: self.free and self.queue[0] is ticket)
+            self.queue.popleft()
+            self.free -= 1
+            self.cond.notify_all()
+        time.sleep(self.service_time)
+        with self.cond:
+            self.free += 1
+            self.cond.notify_all()
+        return MODEL_OUTPUT
+
+
+def p95(values):
+    ordered = sorted(values)
+    return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def run_burst(controller, duration=1.5, flood_threads=8, good_users=3, good_interval=0.15,
+              overflow_model_id=''):
+    """
+    A flood already in progress (its burst spent) while a few well-behaved users
+    send at a steady pace; returns the good users' latencies and the flood's statuses
+    """
+    model = CapacityLimitedModel(slots=2, service_time=0.05)
+    overflow_model = CapacityLimitedModel(slots=2, service_time=0.05)  # the cheaper model has its own quota
+
+    def invoke(system_prompt, user_input, model_id=None):
+        target = overflow_model if overflow_model_id and model_id == overflow_model_id else model
+        return target(system_prompt, user_input, model_id)
+    stop = time.monotonic() + duration + 0.3
+    good_latencies = []
+    statuses = {'flood_429': 0, 'flood_200': 0}
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+
+    def flood():
+        while time.monotonic() < stop:
+            response = app.lambda_handler(
+                {'body': json.dumps({'user_id': 'demo_user', 'input': f'flood {next(counter)}'})}, None
+            )
+            with lock:
+                statuses['flood_429' if response['statusCode'] == 429 else 'flood_200'] += 1
+            if response['statusCode'] == 429:
+                time.sleep(0.02)  # an impatient client, still far inside Retry-After
+
+    def good(user_id):
+        while time.monotonic() < stop:
+            started = time.monotonic()
+            response = app.lambda_handler(
+                {'body': json.dumps({'user_id': user_id, 'input': f'worry {next(counter)}'})}, None
+            )
+            assert response['statusCode'] == 200
+            with lock:
+                good_latencies.append(time.monotonic() - started)
+            time.sleep(good_interval)
+
+    with patch('app.admission_controller', controller), \
+            patch('app.recall_memories', return_value=[]), \
+            patch('app.store_reframe', return_value='user_1'), \
+            patch('app.OVERFLOW_MODEL_ID', overflow_model_id), \
+            patch('app.invoke_bedrock_reframe', side_effect=invoke):
+        # Objects left by earlier tests would make full collections pause the run for 100ms+
+        gc.collect()
+        gc.freeze()
+        threads = [threading.Thread(target=flood) for _ in range(flood_threads)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.3)
+        threads += [threading.Thread(target=good, args=(f'good_{i}',)) for i in range(good_users)]
+        for thread in threads[flood_threads:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gc.unfreeze()
+
+    statuses['overflow_calls'] = len(overflow_model.calls)
+    return good_latencies, statuses
+
+
+def test_burst_traffic_keeps_well_behaved_tail_latency_bounded(limits_table):
+    unprotected, _ = run_burst(controller=None)
+    protected, statuses = run_burst(controller=AdmissionController(
+        limits_table, BucketPolicy(rate_per_second=5, burst=3)
+    ))
+
+    print(f"good-user p95 without admission: {p95(unprotected) * 1000:.0f} ms, "
+          f"with admission: {p95(protected) * 1000:.0f} ms, flood {statuses}")
+    assert statuses['flood_429'] > 5 * statuses['flood_200']
+    assert p95(protected) < 0.15
+    assert p95(protected) < p95(unprotected) / 2
+
+    # A tight global bucket with an overflow model: the flooder is still held to its own limit
+    limits_table.delete_item(Key={'bucket_key': 'user#demo_user'})
+    overflowing, statuses = run_burst(
+        controller=AdmissionController(limits_table, BucketPolicy(rate_per_second=5, burst=3),
+                                       global_policy=BucketPolicy(rate_per_second=8, burst=3)),
+        overflow_model_id='amazon.titan-text-lite-v1'
+    )
+    print(f"with global limit + overflow: p95 {p95(overflowing) * 1000:.0f} ms, flood {statuses}")
+    assert statuses['overflow_calls'] > 0
+    assert statuses['flood_429'] > 5 * statuses['flood_200']
+    assert p95(overflowing) < 0.15
@@ -0,0 +1,303 @@
+"""
+Tests for the asyncio service variant
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/service'))
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import async_app
+from load_test import FAKE_REFRAME, FakeDynamoDB, fake_bedrock_app
+
+
+class FakeBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self):
+        return self.data
+
+
+class FakeBedrock:
+    """Async bedrock-runtime stand-in tracking peak concurrency"""
+
+    def __init__(self, latency: float = 0.2):
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    async def invoke_model(self, modelId, body):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        return {'body': FakeBody(json.dumps({'completion': json.dumps(FAKE_REFRAME)}).encode('utf-8'))}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def with_client(service, fn):
+    client = TestClient(TestServer(async_app.create_app(service)))
+    await client.start_server()
+    try:
+        return await fn(client)
+    finally:
+        await client.close()
+
+
+def test_reframe_and_history_round_trip():
+    service = async_app.ReframeService(FakeDynamoDB(), FakeBedrock(latency=0))
+
+    async def scenario(client):
+        response = await client.post('/reframe', json={'user_id': 'u1', 'input': 'I am worried about my exam'})
+        assert response.status == 200
+        reframe = await response.json()
+        assert reframe['user_id'] == 'u1'
+        assert len(reframe['reframes']) == 2
+        assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+        response = await client.post('/history', json={'action': 'history', 'user_id': 'u1'})
+        history = await response.json()
+        assert [item['reframe_id'] for item in history['history']] == [reframe['reframe_id']]
+        assert history['history'][0]['reframes'][0]['model'] == 'Dichotomy of Control'
+
+        # Same ETag contract as the Lambda: 304 when unchanged, `since` for the delta
+        etag = response.headers['ETag']
+        response = await client.post('/history', json={'action': 'history', 'user_id': 'u1'},
+                                     headers={'If-None-Match': etag})
+        assert response.status == 304
+
+        await client.post('/reframe', json={'user_id': 'u1', 'input': 'Now I am worried about the results'})
+        response = await client.post('/history', headers={'If-None-Match': etag}, json={
+            'action': 'history', 'user_id': 'u1', 'since': history['history'][0]['created_at']
+        })
+        assert response.status == 200 and response.headers['ETag'] != etag
+        delta = await response.json()
+        assert [item['source_input'] for item in delta['history']] == ['Now I am worried about the results']
+
+    run(with_client(service, scenario))
+
+
+def test_compact_items_are_unpacked(monkeypatch):
+    monkeypatch.setenv('COMPACT_STORAGE', 'true')
+    dynamodb = FakeDynamoDB()
+    service = async_app.ReframeService(dynamodb, FakeBedrock(latency=0))
+
+    async def scenario():
+        await service.reframe('u1', {'input': 'I keep procrastinating on my thesis'})
+        stored = next(iter(dynamodb.tables[async_app.reframe_app.REFRAMES_TABLE].values()))
+        assert 'reframes_z' in stored and 'reframes' not in stored
+        history = await service.history('u1')
+        assert history['history'][0]['reframes'][1]['model'] == 'Scaling'
+
+    run(scenario())
+
+
+def test_concurrent_requests_overlap_on_one_process():
+    bedrock = FakeBedrock(latency=0.2)
+    service = async_app.ReframeService(FakeDynamoDB(), bedrock)
+
+    async def scenario():
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            service.reframe(f'user{i}', {'input': f'Worried about deadline {i}'}) for i in range(200)
+        ))
+        return time.perf_counter() - started
+
+    elapsed = run(scenario())
+    assert bedrock.calls == 200
+    assert bedrock.peak == 200
+    # Serial execution would take 40s; all calls overlap on the event loop
+    assert elapsed < 2.0
+
+
+def test_identical_requests_share_one_model_call():
+    bedrock = FakeBedrock(latency=0.1)
+    service = async_app.ReframeService(FakeDynamoDB(), bedrock)
+
+    async def scenario():
+        return await asyncio.gather(*(
+            service.reframe('u1', {'input': 'Same worry', 'tone': 'direct'}) for _ in range(10)
+        ))
+
+    results = run(scenario())
+    assert bedrock.calls == 1
+    assert len({r['reframe_id'] for r in results}) == 1
+
+
+def test_safety_response_skips_model():
+    bedrock = FakeBedrock(latency=0)
+    service = async_app.ReframeService(FakeDynamoDB(), bedrock)
+
+    result = run(service.reframe('u1', {'input': 'I want to kill myself'}))
+    assert result['safety_response'] is True
+    assert bedrock.calls == 0
+
+
+def test_memory_tool_actions():
+    service = async_app.ReframeService(FakeDynamoDB(), FakeBedrock(latency=0))
+
+    async def scenario(client):
+        response = await client.post('/memory', json={
+            'action': 'store',
+            'parameters': {'user_id': 'u1', 'reframe_data': {'input': 'Job interview nerves', **FAKE_REFRAME}}
+        })
+        assert (await response.json())['result']['stored'] is True
+
+        response = await client.post('/memory', json={'action': 'recall', 'parameters': {'user_id': 'u1'}})
+        memories = (await response.json())['result']
+        assert memories[0]['input'] == 'Job interview nerves'
+        assert memories[0]['models'] == FAKE_REFRAME['model_selection']
+
+        response = await client.post('/memory', json={'action': 'recall_many', 'parameters': {'requests': [
+            {'id': 'mine', 'user_id': 'u1', 'query': 'interview', 'top_k': 1},
+            {'id': 'nobody', 'user_id': 'u2', 'query': 'interview'}
+        ]}})
+        batch = (await response.json())['result']
+        assert batch['results']['mine'][0]['input'] == 'Job interview nerves'
+        assert batch['results']['nobody'] == [] and batch['queries'] == 2
+
+        response = await client.post('/memory', json={'action': 'forget', 'parameters': {}})
+        assert response.status == 400
+
+        response = await client.post('/memory', json={'action': 'recall_many', 'parameters': {'requests': [
+            {'user_id': 'u1', 'top_k': 0}
+        ]}})
+        assert response.status == 400
+
+    run(with_client(service, scenario))
+
+
+def test_real_client_against_fake_bedrock_endpoint():
+    """aiobotocore client with the tuned pool, talking HTTP to a local Bedrock stand-in"""
+    async def scenario():
+        bedrock_server = TestServer(fake_bedrock_app(latency=0.1))
+        await bedrock_server.start_server()
+        session = async_app.get_session()
+        try:
+            async with session.create_client(
+                'bedrock-runtime', region_name='us-east-1',
+                endpoint_url=str(bedrock_server.make_url('')).rstrip('/'),
+                config=async_app.client_config()
+            ) as bedrock:
+                service = async_app.ReframeService(FakeDynamoDB(), bedrock)
+                started = time.perf_counter()
+                results = await asyncio.gather(*(
+                    service.reframe(f'user{i}', {'input': f'Worried {i}'}) for i in range(50)
+                ))
+                return results, time.perf_counter() - started
+        finally:
+            await bedrock_server.close()
+
+    results, elapsed = run(scenario())
+    assert all(len(r['reframes']) == 2 for r in results)
+    assert elapsed < 3.0
+
+
+def test_client_config_is_tuned():
+    config = async_app.client_config()
+    assert config.max_pool_connections == async_app.MAX_POOL_CONNECTIONS
+    assert config.tcp_keepalive is True
+    assert config.connector_args['keepalive_timeout'] == async_app.KEEPALIVE_TIMEOUT
+
+
+def test_slow_model_serves_degraded_reframe_within_budget():
+    bedrock = FakeBedrock(latency=1.0)
+    service = async_app.ReframeService(FakeDynamoDB(), bedrock)
+
+    async def scenario():
+        started = time.perf_counter()
+        result = await service.reframe('u1', {'input': 'The launch will be a disaster'})
+        return result, time.perf_counter() - started
+
+    with patch.object(async_app.reframe_app, 'REFRAME_LATENCY_BUDGET_MS', 100):
+        result, elapsed = run(scenario())
+    assert result['degraded'] is True
+    assert elapsed < 0.5
+
+
+class BeliefBedrock(FakeBedrock):
+    """Answers extraction calls with the chunk's first-person sentences, everything else with a reframe"""
+
+    def __init__(self, latency: float = 0.2):
+        super().__init__(latency)
+        self.prompts = []
+
+    async def invoke_model(self, modelId, body):
+        self.prompts.append(body)
+        if json.dumps(async_app.long_input.EXTRACTION_PROMPT)[1:-1] not in body:
+            return await super().invoke_model(modelId, body)
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        beliefs = ['I will fail this exam.', 'Everyone will see I am not good enough.']
+        return {'body': FakeBody(json.dumps({'completion': json.dumps({'beliefs': beliefs})}).encode('utf-8'))}
+
+
+def test_long_input_is_distilled_in_two_round_trips():
+    bedrock = BeliefBedrock(latency=0.2)
+    service = async_app.ReframeService(FakeDynamoDB(), bedrock)
+    entry = 'Today started with coffee and a long commute. I will fail this exam. ' * 60
+
+    async def scenario():
+        started = time.perf_counter()
+        result = await service.reframe('u1', {'input': entry})
+        return result, time.perf_counter() - started
+
+    result, elapsed = run(scenario())
+    chunks = len(async_app.long_input.chunk_text(entry.strip()))
+    assert chunks > 1 and bedrock.calls == chunks + 1
+    # Every extraction is in flight at once, then one reframe call
+    assert bedrock.peak == chunks and elapsed < 0.7
+    assert not result.get('degraded')
+    assert result['input'] == entry.strip()
+    assert result['distilled_beliefs'] == ['I will fail this exam.', 'Everyone will see I am not good enough.']
+    assert result['usage']['extraction']['calls'] == chunks
+    assert 'coffee' not in bedrock.prompts[-1]
+
+
+def test_recall_many_reports_failed_users():
+    service = async_app.ReframeService(FakeDynamoDB(), FakeBedrock(latency=0))
+    real_read = service.read_user
+
+    async def flaky(user_id, limit, **kwargs):
+        if user_id == 'bob':
+            raise async_app.ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'throttled'}}, 'Query')
+        return await real_read(user_id, limit, **kwargs)
+
+    async def scenario():
+        await service.reframe('alice', {'input': 'Job interview nerves'})
+        service.read_user = flaky
+        return await service.memory({'action': 'recall_many', 'parameters': {'requests': [
+            {'id': 'a', 'user_id': 'alice'}, {'id': 'b', 'user_id': 'bob'}
+        ]}})
+
+    batch = run(scenario())['result']
+    assert len(batch['results']['a']) == 1 and 'b' not in batch['results']
+    assert 'throttled' in batch['errors']['b']
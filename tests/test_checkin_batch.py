@@ -0,0 +1,159 @@
+"""
+Tests for the batch check-in pipeline: job input format, the local fake runner,
+bulk ingest onto reminders and the Bedrock runner's API calls
+"""
+
+import json
+import os
+import sys
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/tools'))
+
+import checkin_batch
+from blob_store import LocalBlobStore, S3BlobStore
+from checkin_batch import LocalBatchRunner, BedrockBatchRunner
+from repository import DynamoRepository, new_reframe_item, new_reminder_item
+
+NOW = datetime(2025, 1, 15, 9, 30)
+
+REFRAME_DATA = {
+    'model_selection': ['Premortem', 'Scaling'],
+    'reframes': [{'model': 'Premortem', 'reframe': 'r', 'explanation': 'e',
+                  'action_steps': ['List 3 risks for the launch', 'Ask Sam for a review']}],
+    'summary': 'Prepare for what could go wrong.',
+    'follow_up': '48 hours'
+}
+
+
+def seed(repo, count=5, hours=(3, 30)):
+    """`count` reminders spread over the given hours from NOW, each on its own reframe"""
+    reminders = []
+    for i in range(count):
+        reframe = new_reframe_item('alice', f'Worried about launch {i}', REFRAME_DATA)
+        reframe['reframe_id'] = f'alice_r{i}'
+        repo.put_reframe(reframe)
+        due = NOW + timedelta(hours=hours[i % len(hours)], minutes=i)
+        reminders.append(new_reminder_item('alice', reframe['reframe_id'], due) | {'reminder_id': f'rem{i}'})
+    repo.put_reminders(reminders)
+    return reminders
+
+
+@pytest.fixture
+def repo(dynamo):
+    return DynamoRepository(dynamo)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path / 'checkins'))
+
+
+class TestPrepare:
+
+    def test_job_input_is_bedrock_batch_jsonl(self, repo, store):
+        seed(repo, count=3)
+        runner = Mock(min_records=1)
+        runner.submit.return_value = 'arn:aws:bedrock:us-east-1:123:model-invocation-job/abc'
+
+        result = checkin_batch.prepare(store, runner, now=NOW, repo=repo)
+
+        assert result == {'submitted': True, 'job_id': runner.submit.return_value, 'records': 3}
+        input_key = runner.submit.call_args[0][2]
+        lines = store.get(input_key).decode('utf-8').splitlines()
+        records = [json.loads(line) for line in lines]
+        assert [r['recordId'] for r in records] == ['CHK00000000', 'CHK00000001', 'CHK00000002']
+        body = records[0]['modelInput']
+        assert body['anthropic_version'] == 'bedrock-2023-05-31'
+        prompt = body['messages'][0]['content'][0]['text']
+        assert 'List 3 risks for the launch' in prompt and 'Worried about launch 0' in prompt
+
+    def test_only_unprepared_reminders_in_the_horizon(self, repo, store):
+        reminders = seed(repo, count=4)
+        late = new_reminder_item('alice', 'alice_r0', NOW + timedelta(hours=60)) | {'reminder_id': 'late'}
+        past = new_reminder_item('alice', 'alice_r0', NOW - timedelta(hours=1)) | {'reminder_id': 'past'}
+        orphan = new_reminder_item('alice', 'expired_reframe', NOW + timedelta(hours=2)) | {'reminder_id': 'orphan'}
+        repo.put_reminders([late, past, orphan])
+
+        first = checkin_batch.prepare(store, LocalBatchRunner(), now=NOW, repo=repo)
+        second = checkin_batch.prepare(store, LocalBatchRunner(), now=NOW, repo=repo)
+
+        assert first['records'] == len(reminders)
+        # Reminders already in a job are skipped
+        assert second == {'submitted': False, 'records': 0}
+
+    def test_small_batches_wait_for_the_minimum(self, repo, store):
+        seed(repo, count=2)
+        runner = Mock(min_records=100)
+
+        assert checkin_batch.prepare(store, runner, now=NOW, repo=repo) == {'submitted': False, 'records': 2}
+        runner.submit.assert_not_called()
+        assert all('checkin_status' not in r for r in repo.user_reminders('alice'))
+
+
+class TestIngest:
+
+    def test_checkins_land_on_reminders_before_they_are_due(self, repo, store):
+        seed(repo, count=6)
+        runner = LocalBatchRunner()
+        checkin_batch.prepare(store, runner, now=NOW, repo=repo)
+        assert {r['checkin_status'] for r in repo.user_reminders('alice')} == {'pending'}
+
+        with patch.object(repo, 'put_reminders', wraps=repo.put_reminders) as bulk:
+            result = checkin_batch.ingest(store, runner, repo=repo)
+
+        assert result == {'jobs': 1, 'ready': 6, 'failed': 0, 'pending_jobs': 0}
+        assert bulk.call_count == 1
+        reminders = repo.user_reminders('alice')
+        assert {r['checkin_status'] for r in reminders} == {'ready'}
+        assert all('List 3 risks for the launch' in r['checkin_message'] for r in reminders)
+        assert all(r['checkin_usage']['output_tokens'] > 0 for r in reminders)
+        # Ingesting again is a no-op
+        assert checkin_batch.ingest(store, runner, repo=repo)['jobs'] == 0
+
+    def test_failed_records_and_running_jobs(self, repo, store):
+        seed(repo, count=3)
+
+        def respond(model_input):
+            if 'launch 1' in model_input['messages'][0]['content'][0]['text']:
+                raise ValueError('ModelErrorException')
+            return checkin_batch.canned_checkin(model_input)
+
+        runner = LocalBatchRunner(respond)
+        checkin_batch.prepare(store, runner, now=NOW, repo=repo)
+
+        with patch.object(runner, 'status', return_value='InProgress'):
+            assert checkin_batch.ingest(store, runner, repo=repo)['pending_jobs'] == 1
+        result = checkin_batch.ingest(store, runner, repo=repo)
+
+        assert (result['ready'], result['failed']) == (2, 1)
+        failed = [r for r in repo.user_reminders('alice') if r['checkin_status'] == 'failed']
+        assert [r['reminder_id'] for r in failed] == ['rem1']
+        assert failed[0]['checkin_error'] == 'ModelErrorException'
+
+
+class TestBedrockRunner:
+
+    def test_job_points_bedrock_at_the_bucket(self):
+        client = Mock()
+        client.create_model_invocation_job.return_value = {'jobArn': 'arn:job/1'}
+        client.get_model_invocation_job.return_value = {'status': 'InProgress'}
+        runner = BedrockBatchRunner(client=client, role_arn='arn:aws:iam::123:role/batch')
+        store = S3BlobStore('checkins-bucket', 'checkins', client=Mock())
+
+        job_id = runner.submit(store, 'checkins-1', 'jobs/checkins-1/input/records.jsonl',
+                               'jobs/checkins-1/output', 'anthropic.claude-3-haiku-20240307-v1:0')
+
+        kwargs = client.create_model_invocation_job.call_args.kwargs
+        assert kwargs['inputDataConfig']['s3InputDataConfig']['s3Uri'] == \
+            's3://checkins-bucket/checkins/jobs/checkins-1/input/records.jsonl'
+        assert kwargs['outputDataConfig']['s3OutputDataConfig']['s3Uri'] == \
+            's3://checkins-bucket/checkins/jobs/checkins-1/output/'
+        assert kwargs['roleArn'] == 'arn:aws:iam::123:role/batch'
+        assert runner.status(job_id) == 'InProgress'
+
+    def test_local_store_is_rejected(self, store):
+        with pytest.raises(ValueError, match='s3://'):
+            BedrockBatchRunner(client=Mock()).submit(store, 'j', 'in.jsonl', 'out', 'model')
@@ -0,0 +1,126 @@
+"""
+Tests for the offline degraded-mode reframe engine and its latency-budget fallback
+"""
+
+import json
+import os
+import sys
+import time
+import pytest
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import degraded_mode
+import usage_stats
+
+
+class TestClassifier:
+
+    @pytest.mark.parametrize('text,expected', [
+        ("I'm sure the launch will fail and it'll be a disaster.", 'Inversion'),
+        ("I'll embarrass myself in the meeting.", 'Scaling'),
+        ("I keep procrastinating on my thesis again", '5 Whys'),
+        ("Should I quit my job or stay where I am?", 'Cost-Benefit'),
+        ("My presentation is next week and I'm nervous", 'Premortem'),
+        ("My boss and other people will judge me", 'Dichotomy of Control'),
+    ])
+    def test_picks_expected_model(self, text, expected):
+        assert expected in degraded_mode.classify(text)
+
+    def test_always_two_distinct_known_models(self):
+        for text in ['', 'blah', 'fail fail fail fail', 'x' * 500]:
+            models = degraded_mode.classify(text)
+            assert len(models) == 2 and len(set(models)) == 2
+            assert all(m in degraded_mode.TEMPLATES for m in models)
+
+    def test_unmatched_input_uses_defaults(self):
+        assert degraded_mode.classify('qwerty zxcv') == degraded_mode.DEFAULT_MODELS
+
+    def test_topic_extraction(self):
+        assert degraded_mode.extract_topic("I'm sure the launch will fail") == 'the launch'
+        assert degraded_mode.extract_topic('nervous about my final presentation tomorrow') == 'my final presentation'
+        assert degraded_mode.extract_topic('everything is bad') == 'this'
+
+
+class TestGenerate:
+
+    def test_output_passes_model_response_validation(self):
+        for tone in ('gentle', 'direct', 'balanced'):
+            data = degraded_mode.generate('I will bomb the interview tomorrow', tone)
+            parsed = app.parse_reframe_response(json.dumps(data))
+            assert parsed['degraded'] is True
+            assert parsed['input'] == 'I will bomb the interview tomorrow'
+            assert all(len(r['action_steps']) >= 2 for r in parsed['reframes'])
+
+    def test_runs_in_microseconds(self):
+        runs = 2000
+        started = time.perf_counter()
+        for i in range(runs):
+            degraded_mode.generate(f'I am worried my project {i} will fail')
+        assert (time.perf_counter() - started) / runs < 0.001
+
+
+MODEL_OUTPUT = json.dumps(degraded_mode.generate('placeholder') | {'degraded': False})
+
+
+class TestFallback:
+
+    @pytest.fixture(autouse=True)
+    def no_storage(self):
+        with patch('app.recall_memories', return_value=[]), \
+                patch('app.store_reframe', return_value='user_1') as store:
+            yield store
+
+    def test_slow_model_exceeds_budget(self):
+        def slow_model(system_prompt, user_input, model_id=None):
+            time.sleep(1.0)
+            return MODEL_OUTPUT
+
+        with patch('app.REFRAME_LATENCY_BUDGET_MS', 100), \
+                patch('app.invoke_bedrock_reframe', side_effect=slow_model):
+            started = time.monotonic()
+            result = app.generate_reframe('u1', 'The launch will be a disaster', 'gentle')
+            elapsed = time.monotonic() - started
+
+        assert result['degraded'] is True
+        assert elapsed < 0.5
+
+    def test_fast_model_is_used(self):
+        with patch('app.REFRAME_LATENCY_BUDGET_MS', 2000), \
+                patch('app.invoke_bedrock_reframe', return_value=MODEL_OUTPUT):
+            result = app.generate_reframe('u1', 'The launch will be a disaster', 'gentle')
+        assert result['degraded'] is False
+
+    def test_model_error_falls_back(self):
+        throttled = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'InvokeModel')
+        with patch('app.invoke_bedrock_reframe', side_effect=throttled):
+            result = app.generate_reframe('u1', 'I keep procrastinating', 'direct')
+        assert result['degraded'] is True
+        assert result['model_selection'][0] == '5 Whys'
+
+    def test_invalid_model_output_falls_back(self):
+        with patch('app.invoke_bedrock_reframe', return_value='not json at all'):
+            result = app.generate_reframe('u1', 'I keep procrastinating', 'direct')
+        assert result['degraded'] is True
+
+    def test_fallback_can_be_disabled(self):
+        with patch('app.DEGRADED_FALLBACK', False), \
+                patch('app.invoke_bedrock_reframe', side_effect=Exception('Failed to invoke Bedrock')):
+            with pytest.raises(Exception):
+                app.generate_reframe('u1', 'I keep procrastinating', 'direct')
+
+    def test_storage_failure_still_answers_when_degraded(self, no_storage):
+        no_storage.side_effect = ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'down'}}, 'PutItem')
+        with patch('app.invoke_bedrock_reframe', side_effect=Exception('Failed to invoke Bedrock')):
+            result = app.generate_reframe('u1', 'I keep procrastinating', 'direct')
+        assert result['degraded'] is True
+        assert result['reframe_id'] is None
+
+
+def test_degraded_items_are_counted():
+    item = app.build_reframe_item('u1', 'input', degraded_mode.generate('input'), 'gentle')
+    assert item['degraded'] is True
+    assert usage_stats.item_counters(item)['degraded'] == 1
@@ -0,0 +1,172 @@
+"""
+Tests for the bulk NDJSON export tool
+"""
+
+import json
+import os
+import sys
+import zlib
+import pytest
+import boto3
+from unittest.mock import patch
+from moto import mock_s3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/shared'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/tools'))
+
+import export_tool
+from blob_store import LocalBlobStore, S3BlobStore
+
+
+def seed(dynamo, users=3, per_user=20):
+    table = dynamo.Table('CognitiveReframer-Reframes')
+    with table.batch_writer() as batch:
+        for u in range(users):
+            for i in range(per_user):
+                batch.put_item(Item={
+                    'reframe_id': f'user{u}_{i}',
+                    'user_id': f'user{u}',
+                    'user_shard': f'user{u}',
+                    'source_input': f'thought {i} — with unicode',
+                    'models_used': ['Premortem', 'Scaling'],
+                    'created_at': f'2025-01-01T00:00:{i:02d}',
+                    'ttl': 1700000000 + i
+                })
+    return users * per_user
+
+
+class SegmentedTable:
+    """
+    moto ignores Segment/TotalSegments, so emulate DynamoDB's hash-partitioned
+    segments on top of a plain scan
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def scan(self, Segment=None, TotalSegments=None, **kwargs):
+        page = self.table.scan(**kwargs)
+        if TotalSegments:
+            page['Items'] = [
+                item for item in page['Items']
+                if zlib.crc32(item['reframe_id'].encode()) % TotalSegments == Segment
+            ]
+        return page
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+
+@pytest.fixture(autouse=True)
+def segmented_scans(dynamo):
+    def table():
+        resource = boto3.resource('dynamodb', region_name='us-east-1')
+        return SegmentedTable(resource.Table(export_tool.REFRAMES_TABLE))
+
+    with patch.object(export_tool, '_table', table):
+        yield
+
+
+class FailingSink(LocalBlobStore):
+    """Local sink that crashes after a number of chunk writes"""
+
+    def __init__(self, root, fail_after):
+        super().__init__(root)
+        self.chunk_puts = 0
+        self.fail_after = fail_after
+
+    def put(self, key, data):
+        if key.endswith('.ndjson.gz'):
+            if self.chunk_puts >= self.fail_after:
+                raise IOError("sink unavailable")
+            self.chunk_puts += 1
+        super().put(key, data)
+
+
+class TestExportTable:
+    """Parallel segmented scan export"""
+
+    @pytest.mark.parametrize('segments', [1, 4])
+    def test_full_table_round_trip(self, dynamo, tmp_path, segments):
+        total = seed(dynamo)
+        sink = LocalBlobStore(str(tmp_path))
+
+        result = export_tool.export_table(sink, total_segments=segments, page_size=7)
+
+        assert result['items'] == total
+        items = list(export_tool.read_export(sink))
+        assert len(items) == total
+        assert len({i['reframe_id'] for i in items}) == total
+        assert items[0]['ttl'] >= 1700000000  # Decimals serialized as numbers
+        assert json.loads(sink.get('_manifest.json'))['items'] == total
+
+    def test_resume_from_checkpoints(self, dynamo, tmp_path):
+        total = seed(dynamo)
+        with patch.object(export_tool, 'CHUNK_MAX_ITEMS', 5):
+            crashing = FailingSink(str(tmp_path), fail_after=3)
+            with pytest.raises(IOError):
+                export_tool.export_table(crashing, total_segments=2, workers=1, page_size=5)
+
+            resumed = LocalBlobStore(str(tmp_path))
+            result = export_tool.export_table(resumed, total_segments=2, page_size=5)
+
+        items = list(export_tool.read_export(resumed))
+        assert result['items'] == total
+        assert sorted(i['reframe_id'] for i in items) == sorted({i['reframe_id'] for i in items})
+        assert len(items) == total
+
+    def test_completed_export_is_skipped_on_rerun(self, dynamo, tmp_path):
+        seed(dynamo)
+        sink = LocalBlobStore(str(tmp_path))
+        export_tool.export_table(sink, total_segments=2)
+
+        result = export_tool.export_table(sink, total_segments=2)
+        assert all(s['skipped'] for s in result['segments'])
+
+
+class TestExportUser:
+    """Single-user export"""
+
+    def test_user_export_only_contains_user(self, dynamo, tmp_path):
+        seed(dynamo)
+        sink = LocalBlobStore(str(tmp_path))
+
+        result = export_tool.export_user('user1', sink, page_size=6)
+
+        items = list(export_tool.read_export(sink))
+        assert result['items'] == 20
+        assert {i['user_id'] for i in items} == {'user1'}
+        assert [i['created_at'] for i in items] == sorted(i['created_at'] for i in items)
+
+    def test_user_id_cannot_escape_the_sink(self, dynamo, tmp_path):
+        table = dynamo.Table('CognitiveReframer-Reframes')
+        user_id = '../../escaped/user'
+        table.put_item(Item={'reframe_id': 'r1', 'user_id': user_id, 'user_shard': user_id,
+                             'created_at': '2025-01-01T00:00:00',
+                             'source_input': 'thought'})
+        root = tmp_path / 'exports'
+        sink = LocalBlobStore(str(root))
+
+        result = export_tool.export_user(user_id, sink)
+
+        assert result['items'] == 1
+        assert not (tmp_path / 'escaped').exists()
+        assert 'user-..%2F..%2Fescaped%2Fuser/part-00000.ndjson.gz' in sink.list()
+        with pytest.raises(ValueError):
+            sink.put('../outside.json', b'{}')
+
+    def test_export_to_s3_compatible_sink(self, dynamo):
+        seed(dynamo, users=1, per_user=5)
+        with mock_s3():
+            client = boto3.client('s3', region_name='us-east-1')
+            client.create_bucket(Bucket='exports')
+
+            response = export_tool.lambda_handler({
+                'action': 'export_user',
+                'parameters': {'user_id': 'user0', 'destination': 's3://exports/requests/user0'}
+            }, None)
+
+            assert response['statusCode'] == 200
+            sink = S3BlobStore('exports', 'requests/user0', client=client)
+            assert len(list(export_tool.read_export(sink))) == 5
+            assert 'user-user0/part-00000.ndjson.gz' in sink.list()
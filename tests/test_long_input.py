@@ -0,0 +1,167 @@
+"""
+Tests for map-reduce reframing of long journal entries: sentence-aware
+chunking, belief distillation and the two-round-trip reframe path
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import long_input
+
+REFRAME_JSON = json.dumps({
+    'model_selection': ['Premortem', 'Scaling'],
+    'reframes': [
+        {'model': 'Premortem', 'reframe': 'r1', 'explanation': 'e1', 'action_steps': ['a1']},
+        {'model': 'Scaling', 'reframe': 'r2', 'explanation': 'e2', 'action_steps': ['a2']}
+    ],
+    'summary': 'Prepare, then zoom out.',
+    'follow_up': '48 hours'
+})
+
+SENTENCES = [
+    "Today started with coffee and a long commute.",
+    "My manager moved the launch up by two weeks.",
+    "I keep thinking everyone will see I am not good enough.",
+    "The weather was grey all afternoon.",
+    "If the demo fails I will lose my job."
+]
+
+
+def journal(paragraphs):
+    return "\n\n".join(" ".join(SENTENCES) for _ in range(paragraphs))
+
+
+class FakeModel:
+    """Stands in for invoke_bedrock_reframe: fixed delay per call, tracks concurrency"""
+
+    def __init__(self, delay=0.1, fail_chunks=0):
+        self.delay = delay
+        self.fail_chunks = fail_chunks
+        self.calls = []
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, system_prompt, user_input, model_id=None):
+        with self.lock:
+            self.calls.append((system_prompt, user_input))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            extraction_index = sum(1 for p, _ in self.calls if p == long_input.EXTRACTION_PROMPT)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if system_prompt != long_input.EXTRACTION_PROMPT:
+            return app.ModelOutput(REFRAME_JSON, {'input_tokens': 300, 'output_tokens': 200})
+        if extraction_index <= self.fail_chunks:
+            raise RuntimeError('ThrottlingException')
+        beliefs = [s for s in long_input.split_sentences(user_input) if ' I ' in f' {s} ']
+        return app.ModelOutput(json.dumps({'beliefs': beliefs}), {'input_tokens': 100, 'output_tokens': 20})
+
+
+def reframe(text, model):
+    with patch('app.invoke_bedrock_reframe', model), \
+            patch('app.recall_memories', return_value=[]), \
+            patch('app.store_reframe', return_value='rid'):
+        started = time.monotonic()
+        response = app.generate_reframe('alice', text, 'gentle')
+        return response, time.monotonic() - started
+
+
+class TestChunking:
+
+    def test_chunks_end_on_sentence_boundaries(self):
+        text = journal(6)
+        chunks = long_input.chunk_text(text, chunk_chars=300)
+
+        assert len(chunks) > 1
+        assert all(len(c) <= 300 for c in chunks)
+        assert all(c.endswith('.') for c in chunks)
+        assert " ".join(chunks) == " ".join(long_input.split_sentences(text))
+
+    def test_chunk_count_is_capped(self):
+        chunks = long_input.chunk_text(journal(40), chunk_chars=200, max_chunks=5)
+        assert len(chunks) <= 5
+
+    def test_overlong_sentence_splits_on_words(self):
+        chunks = long_input.chunk_text('word ' * 100, chunk_chars=50)
+        assert all(len(c) <= 50 and not c.endswith(' ') for c in chunks)
+
+
+class TestDistill:
+
+    def test_repeats_are_dropped_and_every_chunk_is_heard(self):
+        per_chunk = [['I will fail.', 'I am a fraud.', 'Nobody likes me.'],
+                     ['I will fail!', 'They will fire me.'],
+                     ['I am alone.']]
+
+        assert long_input.distill(per_chunk, limit=4) == ['I will fail.', 'I am a fraud.',
+                                                          'They will fire me.', 'I am alone.']
+
+    def test_beliefs_parse_from_surrounding_prose(self):
+        assert long_input.parse_beliefs('Sure: {"beliefs": ["I am late", " "]} done') == ['I am late']
+
+
+class TestLongReframe:
+
+    def test_result_matches_the_reframe_schema(self):
+        text = journal(4)
+        response, _ = reframe(text, FakeModel(delay=0))
+
+        assert not response.get('degraded')
+        assert response['input'] == text
+        assert response['model_selection'] == ['Premortem', 'Scaling']
+        assert 'I keep thinking everyone will see I am not good enough.' in response['distilled_beliefs']
+        assert len(response['reframes']) == 2
+
+    def test_latency_is_two_round_trips_whatever_the_length(self):
+        model = FakeModel(delay=0.2)
+        _, short_elapsed = reframe(journal(3), model)
+        model = FakeModel(delay=0.2)
+        text = journal(34)
+        assert len(text) <= long_input.LONG_INPUT_MAX_CHARS
+        _, long_elapsed = reframe(text, model)
+
+        # Every chunk's extraction is in flight at once
+        extractions = sum(1 for p, _ in model.calls if p == long_input.EXTRACTION_PROMPT)
+        assert extractions == len(long_input.chunk_text(text)) > 8
+        assert model.peak == extractions
+        assert 0.4 <= short_elapsed < 0.7
+        assert 0.4 <= long_elapsed < 0.7
+
+    def test_final_call_sees_beliefs_not_the_entry(self):
+        model = FakeModel(delay=0)
+        reframe(journal(4), model)
+
+        final_prompt, final_input = model.calls[-1]
+        assert final_prompt != long_input.EXTRACTION_PROMPT
+        assert final_input.startswith('Stuck beliefs distilled')
+        assert 'coffee' not in final_input
+
+    def test_failed_chunks_are_skipped_and_usage_adds_up(self):
+        model = FakeModel(delay=0, fail_chunks=1)
+        text = journal(8)
+        response, _ = reframe(text, model)
+
+        chunks = len(long_input.chunk_text(text))
+        extraction = response['usage']['extraction']
+        assert not response.get('degraded')
+        assert extraction['calls'] == chunks
+        assert extraction['input_tokens'] == 100 * (chunks - 1)
+        assert response['usage']['input_tokens'] == 300
+
+    def test_no_beliefs_falls_back_to_degraded(self):
+        model = FakeModel(delay=0, fail_chunks=long_input.MAX_CHUNKS)
+        response, _ = reframe(journal(4), model)
+        assert response['degraded'] is True
+
+    def test_short_input_keeps_the_single_call_path(self):
+        model = FakeModel(delay=0)
+        reframe(SENTENCES[2], model)
+        assert len(model.calls) == 1 and model.calls[0][1] == SENTENCES[2]
@@ -0,0 +1,127 @@
+"""
+Tests for the memory tool's multi-user batch recall and its request validation
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/tools'))
+
+import memory_tool
+from repository import DynamoRepository, new_reframe_item
+
+REFRAME_DATA = {
+    'model_selection': ['Premortem', 'Scaling'],
+    'reframes': [{'model': 'Premortem', 'reframe': 'r', 'explanation': 'e', 'action_steps': ['a']}],
+    'summary': 'Prepare, then zoom out.',
+    'follow_up': '48 hours'
+}
+
+
+def seed(dynamo, users=('alice', 'bob', 'carol'), per_user=6):
+    items = []
+    for user_id in users:
+        for i in range(per_user):
+            item = new_reframe_item(user_id, f'{user_id} worry {i}', REFRAME_DATA)
+            item['reframe_id'] = f'{user_id}_{i}'
+            item['created_at'] = f'2025-01-15T10:00:{i:02d}'
+            items.append(item)
+    DynamoRepository(dynamo).put_reframes(items)
+
+
+@pytest.fixture
+def memory_dynamo(dynamo):
+    with patch('memory_tool.dynamodb', dynamo):
+        seed(dynamo)
+        yield dynamo
+
+
+def invoke(requests):
+    response = memory_tool.lambda_handler({'action': 'recall_many', 'parameters': {'requests': requests}}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+class TestRecallMany:
+
+    def test_results_are_keyed_by_request(self, memory_dynamo):
+        status, body = invoke([
+            {'id': 'a', 'user_id': 'alice', 'query': 'deadline', 'top_k': 2},
+            {'user_id': 'bob', 'query': 'interview'},
+            {'id': 'c', 'user_id': 'carol', 'query': 'money', 'top_k': 1}
+        ])
+
+        assert status == 200
+        results = body['result']['results']
+        assert set(results) == {'a', '1', 'c'}
+        assert [m['id'] for m in results['a']] == ['alice_5', 'alice_4']
+        assert [m['id'] for m in results['1']] == ['bob_5', 'bob_4', 'bob_3']
+        assert results['c'][0]['input'] == 'carol worry 5'
+
+    def test_requests_for_one_user_share_a_query(self, memory_dynamo):
+        with patch.object(DynamoRepository, 'recent_reframes', autospec=True,
+                          side_effect=DynamoRepository.recent_reframes) as spy:
+            status, body = invoke([
+                {'id': 'x', 'user_id': 'alice', 'query': 'deadline', 'top_k': 2},
+                {'id': 'y', 'user_id': 'alice', 'query': 'manager', 'top_k': 4},
+                {'id': 'z', 'user_id': 'bob', 'query': 'deadline', 'top_k': 2}
+            ])
+
+        assert spy.call_count == 2 and body['result']['queries'] == 2
+        results = body['result']['results']
+        assert results['x'] == results['y'][:2]
+        assert len(results['y']) == 4
+
+    def test_queries_run_concurrently_within_the_bound(self, memory_dynamo):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def slow_recent(self, user_id, limit=5, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.2)
+            with lock:
+                active[0] -= 1
+            return []
+
+        requests = [{'user_id': f'user{i}', 'query': 'q'} for i in range(memory_tool.RECALL_MANY_CONCURRENCY)]
+        with patch.object(DynamoRepository, 'recent_reframes', slow_recent):
+            started = time.monotonic()
+            status, body = invoke(requests + [{'user_id': 'one_more', 'query': 'q'}])
+            elapsed = time.monotonic() - started
+
+        assert status == 200 and len(body['result']['results']) == len(requests) + 1
+        assert peak[0] == memory_tool.RECALL_MANY_CONCURRENCY
+        # Two waves of 0.2s, not nine sequential queries
+        assert elapsed < 0.8
+
+    def test_one_failing_user_does_not_fail_the_batch(self, memory_dynamo):
+        real = DynamoRepository.recent_reframes
+
+        def flaky(self, user_id, *args, **kwargs):
+            if user_id == 'bob':
+                raise RuntimeError('throttled')
+            return real(self, user_id, *args, **kwargs)
+
+        with patch.object(DynamoRepository, 'recent_reframes', flaky):
+            status, body = invoke([{'id': 'a', 'user_id': 'alice'}, {'id': 'b', 'user_id': 'bob'}])
+
+        assert status == 200
+        assert len(body['result']['results']['a']) == 3
+        assert body['result']['errors'] == {'b': 'throttled'}
+
+    @pytest.mark.parametrize('requests', [[], [{'query': 'no user'}], [{'id': 'a', 'user_id': 'u'}] * 2,
+                                          [{'user_id': 'u', 'top_k': 0}], [{'user_id': 'u', 'top_k': 'many'}]])
+    def test_invalid_requests_are_rejected(self, requests):
+        status, body = invoke(requests)
+        assert status == 400 and 'error' in body
+
+    def test_top_k_is_capped(self, memory_dynamo):
+        with patch.object(DynamoRepository, 'recent_reframes', autospec=True, return_value=[]) as spy:
+            status, _ = invoke([{'user_id': 'alice', 'top_k': 10 ** 6}])
+        assert status == 200 and spy.call_args.kwargs['limit'] == memory_tool.RECALL_MAX_TOP_K
@@ -0,0 +1,239 @@
+"""
+Tests for near-duplicate thought detection: MinHash/LSH quality, the index
+on both repository backends, the reframe path, and lookup cost vs history size
+"""
+
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import pytest
+from unittest.mock import patch
+from botocore.exceptions import EndpointConnectionError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import near_duplicate
+import stream_consumer
+from repository import DynamoRepository, SqliteRepository, new_reframe_item
+
+with open(os.path.join(os.path.dirname(__file__), 'paraphrase_fixtures.json')) as f:
+    FIXTURES = json.load(f)
+
+REFRAME_DATA = {
+    'model_selection': ['Premortem', 'Scaling'],
+    'reframes': [{'model': 'Premortem', 'reframe': 'Imagine it went badly.',
+                  'explanation': 'Finds risks.', 'action_steps': ['List 3 things that could go wrong']},
+                 {'model': 'Scaling', 'reframe': 'Will this matter in 6 months?',
+                  'explanation': 'Zooms out.', 'action_steps': ['Write down one learning goal']}],
+    'summary': 'Prepare, then zoom out.',
+    'follow_up': '48 hours'
+}
+
+
+def make_reframe(user_id, i, text):
+    item = new_reframe_item(user_id, text, REFRAME_DATA, tone='gentle')
+    item['reframe_id'] = f'{user_id}_{i:05d}'
+    item['created_at'] = f'2025-01-15T10:00:00.{i:06d}'
+    return item
+
+
+def labelled_fixtures():
+    texts = [(text, group) for group, paraphrases in enumerate(FIXTURES['groups']) for text in paraphrases]
+    texts += [(text, f'distinct-{i}') for i, text in enumerate(FIXTURES['distinct'])]
+    return texts
+
+
+class TestSignatures:
+
+    def test_precision_and_recall_on_paraphrases(self):
+        """Pairs flagged by LSH banding plus the similarity threshold vs the labelled groups"""
+        texts = labelled_fixtures()
+        signatures = [near_duplicate.signature(text) for text, _ in texts]
+        bands = [set(near_duplicate.band_keys(s)) for s in signatures]
+
+        true_positives = false_positives = false_negatives = 0
+        for i, j in itertools.combinations(range(len(texts)), 2):
+            same = texts[i][1] == texts[j][1]
+            flagged = bool(bands[i] & bands[j]) and \
+                near_duplicate.similarity(signatures[i], signatures[j]) >= near_duplicate.NEAR_DUPLICATE_THRESHOLD
+            true_positives += flagged and same
+            false_positives += flagged and not same
+            false_negatives += same and not flagged
+
+        precision = true_positives / (true_positives + false_positives)
+        recall = true_positives / (true_positives + false_negatives)
+        print(f"precision {precision:.2f}, recall {recall:.2f} over {len(texts)} thoughts")
+        assert precision >= 0.95
+        assert recall >= 0.85
+
+    def test_signature_round_trip_and_stability(self):
+        values = near_duplicate.signature("I'm worried my presentation tomorrow will go badly")
+        assert len(values) == near_duplicate.NUM_PERM
+        assert near_duplicate.decode_signature(near_duplicate.encode_signature(values)) == values
+        assert near_duplicate.signature("I'm WORRIED my presentation tomorrow will go badly!") == values
+        assert near_duplicate.decode_signature('not base64 at all') is None
+        assert near_duplicate.decode_signature(None) is None
+
+    def test_items_carry_their_signature(self):
+        item = new_reframe_item('alice', 'The launch will fail', REFRAME_DATA)
+        stored = near_duplicate.decode_signature(item[near_duplicate.SIGNATURE_ATTRIBUTE])
+        assert stored == near_duplicate.signature('The launch will fail')
+
+
+@pytest.fixture(params=['dynamodb', 'sqlite'])
+def indexed_repo(request, dynamo, tmp_path):
+    """Repository whose put_reframes also maintains the index, as deployed"""
+    if request.param == 'sqlite':
+        return SqliteRepository(str(tmp_path / 'reframer.db'))
+
+    repo = DynamoRepository(dynamo)
+    put_reframes = repo.put_reframes
+
+    def put_and_index(items):
+        # In AWS the stream consumer indexes inserts; run it inline here
+        put_reframes(items)
+        with patch.object(stream_consumer, 'dynamodb', dynamo):
+            stream_consumer.index_near_duplicates(items)
+
+    repo.put_reframes = put_and_index
+    return repo
+
+
+class TestIndexContract:
+
+    def test_finds_paraphrase_and_ignores_unrelated(self, indexed_repo):
+        group = FIXTURES['groups'][1]
+        indexed_repo.put_reframes([make_reframe('alice', 0, group[0])] + [
+            make_reframe('alice', i + 1, text) for i, text in enumerate(FIXTURES['distinct'])
+        ])
+
+        match = near_duplicate.find_near_duplicate(indexed_repo, 'alice', group[1])
+        assert match['reframe_id'] == 'alice_00000'
+        assert match['similarity'] >= near_duplicate.NEAR_DUPLICATE_THRESHOLD
+        assert match['reframes'][0]['model'] == 'Premortem'
+
+        assert near_duplicate.find_near_duplicate(indexed_repo, 'alice', 'I lost my keys at the gym') is None
+
+    def test_index_is_per_user(self, indexed_repo):
+        indexed_repo.put_reframes([make_reframe('alice', 0, FIXTURES['groups'][0][0])])
+        assert near_duplicate.find_near_duplicate(indexed_repo, 'bob', FIXTURES['groups'][0][0]) is None
+
+    def test_most_similar_wins_and_projection_drops_signature(self, indexed_repo):
+        indexed_repo.put_reframes([
+            make_reframe('alice', 0, 'worried the presentation tomorrow goes badly'),
+            make_reframe('alice', 1, "I'm worried my presentation tomorrow will go badly"),
+        ])
+        match = near_duplicate.find_near_duplicate(
+            indexed_repo, 'alice', "I'm worried my presentation tomorrow will go badly",
+            projection=['reframe_id', 'source_input']
+        )
+        assert match['reframe_id'] == 'alice_00001' and match['similarity'] == 1.0
+        assert set(match) == {'reframe_id', 'source_input', 'similarity'}
+
+    def test_candidates_are_capped(self, indexed_repo):
+        text = FIXTURES['groups'][2][0]
+        indexed_repo.put_reframes([make_reframe('alice', i, text) for i in range(40)])
+        candidates = indexed_repo.near_duplicate_candidates(
+            'alice', near_duplicate.band_keys(near_duplicate.signature(text))
+        )
+        assert len(candidates) == 25
+
+
+class TestReframePath:
+
+    @pytest.fixture
+    def sqlite_app(self, tmp_path):
+        url = f"sqlite://{tmp_path / 'reframer.db'}"
+        with patch.object(app, 'STORAGE_URL', url), patch.object(app, 'NEAR_DUPLICATE_LOOKUP', True):
+            yield url
+
+    def model_calls(self):
+        calls = []
+
+        def model(system_prompt, user_input, model_id=None):
+            calls.append(system_prompt)
+            return json.dumps(REFRAME_DATA)
+        return calls, model
+
+    def test_repeat_reuses_earlier_reframe_without_model(self, sqlite_app):
+        calls, model = self.model_calls()
+        text = FIXTURES['groups'][0][0]
+        with patch('app.invoke_bedrock_reframe', side_effect=model):
+            first = app.generate_reframe('alice', text, 'gentle')
+            second = app.generate_reframe('alice', text + '!', 'gentle')
+
+        assert len(calls) == 1
+        assert second['reused'] is True
+        assert second['reframe_id'] == first['reframe_id']
+        assert second['previously_worked_on']['similarity'] == 1.0
+        assert len(second['reframes']) == 2
+        assert len(app.repository().recent_reframes('alice')) == 1
+
+    def test_paraphrase_adapts_with_earlier_reframe_in_context(self, sqlite_app):
+        calls, model = self.model_calls()
+        group = FIXTURES['groups'][2]  # similar (about 0.6) but not a repeat
+        with patch('app.invoke_bedrock_reframe', side_effect=model):
+            first = app.generate_reframe('alice', group[0], 'gentle')
+            second = app.generate_reframe('alice', group[2], 'gentle')
+
+        assert len(calls) == 2
+        assert 'reused' not in second
+        assert second['previously_worked_on']['reframe_id'] == first['reframe_id']
+        assert f"Input: {group[0]}" in calls[1]
+
+    def test_different_tone_or_degraded_answer_is_not_reused(self):
+        previous = {'similarity': 1.0, 'tone': 'gentle', 'reframes': REFRAME_DATA['reframes']}
+        assert app.can_reuse(previous, 'gentle')
+        assert not app.can_reuse(previous, 'direct')
+        assert not app.can_reuse(dict(previous, degraded=True), 'gentle')
+        assert not app.can_reuse(dict(previous, similarity=0.6), 'gentle')
+
+    def test_lookup_connection_error_does_not_fail_reframe(self, sqlite_app):
+        calls, model = self.model_calls()
+        error = EndpointConnectionError(endpoint_url='https://dynamodb.us-east-1.amazonaws.com')
+        with patch('near_duplicate.find_near_duplicate', side_effect=error), \
+                patch('app.invoke_bedrock_reframe', side_effect=model):
+            result = app.generate_reframe('alice', FIXTURES['groups'][0][0], 'gentle')
+        assert len(calls) == 1 and 'previously_worked_on' not in result
+
+
+def synthetic_thought(rng):
+    return ' '.join(f"topic{rng.randrange(5000)}" for _ in range(6))
+
+
+def test_lookup_cost_is_flat_in_history_size(tmp_path):
+    """
+    Benchmark: mean lookup time against history size on SQLite,
+    compared with a linear scan of every stored signature
+    """
+    rng = random.Random(7)
+    queries = [text for group in FIXTURES['groups'] for text in group]
+    timings = {}
+    for size in (100, 1000, 10000):
+        repo = SqliteRepository(str(tmp_path / f'history-{size}.db'))
+        items = [make_reframe('alice', i, synthetic_thought(rng)) for i in range(size)]
+        items += [make_reframe('alice', size + i, group[0]) for i, group in enumerate(FIXTURES['groups'])]
+        repo.put_reframes(items)
+
+        started = time.perf_counter()
+        for text in queries:
+            near_duplicate.find_near_duplicate(repo, 'alice', text, projection=['reframe_id'])
+        lookup = (time.perf_counter() - started) / len(queries)
+
+        stored = [near_duplicate.decode_signature(i['minhash'])
+                  for i in repo.recent_reframes('alice', limit=size + 100, projection=['minhash'])]
+        started = time.perf_counter()
+        for text in queries[:5]:
+            values = near_duplicate.signature(text)
+            max(near_duplicate.similarity(values, s) for s in stored)
+        scan = (time.perf_counter() - started) / 5
+
+        timings[size] = lookup
+        print(f"history {size:>6}: LSH lookup {lookup * 1000:.2f} ms, linear scan {scan * 1000:.2f} ms")
+        repo.close()
+
+    assert timings[10000] < 3 * timings[100]
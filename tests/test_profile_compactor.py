@@ -0,0 +1,155 @@
+"""
+Tests for long-term profile compaction and the bounded prompt section
+"""
+
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import profile_compactor
+import stream_consumer
+
+
+def make_item(i, user_id='test_user', text=None, models=None, steps=None):
+    return {
+        'reframe_id': f'{user_id}_{i}',
+        'user_id': user_id,
+        'user_shard': user_id,
+        'source_input': text or f'Worried about the deadline and my manager, topic{i}',
+        'models_used': models or ['Premortem', 'Scaling'],
+        'reframes': [
+            {'model': 'Premortem', 'reframe': 'r', 'explanation': 'e',
+             'action_steps': steps or ['List 3 risks for 10 minutes', f'Unique step {i}']},
+            {'model': 'Scaling', 'reframe': 'r', 'explanation': 'e',
+             'action_steps': ['Write one learning goal']}
+        ],
+        'created_at': f'2025-01-01T00:{i // 60:02d}:{i % 60:02d}'
+    }
+
+
+def stream_record(item, event_name='INSERT'):
+    from boto3.dynamodb.types import TypeSerializer
+    serializer = TypeSerializer()
+    return {
+        'eventName': event_name,
+        'dynamodb': {'NewImage': {k: serializer.serialize(v) for k, v in item.items()}}
+    }
+
+
+class TestFold:
+    """Pure folding logic"""
+
+    def test_counts_models_themes_and_steps(self):
+        summary = profile_compactor.empty_summary()
+        for i in range(3):
+            profile_compactor.fold_reframe(summary, make_item(i))
+
+        assert summary['reframe_count'] == 3
+        assert summary['model_counts'] == {'Premortem': 3, 'Scaling': 3}
+        assert summary['themes']['deadline'] == 3
+        assert summary['action_steps']['write one learning goal'] == 3
+        assert summary['action_steps']['list risks for minutes'] == 3
+
+    def test_refolding_same_item_is_ignored(self):
+        summary = profile_compactor.empty_summary()
+        item = make_item(1)
+        assert profile_compactor.fold_reframe(summary, item) is True
+        assert profile_compactor.fold_reframe(summary, item) is False
+        assert summary['reframe_count'] == 1
+
+    def test_out_of_order_item_is_folded(self):
+        summary = profile_compactor.empty_summary()
+        for i in (1, 3, 2):
+            assert profile_compactor.fold_reframe(summary, make_item(i)) is True
+        assert profile_compactor.fold_reframe(summary, make_item(2)) is False
+
+        assert summary['reframe_count'] == 3
+        assert summary['last_reframe_at'] == make_item(3)['created_at']
+
+    def test_legacy_summary_keeps_its_watermark(self):
+        summary = profile_compactor.empty_summary()
+        del summary['recent_reframe_ids']
+        summary['last_reframe_at'] = make_item(5)['created_at']
+
+        assert profile_compactor.fold_reframe(summary, make_item(5)) is False
+        assert profile_compactor.fold_reframe(summary, make_item(6)) is True
+        assert summary['recent_reframe_ids'] == ['test_user_6']
+
+    def test_summary_size_is_bounded(self):
+        summary = profile_compactor.empty_summary()
+        for i in range(500):
+            profile_compactor.fold_reframe(summary, make_item(i))
+
+        assert summary['reframe_count'] == 500
+        assert len(summary['themes']) <= profile_compactor.THEME_CAPACITY
+        assert len(summary['action_steps']) <= profile_compactor.ACTION_CAPACITY
+        assert summary['recent_reframe_ids'][-1] == 'test_user_499'
+        assert len(summary['recent_reframe_ids']) == profile_compactor.RECENT_ID_CAPACITY
+        # Recurring entries survive eviction of one-off entries
+        assert 'deadline' in summary['themes']
+        assert 'write one learning goal' in summary['action_steps']
+
+
+class TestPromptSection:
+    """Profile rendering in build_system_prompt"""
+
+    def test_prompt_includes_profile(self):
+        summary = profile_compactor.empty_summary()
+        for i in range(5):
+            profile_compactor.fold_reframe(summary, make_item(i))
+
+        prompt = app.build_system_prompt('gentle', [], summary)
+        assert 'Long-term profile (5 past reframes)' in prompt
+        assert 'deadline' in prompt
+        assert 'Premortem x5' in prompt
+
+    def test_prompt_size_independent_of_history_length(self):
+        small = profile_compactor.empty_summary()
+        large = profile_compactor.empty_summary()
+        for i in range(10):
+            profile_compactor.fold_reframe(small, make_item(i))
+        for i in range(2000):
+            profile_compactor.fold_reframe(large, make_item(i))
+
+        small_prompt = app.build_system_prompt('gentle', [], small)
+        large_prompt = app.build_system_prompt('gentle', [], large)
+        assert abs(len(large_prompt) - len(small_prompt)) < 100
+
+    def test_prompt_without_profile_unchanged(self):
+        assert app.build_system_prompt('gentle', [], None) == app.build_system_prompt('gentle', [])
+
+
+class TestStreamCompaction:
+    """Stream consumer against the local DynamoDB stand-in"""
+
+    def test_stream_batch_updates_user_profile(self, dynamo):
+        records = [stream_record(make_item(i)) for i in range(4)]
+        records.append(stream_record(make_item(99, user_id='other_user')))
+        records.append({'eventName': 'REMOVE', 'dynamodb': {}})
+
+        with patch('profile_compactor.dynamodb', dynamo), patch('usage_stats.dynamodb', dynamo):
+            stream_consumer.lambda_handler({'Records': records}, None)
+            # Redelivery of the same batch must not double count
+            stream_consumer.lambda_handler({'Records': records}, None)
+
+        users = dynamo.Table('CognitiveReframer-Users')
+        item = users.get_item(Key={'user_id': 'test_user'})['Item']
+        assert item['profile_summary']['reframe_count'] == 4
+        assert item['profile_summary']['model_counts']['Premortem'] == 4
+        other = users.get_item(Key={'user_id': 'other_user'})['Item']
+        assert other['profile_summary']['reframe_count'] == 1
+
+    def test_rebuild_profile_from_history(self, dynamo):
+        reframes = dynamo.Table('CognitiveReframer-Reframes')
+        for i in range(7):
+            reframes.put_item(Item=make_item(i))
+
+        with patch('profile_compactor.dynamodb', dynamo):
+            stream_consumer.lambda_handler({'action': 'rebuild_profiles', 'user_ids': ['test_user']}, None)
+
+        with patch('app.dynamodb', dynamo):
+            summary = app.load_profile_summary('test_user')
+        assert summary['reframe_count'] == 7
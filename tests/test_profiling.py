@@ -0,0 +1,140 @@
+"""
+Tests for sampled handler profiling: sampling triggers, artifact contents and
+size cap, and merging profiles with the summarize CLI
+"""
+
+import gzip
+import json
+import os
+import pstats
+import sys
+import time
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/tools'))
+
+import profiling
+import schedule_tool
+from blob_store import LocalBlobStore
+
+
+retained = []
+
+
+def busy_handler(event, context):
+    """Something to see in the profile: CPU in one function, memory kept past the request in another"""
+    retained.append(allocate())
+    return {'statusCode': 200, 'body': json.dumps({'total': crunch()})}
+
+
+def crunch():
+    return sum(i * i for i in range(200000))
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(500)]
+
+
+@pytest.fixture
+def profile_dir(tmp_path):
+    with patch.object(profiling, '_store', LocalBlobStore(str(tmp_path))):
+        yield tmp_path
+
+
+def artifacts(root):
+    return profiling.load_artifacts(str(root))
+
+
+class TestSampling:
+
+    def test_unsampled_calls_go_straight_through(self, profile_dir):
+        calls = []
+        handler = profiling.profiled('reframe')(lambda event, context: calls.append(event) or 'ok')
+
+        with patch.object(profiling, 'PROFILE_SAMPLE_RATE', 0), \
+                patch.object(profiling.cProfile, 'Profile', side_effect=AssertionError('profiled')):
+            started = time.perf_counter()
+            for i in range(20000):
+                handler({'body': '{}'}, None)
+            per_call = (time.perf_counter() - started) / 20000
+
+        assert len(calls) == 20000 and artifacts(profile_dir) == []
+        assert per_call < 20e-6
+
+    def test_sampled_call_writes_profile_and_allocations(self, profile_dir):
+        retained.clear()
+        handler = profiling.profiled('reframe')(busy_handler)
+        with patch.object(profiling, 'PROFILE_SAMPLE_RATE', 1.0):
+            response = handler({'body': '{}'}, None)
+
+        assert response['statusCode'] == 200
+        [artifact] = artifacts(profile_dir)
+        assert artifact['handler'] == 'reframe' and artifact['duration_ms'] > 0
+        assert 'crunch' in {row[2] for row in artifact['functions']}
+        assert any('test_profiling.py' in a['where'] and a['size_bytes'] >= 500 * 1024
+                   for a in artifact['allocations'])
+        assert not profiling.tracemalloc.is_tracing()
+
+    def test_header_token_forces_a_profile(self, profile_dir):
+        handler = profiling.profiled('memory_tool')(busy_handler)
+        with patch.object(profiling, 'PROFILE_SAMPLE_RATE', 0), patch.object(profiling, 'PROFILE_TOKEN', 's3cret'):
+            handler({'headers': {'x-profile': 'wrong'}}, None)
+            assert artifacts(profile_dir) == []
+            handler({'headers': {'X-Profile': 's3cret'}}, None)
+
+        assert [a['handler'] for a in artifacts(profile_dir)] == ['memory_tool']
+
+    def test_header_is_ignored_without_a_token(self):
+        assert not profiling.requested({'headers': {'X-Profile': ''}})
+
+    def test_failing_handler_is_still_profiled(self, profile_dir):
+        def failing(event, context):
+            crunch()
+            raise RuntimeError('boom')
+
+        with patch.object(profiling, 'PROFILE_SAMPLE_RATE', 1.0):
+            with pytest.raises(RuntimeError):
+                profiling.profiled('reframe')(failing)({}, None)
+        assert len(artifacts(profile_dir)) == 1
+
+    def test_tool_handlers_are_wrapped(self, profile_dir):
+        with patch.object(profiling, 'PROFILE_SAMPLE_RATE', 1.0):
+            response = schedule_tool.lambda_handler({'parameters': {}}, None)
+
+        assert response['statusCode'] == 500
+        assert [a['handler'] for a in artifacts(profile_dir)] == ['schedule_tool']
+
+
+class TestArtifacts:
+
+    def test_artifact_is_capped_by_dropping_cheap_functions(self):
+        artifact = {'handler': 'reframe', 'allocations': [],
+                    'functions': [[f'/var/task/module_{i}.py', i, f'function_{i}', 1, 1, 0.001, 1.0 / (i + 1)]
+                                  for i in range(5000)]}
+
+        data = profiling.encode_artifact(artifact, max_bytes=4096)
+        decoded = json.loads(gzip.decompress(data))
+
+        assert len(data) <= 4096
+        assert decoded['functions_dropped'] > 0
+        assert decoded['functions'][0][2] == 'function_0'
+
+    def test_summarize_merges_profiles(self, profile_dir, tmp_path, capsys):
+        handler = profiling.profiled('reframe')(busy_handler)
+        with patch.object(profiling, 'PROFILE_SAMPLE_RATE', 1.0):
+            for _ in range(3):
+                handler({}, None)
+
+        merged = profiling.merge(artifacts(profile_dir))
+        crunch_stats = [v for (filename, line, function), v in merged['functions'].items() if function == 'crunch']
+        assert merged['profiles'] == 3 and crunch_stats[0][4] == 3
+
+        output = str(tmp_path / 'merged.prof')
+        assert profiling.main(['summarize', str(profile_dir), '--handler', 'reframe', '--output', output]) == 0
+        summary = capsys.readouterr().out
+        assert '3 profiles' in summary and 'crunch' in summary
+        assert any(function == 'crunch' for _, _, function in pstats.Stats(output).stats)
+
+    def test_summarize_without_profiles(self, tmp_path, capsys):
+        assert profiling.main(['summarize', str(tmp_path)]) == 1
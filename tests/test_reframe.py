@@ -97,7 +97,7 @@ class TestReframeHandler:
             'body': json.dumps({
                 'action': 'reframe',
                 'user_id': 'test_user',
-                'input': 'x' * 600,  # Exceeds 500 char limit
+                'input': 'x' * 8001,  # Exceeds the long-entry limit
                 'tone': 'gentle'
             })
         }
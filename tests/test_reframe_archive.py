@@ -0,0 +1,169 @@
+"""
+Tests for the TTL archive tier and history paging into it
+"""
+
+import gzip
+import json
+import os
+import sys
+import pytest
+from unittest.mock import patch
+from boto3.dynamodb.types import TypeSerializer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import reframe_archive
+import stream_consumer
+from blob_store import LocalBlobStore
+from reframe_codec import pack_item
+
+TTL_IDENTITY = {'type': 'Service', 'principalId': 'dynamodb.amazonaws.com'}
+
+
+def make_item(i, user_id='alice', month='2025-01'):
+    return {
+        'reframe_id': f'{user_id}_{month}_{i:03d}',
+        'user_id': user_id,
+        'user_shard': user_id,
+        'source_input': f'thought {i}',
+        'models_used': ['Premortem', 'Scaling'],
+        'reframes': [{'model': 'Premortem', 'reframe': 'r', 'explanation': 'e', 'action_steps': ['a']}],
+        'created_at': f'{month}-{1 + i // 24:02d}T{i % 24:02d}:00:00',
+        'ttl': 1700000000
+    }
+
+
+def remove_record(item, identity=TTL_IDENTITY):
+    serializer = TypeSerializer()
+    record = {
+        'eventName': 'REMOVE',
+        'dynamodb': {'OldImage': {k: serializer.serialize(v) for k, v in item.items()}}
+    }
+    if identity:
+        record['userIdentity'] = identity
+    return record
+
+
+@pytest.fixture
+def archive(tmp_path):
+    with patch.object(reframe_archive, 'ARCHIVE_URI', str(tmp_path)):
+        yield LocalBlobStore(str(tmp_path))
+
+
+class TestArchiveWriter:
+    """Stream and sweep archival"""
+
+    def test_ttl_deletes_are_archived_by_partition(self, archive):
+        items = [make_item(i) for i in range(3)] + [make_item(0, month='2024-12'), make_item(0, user_id='bob')]
+        records = [remove_record(pack_item(item)) for item in items]
+        # Application deletes must not be archived
+        records.append(remove_record(make_item(50), identity={'type': 'User', 'principalId': 'admin'}))
+
+        with patch('profile_compactor.dynamodb'), patch('usage_stats.dynamodb'):
+            stream_consumer.lambda_handler({'Records': records}, None)
+
+        keys = archive.list('user_hash=')
+        alice = reframe_archive.partition_prefix('alice')
+        assert len([k for k in keys if k.startswith(alice + 'month=2025-01/')]) == 1
+        assert len([k for k in keys if k.startswith(alice + 'month=2024-12/')]) == 1
+        assert len([k for k in keys if k.startswith(reframe_archive.partition_prefix('bob'))]) == 1
+
+        # Compact items are archived decoded
+        first = json.loads(gzip.decompress(archive.get(keys[0])).splitlines()[0])
+        assert 'reframes' in first and 'reframes_z' not in first
+
+    def test_disabled_without_uri(self):
+        with patch.object(reframe_archive, 'ARCHIVE_URI', ''):
+            assert reframe_archive.process_records([remove_record(make_item(0))], stream_consumer.deserialize_image) == 0
+
+    def test_sweep_archives_expiring_items(self, archive, dynamo):
+        table = dynamo.Table('CognitiveReframer-Reframes')
+        for i in range(5):
+            table.put_item(Item=make_item(i))
+        fresh = make_item(9)
+        fresh['ttl'] = 4102444800  # 2100
+        table.put_item(Item=fresh)
+
+        with patch.object(reframe_archive, 'dynamodb', dynamo):
+            assert reframe_archive.sweep_expiring(batch_size=2) == 5
+            parts = archive.list('user_hash=')
+            # Swept items are marked and skipped from then on
+            assert reframe_archive.sweep_expiring(batch_size=2) == 0
+        assert archive.list('user_hash=') == parts
+        assert 'archived_at' in table.get_item(Key={'reframe_id': make_item(0)['reframe_id']})['Item']
+        assert 'archived_at' not in table.get_item(Key={'reframe_id': fresh['reframe_id']})['Item']
+
+    def test_items_expired_during_the_sweep_are_not_recreated(self, archive, dynamo):
+        table = dynamo.Table('CognitiveReframer-Reframes')
+        item = make_item(0)
+        with patch.object(reframe_archive, 'dynamodb', dynamo):
+            reframe_archive.mark_archived(table, [item])
+        assert 'Item' not in table.get_item(Key={'reframe_id': item['reframe_id']})
+
+
+class TestArchiveReads:
+    """History paging from hot table into the archive"""
+
+    def test_read_archived_newest_first_with_cursor(self, archive):
+        reframe_archive.archive_items([make_item(i, month='2024-11') for i in range(10)])
+        reframe_archive.archive_items([make_item(i, month='2024-12') for i in range(10)])
+
+        page = reframe_archive.read_archived('alice', limit=5)
+        assert [i['created_at'][:7] for i in page] == ['2024-12'] * 5
+        assert page == sorted(page, key=lambda i: i['created_at'], reverse=True)
+
+        older = reframe_archive.read_archived('alice', before=page[-1]['created_at'], limit=10)
+        assert len(older) == 10
+        assert all(i['created_at'] < page[-1]['created_at'] for i in older)
+
+    def test_user_page_reads_only_that_users_rows(self, archive):
+        # Another user in alice's hash bucket, archived in the same parts
+        neighbour = next(f'user{i}' for i in range(10000)
+                         if reframe_archive.user_hash(f'user{i}') == reframe_archive.user_hash('alice'))
+        reframe_archive.archive_items([make_item(i, user_id=u) for i in range(40) for u in ('alice', neighbour)])
+
+        read_bytes = []
+        get_range = archive.get_range
+
+        def spy(key, start, length):
+            data = get_range(key, start, length)
+            read_bytes.append(data)
+            return data
+
+        with patch.object(archive, 'get', side_effect=AssertionError('whole object read')), \
+                patch.object(archive, 'get_range', side_effect=spy):
+            page = reframe_archive.read_archived('alice', limit=10, store=archive)
+
+        assert len(page) == 10 and {i['user_id'] for i in page} == {'alice'}
+        assert neighbour.encode() not in gzip.decompress(b''.join(read_bytes))
+        # The part itself stays one gzip stream with everyone's rows for bulk readers
+        part = archive.list(reframe_archive.partition_prefix('alice'))[0]
+        assert len(gzip.decompress(archive.get(part)).splitlines()) == 80
+
+    def test_parts_written_before_pointers_are_indexed(self, archive):
+        legacy = gzip.compress(b''.join(json.dumps(make_item(i)).encode() + b'\n' for i in range(3)))
+        archive.put(reframe_archive.partition_prefix('alice', '2024-10') + 'part-1-legacy.ndjson.gz', legacy)
+        assert reframe_archive.read_archived('alice') == []
+
+        assert reframe_archive.index_existing() == 1
+        assert reframe_archive.index_existing() == 1
+        assert len(reframe_archive.read_archived('alice')) == 3
+
+    def test_history_pages_into_archive(self, archive, dynamo):
+        table = dynamo.Table('CognitiveReframer-Reframes')
+        for i in range(15):
+            table.put_item(Item=make_item(i, month='2025-03'))
+        reframe_archive.archive_items([make_item(i, month='2024-12') for i in range(30)])
+        # An item archived by the sweep while still hot is not duplicated
+        reframe_archive.archive_items([make_item(0, month='2025-03')])
+
+        with patch('app.dynamodb', dynamo):
+            first = app.handle_history('alice')
+            second = app.handle_history('alice', before=first['next_before'])
+
+        assert len(first['history']) == 20
+        assert [i['created_at'][:7] for i in first['history']].count('2025-03') == 15
+        assert len({i['reframe_id'] for i in first['history']}) == 20
+        assert len(second['history']) == 20
+        assert all(i['created_at'] < first['next_before'] for i in second['history'])
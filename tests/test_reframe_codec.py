@@ -0,0 +1,108 @@
+"""
+Tests for the compact binary reframes storage format
+"""
+
+import json
+import os
+import sys
+import pytest
+from unittest.mock import patch
+from boto3.dynamodb.types import TypeSerializer, Binary
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/tools'))
+
+import app
+import memory_tool
+import reframe_codec
+import stream_consumer
+
+with open(os.path.join(os.path.dirname(__file__), 'mock_responses.json')) as f:
+    FIXTURES = json.load(f)
+
+
+class TestCodec:
+    """Encoding and decoding"""
+
+    @pytest.mark.parametrize('name', sorted(FIXTURES))
+    def test_round_trip_fixtures(self, name):
+        reframes = FIXTURES[name]['reframes']
+        blob = reframe_codec.encode_reframes(reframes)
+
+        assert blob[0] == reframe_codec.FORMAT_VERSION
+        assert reframe_codec.decode_reframes(blob) == reframes
+        assert reframe_codec.decode_reframes(Binary(blob)) == reframes
+
+    def test_extra_keys_survive(self):
+        reframes = [{'model': 'Scaling', 'reframe': 'r', 'explanation': 'e',
+                     'action_steps': ['a'], 'confidence': 0.8}]
+        assert reframe_codec.decode_reframes(reframe_codec.encode_reframes(reframes)) == reframes
+
+    def test_unknown_version_rejected(self):
+        blob = bytearray(reframe_codec.encode_reframes([]))
+        blob[0] = 99
+        with pytest.raises(ValueError, match="Unsupported reframes format version"):
+            reframe_codec.decode_reframes(bytes(blob))
+
+    def test_old_format_items_pass_through(self):
+        item = {'reframe_id': 'r1', 'reframes': FIXTURES['procrastination']['reframes']}
+        assert reframe_codec.unpack_item(item) is item
+
+    def test_fixtures_fit_in_one_wcu(self):
+        report = reframe_codec.savings_report(FIXTURES)
+        for row in report:
+            assert row['compact_bytes'] < row['plain_bytes'] * 0.75
+            assert row['compact']['wcu'] <= row['plain']['wcu']
+            assert row['compact_bytes'] <= 1024
+
+
+class TestTransparentDecoding:
+    """Readers accept both formats"""
+
+    def store_mixed(self, dynamo):
+        reframe_data = FIXTURES['successful_reframe']
+        with patch('app.dynamodb', dynamo):
+            with patch.dict(os.environ, {'COMPACT_STORAGE': 'true'}):
+                app.store_reframe('alice', reframe_data['input'], reframe_data)
+            with patch.dict(os.environ, {'COMPACT_STORAGE': 'false'}):
+                app.store_reframe('alice', 'second thought', reframe_data)
+
+    def test_compact_items_are_stored_binary(self, dynamo):
+        self.store_mixed(dynamo)
+        items = dynamo.Table('CognitiveReframer-Reframes').scan()['Items']
+        compact = [i for i in items if 'reframes_z' in i]
+        assert len(compact) == 1
+        assert 'reframes' not in compact[0]
+
+    def test_history_and_recall_decode_both_formats(self, dynamo):
+        self.store_mixed(dynamo)
+        expected = FIXTURES['successful_reframe']['reframes']
+
+        with patch('app.dynamodb', dynamo):
+            history = app.handle_history('alice')['history']
+            recalled = app.recall_memories('alice', 'anything')
+
+        assert len(history) == 2
+        assert all(item['reframes'] == expected for item in history)
+        assert all('reframes_z' not in item for item in history + recalled)
+
+    def test_memory_tool_store_and_recall(self, dynamo):
+        with patch('memory_tool.dynamodb', dynamo), patch.dict(os.environ, {'COMPACT_STORAGE': 'true'}):
+            memory_tool.memory_store({'user_id': 'bob', 'reframe_data': FIXTURES['imposter_syndrome']})
+            memories = memory_tool.memory_recall({'user_id': 'bob', 'top_k': 3})
+
+        assert memories[0]['input'] == FIXTURES['imposter_syndrome']['input']
+        stored = dynamo.Table('CognitiveReframer-Reframes').scan()['Items'][0]
+        assert reframe_codec.unpack_item(stored)['reframes'] == FIXTURES['imposter_syndrome']['reframes']
+
+    def test_stream_images_are_decoded(self):
+        item = reframe_codec.pack_item({
+            'reframe_id': 'r1', 'user_id': 'alice', 'created_at': '2025-01-15T00:00:00',
+            'reframes': FIXTURES['launch_failure_fear']['reframes']
+        })
+        serializer = TypeSerializer()
+        record = {'eventName': 'INSERT',
+                  'dynamodb': {'NewImage': {k: serializer.serialize(v) for k, v in item.items()}}}
+
+        items = stream_consumer.inserted_items([record])
+        assert items[0]['reframes'] == FIXTURES['launch_failure_fear']['reframes']
@@ -0,0 +1,243 @@
+"""
+Tests for the repository layer: the same contract against DynamoDB (moto) and SQLite
+"""
+
+import os
+import sys
+import json
+import threading
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/tools'))
+
+from repository import (DynamoRepository, SqliteRepository, open_repository,
+                        new_reframe_item, new_reminder_item, reminder_bucket)
+
+
+REFRAME_DATA = {
+    'model_selection': ['Premortem', 'Scaling'],
+    'reframes': [{'model': 'Premortem', 'reframe': 'Imagine it went badly.',
+                  'explanation': 'Finds risks.', 'action_steps': ['List 3 things that could go wrong']},
+                 {'model': 'Scaling', 'reframe': 'Will this matter in 6 months?',
+                  'explanation': 'Zooms out.', 'action_steps': ['Write down one learning goal']}],
+    'summary': 'Prepare, then zoom out.',
+    'follow_up': '48 hours'
+}
+
+
+def make_reframe(user_id, i):
+    item = new_reframe_item(user_id, f'worry {i}', REFRAME_DATA, tone='gentle')
+    item['reframe_id'] = f'{user_id}_{i:04d}'
+    item['created_at'] = f'2025-01-15T10:{i // 60:02d}:{i % 60:02d}'
+    return item
+
+
+@pytest.fixture(params=['dynamodb', 'sqlite'])
+def repo(request, dynamo, tmp_path):
+    if request.param == 'dynamodb':
+        return DynamoRepository(dynamo)
+    return SqliteRepository(str(tmp_path / 'reframer.db'))
+
+
+class TestRepositoryContract:
+
+    def test_recent_reframes_newest_first_with_cursor(self, repo):
+        repo.put_reframes([make_reframe('alice', i) for i in range(30)] + [make_reframe('bob', 0)])
+
+        page = repo.recent_reframes('alice', limit=10)
+        assert [i['reframe_id'] for i in page] == [f'alice_{i:04d}' for i in range(29, 19, -1)]
+
+        older = repo.recent_reframes('alice', limit=10, before=page[-1]['created_at'])
+        assert older[0]['reframe_id'] == 'alice_0019'
+
+    def test_since_returns_only_newer_items(self, repo):
+        repo.put_reframes([make_reframe('alice', i) for i in range(30)])
+        since = make_reframe('alice', 24)['created_at']
+
+        newer = repo.recent_reframes('alice', limit=10, since=since)
+        assert [i['reframe_id'] for i in newer] == [f'alice_{i:04d}' for i in range(29, 24, -1)]
+
+        # More than a page: the oldest newer items come back, still newest first
+        capped = repo.recent_reframes('alice', limit=3, since=make_reframe('alice', 9)['created_at'])
+        assert [i['reframe_id'] for i in capped] == ['alice_0012', 'alice_0011', 'alice_0010']
+
+    def test_history_version_moves_with_every_write(self, repo):
+        assert repo.history_version('alice') is None
+        repo.put_reframes([make_reframe('alice', i) for i in range(3)] + [make_reframe('bob', 0)])
+        assert repo.history_version('alice') == (make_reframe('alice', 2)['created_at'], 3)
+
+        repo.put_reframe(make_reframe('alice', 3))
+        assert repo.history_version('alice') == (make_reframe('alice', 3)['created_at'], 4)
+        assert repo.history_version('bob')[1] == 1
+
+    def test_projection_limits_attributes(self, repo):
+        repo.put_reframe(make_reframe('alice', 1))
+        item = repo.recent_reframes('alice', limit=1, projection=['reframe_id', 'summary'])[0]
+        assert set(item) == {'reframe_id', 'summary'}
+
+    def test_compact_items_read_back_decoded(self, repo, monkeypatch):
+        monkeypatch.setenv('COMPACT_STORAGE', 'true')
+        repo.put_reframe(make_reframe('alice', 1))
+        item = repo.recent_reframes('alice', limit=1)[0]
+        assert item['reframes'][0]['model'] == 'Premortem'
+        assert 'reframes_z' not in item
+
+    def test_batch_get_reframes_across_batches(self, repo):
+        repo.put_reframes([make_reframe('alice', i) for i in range(150)])
+        ids = [f'alice_{i:04d}' for i in range(0, 150, 1)] + ['alice_0000', 'missing']
+        items = repo.get_reframes(ids, projection=['reframe_id'])
+        assert sorted(i['reframe_id'] for i in items) == sorted(set(ids) - {'missing'})
+
+    def test_users(self, repo):
+        assert repo.get_user('alice') is None
+        repo.put_user({'user_id': 'alice', 'display_name': 'Alice', 'profile_summary': {'reframe_count': 3}})
+        repo.put_user({'user_id': 'bob', 'display_name': 'Bob'})
+
+        assert repo.get_user('alice', projection=['profile_summary']) == {'profile_summary': {'reframe_count': 3}}
+        assert {u['user_id'] for u in repo.get_users(['alice', 'bob', 'carol'])} == {'alice', 'bob'}
+
+    def test_due_reminders_by_bucket(self, repo):
+        base = datetime(2025, 1, 15, 9, 0)
+        repo.put_reminders([
+            new_reminder_item('alice', f'r{i}', base + timedelta(minutes=20 * i)) | {'reminder_id': f'rem{i}'}
+            for i in range(6)
+        ])
+
+        bucket = reminder_bucket(base)
+        due = repo.due_reminders(bucket)
+        assert [r['reminder_id'] for r in due] == ['rem0', 'rem1', 'rem2']
+
+        until = (base + timedelta(minutes=20)).isoformat()
+        assert [r['reminder_id'] for r in repo.due_reminders(bucket, until=until)] == ['rem0', 'rem1']
+        assert len(repo.user_reminders('alice')) == 6
+
+
+class TestSqliteBackend:
+
+    def test_wal_mode_and_indexes(self, tmp_path):
+        repo = SqliteRepository(str(tmp_path / 'reframer.db'))
+        assert repo.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+        plan = ' '.join(str(row) for row in repo.conn.execute(
+            'EXPLAIN QUERY PLAN SELECT item FROM reframes WHERE user_id = ? ORDER BY created_at DESC LIMIT 3',
+            ('alice',)
+        ))
+        assert 'reframes_user_created' in plan
+        plan = ' '.join(str(row) for row in repo.conn.execute(
+            'EXPLAIN QUERY PLAN SELECT item FROM reminders WHERE bucket = ? AND scheduled_time <= ?',
+            ('2025-01-15T09', '2025-01-15T09:30')
+        ))
+        assert 'reminders_bucket_time' in plan
+
+    def test_reads_do_not_wait_on_the_write_lock(self, tmp_path):
+        repo = SqliteRepository(str(tmp_path / 'reframer.db'))
+        repo.put_reframes([make_reframe('alice', i) for i in range(3)])
+        read = []
+
+        with repo.lock:
+            # A write holds the lock; a reader thread still gets through on its own connection
+            reader = threading.Thread(target=lambda: read.extend(repo.recent_reframes('alice', limit=2)))
+            reader.start()
+            reader.join(timeout=2)
+            assert not reader.is_alive()
+        assert [i['reframe_id'] for i in read] == ['alice_0002', 'alice_0001']
+        assert repo.history_version('alice')[1] == 3
+        repo.close()
+
+    def test_in_memory_database_reads_its_writes(self):
+        repo = SqliteRepository(':memory:')
+        repo.put_reframe(make_reframe('alice', 1))
+        assert [i['reframe_id'] for i in repo.recent_reframes('alice')] == ['alice_0001']
+
+    def test_open_repository_shares_one_connection_per_path(self, tmp_path):
+        url = f"sqlite://{tmp_path / 'shared.db'}"
+        assert open_repository(url) is open_repository(url)
+        assert isinstance(open_repository(''), DynamoRepository)
+        with pytest.raises(ValueError):
+            open_repository('postgres://nope')
+
+
+class TestHistorySync:
+    """ETag revalidation and delta sync through the Lambda handler on DynamoDB"""
+
+    def history(self, dynamo, headers=None, **body):
+        import app
+        event = {'headers': headers or {}, 'body': json.dumps({'action': 'history', 'user_id': 'alice', **body})}
+        with patch.object(app, 'dynamodb', dynamo), patch.object(app, 'STORAGE_URL', ''):
+            return app.lambda_handler(event, None)
+
+    def test_unchanged_history_is_a_304_without_a_query(self, dynamo):
+        DynamoRepository(dynamo).put_reframes([make_reframe('alice', i) for i in range(5)])
+        first = self.history(dynamo)
+        etag = first['headers']['ETag']
+        assert first['statusCode'] == 200 and len(json.loads(first['body'])['history']) == 5
+
+        with patch.object(DynamoRepository, 'recent_reframes', side_effect=AssertionError('queried reframes')):
+            again = self.history(dynamo, headers={'if-none-match': etag})
+
+        assert again['statusCode'] == 304
+        assert again['body'] == ''
+        assert again['headers']['ETag'] == etag
+
+    def test_new_reframe_changes_etag_and_since_returns_only_it(self, dynamo):
+        repo = DynamoRepository(dynamo)
+        repo.put_reframes([make_reframe('alice', i) for i in range(5)])
+        first = self.history(dynamo)
+        newest = json.loads(first['body'])['history'][0]['created_at']
+
+        repo.put_reframe(make_reframe('alice', 5))
+        delta = self.history(dynamo, headers={'If-None-Match': first['headers']['ETag']}, since=newest)
+
+        assert delta['statusCode'] == 200
+        assert delta['headers']['ETag'] != first['headers']['ETag']
+        assert [i['reframe_id'] for i in json.loads(delta['body'])['history']] == ['alice_0005']
+        assert self.history(dynamo, headers={'If-None-Match': delta['headers']['ETag']})['statusCode'] == 304
+
+    def test_pages_have_their_own_etags(self, dynamo):
+        DynamoRepository(dynamo).put_reframes([make_reframe('alice', i) for i in range(25)])
+        first = self.history(dynamo)
+        older = self.history(dynamo, before=json.loads(first['body'])['next_before'])
+        assert older['headers']['ETag'] != first['headers']['ETag']
+        assert self.history(dynamo, headers={'If-None-Match': first['headers']['ETag']},
+                            before=json.loads(first['body'])['next_before'])['statusCode'] == 200
+
+
+class TestHandlersOnSqlite:
+    """The Lambda handlers run end to end on SQLite, no DynamoDB mocks involved"""
+
+    @pytest.fixture
+    def sqlite_url(self, tmp_path):
+        url = f"sqlite://{tmp_path / 'handlers.db'}"
+        import app
+        import memory_tool
+        import schedule_tool
+        with patch.object(app, 'STORAGE_URL', url), \
+                patch.object(memory_tool, 'STORAGE_URL', url), \
+                patch.object(schedule_tool, 'STORAGE_URL', url):
+            yield url
+
+    def test_reframe_history_memory_and_schedule(self, sqlite_url):
+        import app
+        import memory_tool
+        import schedule_tool
+
+        with patch('app.invoke_bedrock_reframe', return_value=json.dumps(REFRAME_DATA)):
+            reframe = app.handle_reframe('alice', {'input': 'Nervous about the launch'})
+
+        history = app.handle_history('alice')
+        assert [i['reframe_id'] for i in history['history']] == [reframe['reframe_id']]
+
+        memories = memory_tool.memory_recall({'user_id': 'alice'})
+        assert memories[0]['input'] == 'Nervous about the launch'
+
+        user = app.handle_get_user('alice')
+        assert app.handle_get_user('alice')['created_at'] == user['created_at']
+
+        result = schedule_tool.schedule_followup({'user_id': 'alice', 'reframe_id': reframe['reframe_id'],
+                                                  'hours_from_now': 2})
+        reminders = open_repository(sqlite_url).user_reminders('alice')
+        assert reminders[0]['reminder_id'] == result['reminder_id']
+        assert reminders[0]['bucket'] == result['scheduled_time'][:13]
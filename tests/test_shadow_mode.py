@@ -0,0 +1,157 @@
+"""
+Tests for shadow traffic: sampling and dispatch before the handler returns, candidate outcomes
+(parsed, unparseable, failed) and the primary-vs-candidates comparison report
+"""
+
+import json
+import os
+import sys
+import pytest
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import shadow_mode
+
+PRIMARY = 'amazon.titan-text-express-v1'
+FAST = 'anthropic.claude-3-haiku-20240307-v1:0'
+CHATTY = 'anthropic.claude-v2'
+BROKEN = 'example.unavailable-v1'
+
+REFRAME_JSON = json.dumps({
+    'model_selection': ['Premortem', 'Scaling'],
+    'reframes': [
+        {'model': 'Premortem', 'reframe': 'r1', 'explanation': 'e1', 'action_steps': ['a1']},
+        {'model': 'Scaling', 'reframe': 'r2', 'explanation': 'e2', 'action_steps': ['a2']}
+    ],
+    'summary': 'Prepare, then zoom out.',
+    'follow_up': '48 hours'
+})
+
+
+def fake_bedrock(system_prompt, user_input, model_id=None):
+    """Each model answers in its own way"""
+    if model_id == BROKEN:
+        raise Exception('Failed to invoke Bedrock: ThrottlingException')
+    if model_id == CHATTY:
+        return app.ModelOutput('Here are some thoughts, not JSON.', {'input_tokens': 900, 'output_tokens': 400})
+    return app.ModelOutput(REFRAME_JSON, {'input_tokens': 800, 'output_tokens': 250})
+
+
+def shadow_request(primary=None, day='2025-01-15'):
+    return {'system_prompt': 'system', 'user_input': 'I am worried about the launch',
+            'candidates': [FAST, CHATTY, BROKEN, PRIMARY], 'day': day,
+            'primary': primary or {'model_id': PRIMARY, 'parsed': True, 'latency_ms': 1800,
+                                   'input_tokens': 790, 'output_tokens': 310, 'output_chars': 420}}
+
+
+@pytest.fixture
+def stats_dynamo(dynamo):
+    with patch('usage_stats.dynamodb', dynamo):
+        yield dynamo
+
+
+class TestSampling:
+
+    def reframe(self, invoke):
+        with patch.object(shadow_mode, 'SHADOW_MODEL_IDS', [FAST]), \
+                patch.object(shadow_mode, 'SHADOW_SAMPLE_RATE', 1.0), \
+                patch.object(shadow_mode.lambda_client, 'invoke', invoke), \
+                patch('app.invoke_bedrock_reframe', fake_bedrock), \
+                patch('app.recall_memories', return_value=[]), \
+                patch('app.store_reframe', return_value='rid'):
+            return app.generate_reframe('alice', 'I am worried about the launch', 'gentle', model_id=PRIMARY)
+
+    def test_sampled_request_is_mirrored_asynchronously(self):
+        invoke = Mock()
+        response = self.reframe(invoke)
+
+        assert response['model_selection'] == ['Premortem', 'Scaling']
+        kwargs = invoke.call_args.kwargs
+        assert kwargs['InvocationType'] == 'Event'
+        payload = json.loads(kwargs['Payload'])['shadow']
+        assert payload['user_input'] == 'I am worried about the launch'
+        assert payload['candidates'] == [FAST]
+        assert payload['primary']['model_id'] == PRIMARY and payload['primary']['parsed'] is True
+        assert payload['primary']['output_chars'] == len(REFRAME_JSON)
+
+    def test_dispatch_is_sent_before_the_handler_returns(self):
+        # Nothing is left on a background thread for Lambda to freeze
+        invoke = Mock()
+        self.reframe(invoke)
+        assert invoke.call_count == 1
+
+    def test_failed_dispatch_does_not_fail_the_request(self):
+        response = self.reframe(Mock(side_effect=Exception('ReadTimeoutError')))
+        assert response['model_selection'] == ['Premortem', 'Scaling']
+
+    def test_dispatch_is_bounded_by_a_short_timeout(self):
+        config = shadow_mode.lambda_client.meta.config
+        assert config.read_timeout == config.connect_timeout == shadow_mode.SHADOW_DISPATCH_TIMEOUT
+        assert config.retries['total_max_attempts'] == 1
+
+    def test_unsampled_and_unconfigured_requests_are_not_mirrored(self):
+        with patch.object(shadow_mode, 'SHADOW_MODEL_IDS', []):
+            assert not shadow_mode.sampled(1.0)
+        with patch.object(shadow_mode, 'SHADOW_MODEL_IDS', [FAST]):
+            assert not shadow_mode.sampled(0)
+            assert shadow_mode.sampled(1.0)
+
+
+class TestShadowInvocation:
+
+    def test_candidates_are_recorded_next_to_the_primary(self, stats_dynamo):
+        with patch('app.invoke_bedrock_reframe', fake_bedrock):
+            result = app.lambda_handler({'shadow': shadow_request()}, None)
+
+        outcomes = {o['model_id']: o for o in result['candidates']}
+        # The primary is never called again as its own candidate
+        assert set(outcomes) == {FAST, CHATTY, BROKEN}
+        assert outcomes[FAST]['parsed'] and outcomes[FAST]['output_tokens'] == 250
+        assert not outcomes[CHATTY]['parsed'] and outcomes[CHATTY]['input_tokens'] == 900
+        assert outcomes[BROKEN]['error'] == 'Exception'
+
+        models = shadow_mode.compare(days=1, end_date='2025-01-15')['models']
+        assert models[PRIMARY]['role'] == 'primary'
+        assert models[FAST]['role'] == 'candidate'
+        assert (models[FAST]['parse_rate'], models[CHATTY]['parse_rate']) == (1.0, 0.0)
+        assert models[BROKEN]['error_rate'] == 1.0 and models[BROKEN]['avg_latency_ms'] is None
+        assert models[PRIMARY]['avg_latency_ms'] == 1800 and models[PRIMARY]['p95_latency_ms'] == 2000
+
+    def test_primary_parse_failure_keeps_its_usage(self):
+        usage = {'model_id': PRIMARY, 'input_tokens': 700, 'output_tokens': 90,
+                 'latency_ms': 1500, 'output_chars': 30}
+        with patch('app.invoke_bedrock_reframe', return_value=app.ModelOutput('not json', usage)):
+            with pytest.raises(app.ModelParseError) as raised:
+                app.model_reframe('system', 'thought', model_id=PRIMARY)
+
+        result = shadow_mode.outcome(PRIMARY, raised.value, 1.6)
+        assert result['parsed'] is False and 'error' not in result
+        assert result['input_tokens'] == 700
+
+
+class TestComparisonReport:
+
+    def test_fastest_reliable_model_is_recommended(self, stats_dynamo):
+        with patch.object(shadow_mode, 'SHADOW_MIN_SAMPLES', 3), \
+                patch('app.invoke_bedrock_reframe', fake_bedrock):
+            for day in ('2025-01-14', '2025-01-15'):
+                for _ in range(2):
+                    app.handle_shadow(shadow_request(day=day))
+
+            comparison = shadow_mode.compare(days=2, end_date='2025-01-15')
+            report = shadow_mode.format_report(comparison)
+
+        assert comparison['models'][FAST]['requests'] == 4
+        # The candidate answers faster than the primary's 1800 ms and always parses
+        assert comparison['recommended'] == FAST
+        assert report.splitlines()[2].startswith(PRIMARY)
+        assert f'Recommended: {FAST}' in report
+
+    def test_too_few_samples_recommend_nothing(self, stats_dynamo, capsys):
+        with patch('app.invoke_bedrock_reframe', fake_bedrock):
+            app.handle_shadow(shadow_request())
+
+        assert shadow_mode.main(['--days', '1', '--end-date', '2025-01-15']) == 0
+        assert 'Recommended: none yet' in capsys.readouterr().out
@@ -0,0 +1,254 @@
+"""
+Tests for single-flight coalescing of identical in-flight reframes
+"""
+
+import io
+import json
+import os
+import sys
+import threading
+import time
+import pytest
+import boto3
+from unittest.mock import Mock, patch
+from moto import mock_dynamodb
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import single_flight
+
+
+MOCK_REFRAME = {
+    "model_selection": ["Premortem", "Scaling"],
+    "reframes": [
+        {
+            "model": "Premortem",
+            "reframe": "Imagine it went badly—what happened? Prepare for that now.",
+            "explanation": "Premortem helps identify risks proactively.",
+            "action_steps": ["List 3 things that could go wrong", "Rehearse for 10 minutes"]
+        },
+        {
+            "model": "Scaling",
+            "reframe": "How important is this in 6 months?",
+            "explanation": "Scaling reduces emotional weight.",
+            "action_steps": ["Write one learning goal", "Remember a past success"]
+        }
+    ],
+    "summary": "Prepare for scenarios and keep perspective.",
+    "follow_up": "24 hours"
+}
+
+
+class FakeBedrockClient:
+    """Bedrock runtime stand-in that counts invocations and simulates generation latency"""
+
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        payload = json.dumps({'completion': json.dumps(MOCK_REFRAME)})
+        return {'body': io.BytesIO(payload.encode())}
+
+
+def run_concurrently(fn, args_list):
+    results = [None] * len(args_list)
+    errors = []
+
+    def worker(i, args):
+        try:
+            results[i] = fn(*args)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i, a)) for i, a in enumerate(args_list)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    return results
+
+
+class TestRequestKey:
+    """Test request key normalization"""
+
+    def test_whitespace_collapsed(self):
+        assert single_flight.request_key('u', 'I am  worried ', 'gentle') == \
+            single_flight.request_key('u', 'I am worried', 'gentle')
+
+    def test_user_and_tone_distinguish(self):
+        base = single_flight.request_key('u', 'worried', 'gentle')
+        assert base != single_flight.request_key('v', 'worried', 'gentle')
+        assert base != single_flight.request_key('u', 'worried', 'direct')
+
+
+class TestInProcessCoalescing:
+    """Concurrent identical requests within one container"""
+
+    @patch('app.dynamodb')
+    @patch('app.bedrock_runtime', new_callable=FakeBedrockClient)
+    def test_identical_requests_share_one_invocation(self, fake_bedrock, mock_dynamodb):
+        mock_table = Mock()
+        mock_table.query.return_value = {'Items': []}
+        mock_table.get_item.return_value = {}
+        mock_dynamodb.Table.return_value = mock_table
+
+        body = {'input': 'I am worried about the presentation', 'tone': 'gentle'}
+        results = run_concurrently(app.handle_reframe, [('test_user', dict(body))] * 8)
+
+        assert fake_bedrock.calls == 1
+        assert mock_table.put_item.call_count == 1
+        assert len({r['reframe_id'] for r in results}) == 1
+        assert app.reframe_flight.in_flight() == 0
+
+    @patch('app.dynamodb')
+    @patch('app.bedrock_runtime', new_callable=FakeBedrockClient)
+    def test_distinct_requests_are_not_coalesced(self, fake_bedrock, mock_dynamodb):
+        mock_table = Mock()
+        mock_table.query.return_value = {'Items': []}
+        mock_table.get_item.return_value = {}
+        mock_dynamodb.Table.return_value = mock_table
+
+        args = [('test_user', {'input': f'I am worried about task {i}', 'tone': 'gentle'}) for i in range(4)]
+        run_concurrently(app.handle_reframe, args)
+
+        assert fake_bedrock.calls == 4
+
+    def test_errors_propagate_to_followers(self):
+        flight = single_flight.SingleFlight()
+        calls = []
+
+        def failing():
+            calls.append(1)
+            time.sleep(0.1)
+            raise ValueError("boom")
+
+        errors = []
+
+        def worker():
+            try:
+                flight.do('k', failing)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert len(errors) == 5
+
+
+@pytest.fixture
+def inflight_table():
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_dynamodb():
+        resource = boto3.resource('dynamodb', region_name='us-east-1')
+        table = resource.create_table(
+            TableName='CognitiveReframer-Inflight',
+            KeySchema=[{'AttributeName': 'request_key', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'request_key', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        yield table
+
+
+class TestDynamoLease:
+    """Cross-container coalescing through the lease table"""
+
+    def test_follower_reads_leader_result(self, inflight_table):
+        # Separate lease objects stand in for separate containers
+        leader = single_flight.DynamoLease(inflight_table, poll_interval=0.02)
+        follower = single_flight.DynamoLease(inflight_table, poll_interval=0.02)
+        calls = []
+
+        def generate():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'reframe_id': 'r1'}
+
+        results = {}
+
+        def run(name, lease):
+            results[name] = lease.run('key', generate)
+
+        t1 = threading.Thread(target=run, args=('leader', leader))
+        t1.start()
+        time.sleep(0.05)
+        t2 = threading.Thread(target=run, args=('follower', follower))
+        t2.start()
+        t1.join()
+        t2.join()
+
+        assert len(calls) == 1
+        assert results['leader'] == ({'reframe_id': 'r1'}, False)
+        assert results['follower'] == ({'reframe_id': 'r1'}, True)
+
+    def test_failed_leader_releases_lease(self, inflight_table):
+        lease = single_flight.DynamoLease(inflight_table)
+
+        def failing():
+            raise RuntimeError("bedrock down")
+
+        with pytest.raises(RuntimeError):
+            lease.run('key', failing)
+
+        result, shared = lease.run('key', lambda: {'reframe_id': 'r2'})
+        assert result == {'reframe_id': 'r2'}
+        assert shared is False
+
+    def test_expired_lease_is_taken_over(self, inflight_table):
+        inflight_table.put_item(Item={
+            'request_key': 'key',
+            'status': 'pending',
+            'lease_expires': int((time.time() - 5) * 1000)
+        })
+        lease = single_flight.DynamoLease(inflight_table)
+
+        result, shared = lease.run('key', lambda: {'reframe_id': 'r3'})
+        assert result == {'reframe_id': 'r3'}
+        assert shared is False
+
+    def test_follower_wait_is_capped(self, inflight_table):
+        # A live lease whose leader will not finish in time
+        inflight_table.put_item(Item={
+            'request_key': 'key',
+            'status': 'pending',
+            'lease_expires': int((time.time() + 30) * 1000)
+        })
+        lease = single_flight.DynamoLease(inflight_table, poll_interval=0.02)
+
+        started = time.monotonic()
+        result, shared = lease.run('key', lambda: {'reframe_id': 'own'}, max_wait=0.2)
+        assert result == {'reframe_id': 'own'} and shared is False
+        assert time.monotonic() - started < 1
+
+    def test_follower_stays_within_latency_budget(self, inflight_table):
+        inflight_table.put_item(Item={
+            'request_key': app.request_key('alice', 'The launch will fail', 'gentle'),
+            'status': 'pending',
+            'lease_expires': int((time.time() + 30) * 1000)
+        })
+        resource = boto3.resource('dynamodb', region_name='us-east-1')
+        with patch.object(app, 'INFLIGHT_TABLE', inflight_table.name), patch.object(app, 'dynamodb', resource), \
+                patch.object(app, 'REFRAME_LATENCY_BUDGET_MS', 300), \
+                patch('app.recall_memories', return_value=[]), \
+                patch('app.store_reframe', return_value='r1'), \
+                patch('app.invoke_bedrock_reframe', side_effect=lambda *a, **k: time.sleep(1)):
+            started = time.monotonic()
+            response = app.generate_reframe_leased(
+                app.request_key('alice', 'The launch will fail', 'gentle'), 'alice', 'The launch will fail', 'gentle'
+            )
+
+        # The wait used up the budget, so the follower answers locally rather than waiting on a model
+        assert time.monotonic() - started < 0.8
+        assert response.get('degraded') is True
@@ -0,0 +1,323 @@
+"""
+Tests for incrementally maintained usage statistics
+"""
+
+import itertools
+import json
+import os
+import sys
+import boto3
+import pytest
+from unittest.mock import patch
+from boto3.dynamodb.types import TypeSerializer
+from moto import mock_dynamodbstreams, mock_sqs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import stream_consumer
+import usage_stats
+
+
+def make_item(i, user_id='alice', day='2025-01-15', models=('Premortem', 'Scaling'), tone='gentle'):
+    return {
+        'reframe_id': f'{user_id}_{day}_{i}',
+        'user_id': user_id,
+        'source_input': f'thought {i}',
+        'models_used': list(models),
+        'tone': tone,
+        'created_at': f'{day}T10:00:{i:02d}'
+    }
+
+
+_sequence = itertools.count(100000000000000000000)
+
+
+def insert_record(item):
+    serializer = TypeSerializer()
+    return {
+        'eventName': 'INSERT',
+        'dynamodb': {'NewImage': {k: serializer.serialize(v) for k, v in item.items()},
+                     'SequenceNumber': str(next(_sequence))}
+    }
+
+
+@pytest.fixture
+def stats_dynamo(dynamo):
+    with patch('usage_stats.dynamodb', dynamo), patch('profile_compactor.dynamodb', dynamo):
+        yield dynamo
+
+
+class TestAggregation:
+    """Per-batch counter aggregation"""
+
+    def test_batch_collapses_to_one_update_per_key(self):
+        items = [make_item(i) for i in range(10)] + [make_item(0, user_id='bob')]
+        totals = usage_stats.aggregate(items)
+
+        assert set(totals) == {'user#alice#2025-01-15', 'user#bob#2025-01-15', 'global#2025-01-15'}
+        assert totals['global#2025-01-15']['reframes'] == 11
+        assert totals['user#alice#2025-01-15']['model:Premortem'] == 10
+        assert totals['user#alice#2025-01-15']['tone:gentle'] == 10
+
+    def test_items_without_tone_are_counted_as_unknown(self):
+        item = make_item(0)
+        del item['tone']
+        assert usage_stats.item_counters(item)['tone:unknown'] == 1
+
+
+class TestStatsStore:
+    """Counters against the local DynamoDB stand-in"""
+
+    def test_stream_batches_accumulate(self, stats_dynamo):
+        batch1 = [make_item(i) for i in range(3)]
+        batch2 = [make_item(i, tone='direct', models=('Inversion', 'Premortem')) for i in range(3, 5)]
+        batch2.append(make_item(0, day='2025-01-14'))
+
+        stream_consumer.lambda_handler({'Records': [insert_record(i) for i in batch1]}, None)
+        stream_consumer.lambda_handler({'Records': [insert_record(i) for i in batch2]}, None)
+
+        stats = usage_stats.read_stats('user', user_id='alice', days=2, end_date='2025-01-15')
+        assert [d['date'] for d in stats['days']] == ['2025-01-14', '2025-01-15']
+        assert stats['days'][1]['reframes'] == 5
+        assert stats['days'][1]['models'] == {'Premortem': 5, 'Scaling': 3, 'Inversion': 2}
+        assert stats['days'][1]['tones'] == {'gentle': 3, 'direct': 2}
+        assert stats['totals']['reframes'] == 6
+
+        global_stats = usage_stats.read_stats('global', days=1, end_date='2025-01-15')
+        assert global_stats['totals']['reframes'] == 5
+
+    def test_redelivered_batch_is_counted_once(self, stats_dynamo):
+        event = {'Records': [insert_record(make_item(i)) for i in range(3)]}
+
+        stream_consumer.lambda_handler(event, None)
+        stream_consumer.lambda_handler(event, None)
+
+        stats = usage_stats.read_stats('user', user_id='alice', days=1, end_date='2025-01-15')
+        assert stats['totals']['reframes'] == 3
+        assert stats['totals']['models'] == {'Premortem': 3, 'Scaling': 3}
+
+    def test_retry_after_partial_failure_completes_without_double_counting(self, stats_dynamo):
+        records = [insert_record(make_item(i)) for i in range(2)] + \
+            [insert_record(make_item(0, user_id='bob'))]
+        event = {'Records': records}
+        client = stats_dynamo.meta.client
+        transact = client.transact_write_items
+        calls = []
+
+        def flaky_transact(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise RuntimeError('throttled')
+            return transact(**kwargs)
+
+        with patch.object(client, 'transact_write_items', side_effect=flaky_transact):
+            with pytest.raises(RuntimeError):
+                stream_consumer.lambda_handler(event, None)
+        stream_consumer.lambda_handler(event, None)
+
+        assert usage_stats.read_stats('global', days=1, end_date='2025-01-15')['totals']['reframes'] == 3
+        assert usage_stats.read_stats('user', user_id='alice', days=1, end_date='2025-01-15')['totals']['reframes'] == 2
+        assert usage_stats.read_stats('user', user_id='bob', days=1, end_date='2025-01-15')['totals']['reframes'] == 1
+
+    def test_batch_markers_live_outside_the_stat_items(self, stats_dynamo):
+        for n in range(3):
+            stream_consumer.lambda_handler({'Records': [insert_record(make_item(n))]}, None)
+
+        table = stats_dynamo.Table('CognitiveReframer-Stats')
+        global_item = table.get_item(Key={'stat_key': 'global#2025-01-15'})['Item']
+        assert usage_stats.BATCHES_ATTRIBUTE not in global_item and global_item['reframes'] == 3
+        markers = [i for i in table.scan()['Items'] if i['stat_key'].startswith('batch#')]
+        assert len({m['stat_key'].split('#')[1] for m in markers}) == 3
+        assert all(m['ttl'] > 0 for m in markers)
+
+    def test_legacy_batch_set_is_dropped_on_update(self, stats_dynamo):
+        table = stats_dynamo.Table('CognitiveReframer-Stats')
+        table.put_item(Item={'stat_key': 'global#2025-01-15', 'reframes': 4,
+                             usage_stats.BATCHES_ATTRIBUTE: {f'b{i}' for i in range(50)}})
+
+        usage_stats.process_records([make_item(0)], batch='new-batch')
+
+        item = table.get_item(Key={'stat_key': 'global#2025-01-15'})['Item']
+        assert item['reframes'] == 5 and usage_stats.BATCHES_ATTRIBUTE not in item
+
+    def test_failure_before_stats_leaves_counters_untouched(self, stats_dynamo):
+        event = {'Records': [insert_record(make_item(i)) for i in range(2)]}
+        with patch('profile_compactor.process_records', side_effect=RuntimeError('boom')):
+            with pytest.raises(RuntimeError):
+                stream_consumer.lambda_handler(event, None)
+        assert usage_stats.read_stats('global', days=1, end_date='2025-01-15')['totals']['reframes'] == 0
+
+        stream_consumer.lambda_handler(event, None)
+        assert usage_stats.read_stats('global', days=1, end_date='2025-01-15')['totals']['reframes'] == 2
+
+    def test_failed_batch_is_replayed_from_the_failure_queue(self, stats_dynamo):
+        reframes = stats_dynamo.Table('CognitiveReframer-Reframes')
+        reframes.meta.client.update_table(
+            TableName=reframes.name,
+            StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+        )
+        with mock_dynamodbstreams(), mock_sqs():
+            streams = boto3.client('dynamodbstreams', region_name='us-east-1')
+            sqs = boto3.client('sqs', region_name='us-east-1')
+            queue_url = sqs.create_queue(QueueName='CognitiveReframer-StreamFailures')['QueueUrl']
+            for i in range(3):
+                reframes.put_item(Item=make_item(i))
+
+            stream_arn = reframes.meta.client.describe_table(TableName=reframes.name)['Table']['LatestStreamArn']
+            shard = streams.describe_stream(StreamArn=stream_arn)['StreamDescription']['Shards'][0]
+            iterator = streams.get_shard_iterator(StreamArn=stream_arn, ShardId=shard['ShardId'],
+                                                  ShardIteratorType='TRIM_HORIZON')['ShardIterator']
+            sequence_numbers = [r['dynamodb']['SequenceNumber']
+                                for r in streams.get_records(ShardIterator=iterator)['Records']]
+            # What Lambda sends to the on-failure destination: a pointer, not the records
+            sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps({'DDBStreamBatchInfo': {
+                'streamArn': stream_arn, 'shardId': shard['ShardId'], 'batchSize': 3,
+                'startSequenceNumber': sequence_numbers[0], 'endSequenceNumber': sequence_numbers[-1]
+            }}))
+
+            with patch.object(stream_consumer, 'streams', streams), patch.object(stream_consumer, 'sqs', sqs), \
+                    patch.object(stream_consumer, 'STREAM_FAILURE_QUEUE_URL', queue_url):
+                result = stream_consumer.lambda_handler({'action': 'replay_failures'}, None)
+                assert stream_consumer.replay_failures() == {'replayed': 0, 'failed': 0}
+
+        assert result == {'replayed': 1, 'failed': 0}
+        assert usage_stats.read_stats('user', user_id='alice', days=1, end_date='2025-01-15')['totals']['reframes'] == 3
+
+    def test_read_cost_is_one_batch_get(self, stats_dynamo):
+        usage_stats.process_records([make_item(i) for i in range(50)])
+
+        with patch.object(stats_dynamo, 'batch_get_item', wraps=stats_dynamo.batch_get_item) as spy:
+            usage_stats.read_stats('global', days=30, end_date='2025-01-15')
+        assert spy.call_count == 1
+
+    def test_backfill_matches_incremental_counters(self, stats_dynamo):
+        reframes = stats_dynamo.Table('CognitiveReframer-Reframes')
+        items = [make_item(i) for i in range(4)] + [make_item(i, user_id='bob', tone='direct') for i in range(2)]
+        items[1]['degraded'] = True
+        for item in items:
+            reframes.put_item(Item=item)
+
+        usage_stats.process_records(items)
+        incremental = usage_stats.read_stats('global', days=1, end_date='2025-01-15')
+
+        # Backfill twice: overwriting counters keeps it idempotent
+        usage_stats.backfill()
+        usage_stats.backfill()
+        assert incremental['totals']['degraded'] == 1
+        assert usage_stats.read_stats('global', days=1, end_date='2025-01-15') == incremental
+
+    def test_stats_action(self, stats_dynamo):
+        usage_stats.process_records([make_item(i) for i in range(2)])
+        event = {'body': json.dumps({'action': 'stats', 'user_id': 'alice', 'days': 1, 'end_date': '2025-01-15'})}
+
+        response = app.lambda_handler(event, None)
+
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        assert body['user_id'] == 'alice'
+        assert body['totals']['reframes'] == 2
+
+    def test_unknown_scope_rejected(self):
+        with pytest.raises(ValueError):
+            usage_stats.read_stats('team', user_id='alice')
+
+
+MODEL_OUTPUT = json.dumps({
+    'model_selection': ['Premortem', 'Scaling'],
+    'reframes': [{'model': m, 'reframe': 'r', 'explanation': 'e', 'action_steps': ['a']}
+                 for m in ('Premortem', 'Scaling')],
+    'summary': 's',
+    'follow_up': '48 hours'
+})
+
+
+def metered_item(i, model_id='anthropic.claude-3-haiku-20240307-v1:0', input_tokens=1000, output_tokens=500,
+                 latency_ms=800, **kwargs):
+    item = make_item(i, **kwargs)
+    item['usage'] = {'model_id': model_id, 'input_tokens': input_tokens,
+                     'output_tokens': output_tokens, 'latency_ms': latency_ms}
+    return item
+
+
+class FakeBody:
+    def __init__(self, body):
+        self.body = body
+
+    def read(self):
+        return json.dumps(self.body).encode('utf-8')
+
+
+class TestTokenUsage:
+    """Bedrock token usage per request, rolled up per user, model and day"""
+
+    def test_usage_is_read_from_every_model_family(self):
+        claude3 = {'content': [{'text': '{}'}], 'usage': {'input_tokens': 812, 'output_tokens': 240}}
+        titan = {'inputTextTokenCount': 790, 'results': [{'outputText': '{}', 'tokenCount': 310}]}
+        headers = {'x-amzn-bedrock-input-token-count': '805', 'x-amzn-bedrock-output-token-count': '199'}
+
+        assert app.extract_bedrock_usage('anthropic.claude-3-haiku-20240307-v1:0', claude3) == \
+            {'input_tokens': 812, 'output_tokens': 240}
+        assert app.extract_bedrock_usage('amazon.titan-text-express-v1', titan) == \
+            {'input_tokens': 790, 'output_tokens': 310}
+        # Claude v2 bodies carry no counts; the response headers do
+        assert app.extract_bedrock_usage('anthropic.claude-v2', {'completion': '{}'}, headers) == \
+            {'input_tokens': 805, 'output_tokens': 199}
+
+    def test_model_call_records_tokens_and_latency_on_the_item(self):
+        response = {
+            'body': FakeBody({'content': [{'text': MODEL_OUTPUT}], 'usage': {'input_tokens': 900, 'output_tokens': 300}}),
+            'ResponseMetadata': {'HTTPHeaders': {}}
+        }
+        with patch.object(app.bedrock_runtime, 'invoke_model', return_value=response):
+            reframe_data = app.model_reframe('system', 'thought', model_id='anthropic.claude-3-haiku-20240307-v1:0')
+
+        usage = reframe_data['usage']
+        assert usage['model_id'] == 'anthropic.claude-3-haiku-20240307-v1:0'
+        assert (usage['input_tokens'], usage['output_tokens']) == (900, 300)
+        assert usage['latency_ms'] >= 0
+        assert app.build_reframe_item('alice', 'thought', reframe_data)['usage'] == usage
+
+    def test_rollup_per_user_model_and_day(self, stats_dynamo):
+        items = [metered_item(i) for i in range(2)] + \
+            [metered_item(2, model_id='anthropic.claude-v2', input_tokens=2000, output_tokens=1000, latency_ms=2000)] + \
+            [make_item(3)]
+        stream_consumer.lambda_handler({'Records': [insert_record(i) for i in items]}, None)
+
+        user = usage_stats.read_stats('user', user_id='alice', days=1, end_date='2025-01-15')['totals']['usage']
+        assert (user['requests'], user['input_tokens'], user['output_tokens']) == (3, 4000, 2000)
+        assert user['tokens_per_request'] == 2000
+        assert user['avg_latency_ms'] == 1200
+
+        haiku = user['models']['anthropic.claude-3-haiku-20240307-v1:0']
+        # 1000 in at $0.00025/1K + 500 out at $0.00125/1K per request
+        assert haiku['cost_per_1k_requests_usd'] == pytest.approx(0.875)
+        assert user['models']['anthropic.claude-v2']['cost_per_1k_requests_usd'] == pytest.approx(40.0)
+        assert user['cost_per_1k_requests_usd'] == pytest.approx((0.875 * 2 + 40.0) / 3, abs=1e-4)
+
+        model = usage_stats.read_stats('model', model_id='anthropic.claude-v2', days=1, end_date='2025-01-15')
+        assert model['totals']['reframes'] == 1
+        assert model['totals']['usage']['input_tokens'] == 2000
+
+    def test_long_entry_extraction_tokens_count_towards_the_reframe(self):
+        item = metered_item(0)
+        item['usage']['extraction'] = {'model_id': 'amazon.titan-text-lite-v1', 'calls': 4,
+                                       'input_tokens': 1200, 'output_tokens': 80}
+
+        counters = usage_stats.item_counters(item)
+        assert counters['usage_requests'] == 1
+        assert (counters['input_tokens'], counters['output_tokens']) == (2200, 580)
+        assert counters['input_tokens:amazon.titan-text-lite-v1'] == 1200
+
+    def test_usage_action_and_report(self, stats_dynamo, capsys):
+        usage_stats.process_records([metered_item(i) for i in range(4)])
+        event = {'body': json.dumps({'action': 'usage', 'user_id': 'alice', 'days': 2, 'end_date': '2025-01-15'})}
+
+        body = json.loads(app.lambda_handler(event, None)['body'])
+        assert [d['date'] for d in body['days']] == ['2025-01-14', '2025-01-15']
+        assert body['days'][1]['requests'] == 4
+        assert body['totals']['tokens_per_request'] == 1500
+
+        assert usage_stats.main(['report', '--days', '1', '--end-date', '2025-01-15']) == 0
+        report = capsys.readouterr().out
+        assert '2025-01-15' in report and '0.875' in report
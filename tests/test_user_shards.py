@@ -0,0 +1,200 @@
+"""
+Tests for write sharding of hot users on UserShardIndex: throttling under a
+per-partition write limit, scatter-gather reads and adaptive promotion
+"""
+
+import os
+import sys
+import random
+import pytest
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../backend/lambda_reframe'))
+
+import app
+import user_shards
+from repository import DynamoRepository, new_reframe_item
+from user_shards import ShardMap
+
+REFRAME_DATA = {
+    'model_selection': ['Premortem'],
+    'reframes': [{'model': 'Premortem', 'reframe': 'r', 'explanation': 'e', 'action_steps': ['a']}],
+    'summary': 's',
+    'follow_up': '48 hours'
+}
+
+
+def make_reframe(user_id, i):
+    item = new_reframe_item(user_id, f'worry {i}', REFRAME_DATA)
+    item['reframe_id'] = f'{user_id}_{i:04d}'
+    item['created_at'] = f'2025-01-15T10:{i // 60:02d}:{i % 60:02d}'
+    return item
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class PartitionLimitedResource:
+    """
+    DynamoDB stand-in that throttles reframe writes per UserShardIndex partition,
+    like a GSI partition at its write limit (which backs up writes to the table),
+    and history version updates per Users item
+    """
+
+    def __init__(self, resource, clock, writes_per_second):
+        self.resource = resource
+        self.meta = resource.meta
+        self.clock = clock
+        self.limit = writes_per_second
+        self.writes = {}
+        self.throttled = 0
+
+    def Table(self, name):
+        table = self.resource.Table(name)
+        if name == 'CognitiveReframer-Reframes':
+            return PartitionLimitedTable(self, table)
+        if name == 'CognitiveReframer-Users':
+            return PartitionLimitedUsersTable(self, table)
+        return table
+
+    def admit(self, partition):
+        key = (partition, int(self.clock()))
+        self.writes[key] = self.writes.get(key, 0) + 1
+        if self.writes[key] > self.limit:
+            self.throttled += 1
+            raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException',
+                                         'Message': 'Throughput exceeds the index partition limit'}}, 'PutItem')
+
+
+class PartitionLimitedTable:
+    def __init__(self, limiter, table):
+        self.limiter = limiter
+        self.table = table
+
+    def put_item(self, Item, **kwargs):
+        self.limiter.admit(Item['user_shard'])
+        return self.table.put_item(Item=Item, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+
+class PartitionLimitedUsersTable(PartitionLimitedTable):
+    def update_item(self, Key, **kwargs):
+        self.limiter.admit(('users', Key['user_id']))
+        return self.table.update_item(Key=Key, **kwargs)
+
+
+@pytest.fixture
+def hot_demo_user():
+    with patch.object(user_shards, 'shard_map', ShardMap(hot_user_ids={'demo_user'}, shards=4, writes_per_second=0)):
+        yield
+
+
+class TestHotPartitionLoad:
+
+    def run_load(self, dynamo, shard_map, seconds=10, rate=40):
+        """`rate` anonymous reframes per second against a 10 writes/s partition limit"""
+        random.seed(7)
+        clock = FakeClock()
+        limited = PartitionLimitedResource(dynamo, clock, writes_per_second=10)
+        repo = DynamoRepository(limited)
+        stored = 0
+        with patch.object(user_shards, 'shard_map', shard_map):
+            for i in range(seconds * rate):
+                clock.now = i / rate
+                try:
+                    repo.put_reframe(make_reframe('demo_user', i))
+                    stored += 1
+                except ClientError as e:
+                    assert e.response['Error']['Code'] == 'ProvisionedThroughputExceededException'
+        return stored, limited.throttled
+
+    def test_sharding_removes_hot_partition_throttling(self, dynamo):
+        unsharded = self.run_load(dynamo, ShardMap(hot_user_ids=set(), shards=8, writes_per_second=0))
+        sharded = self.run_load(dynamo, ShardMap(hot_user_ids={'demo_user'}, shards=8, writes_per_second=0))
+
+        # One partition admits 10 of every 40 writes; eight spread them (and their
+        # history version updates) under the limit
+        assert unsharded == (100, 300)
+        assert sharded[1] < unsharded[1] / 10
+        assert sharded[0] > 390
+
+
+class TestScatterGatherReads:
+
+    def test_history_merges_shards_newest_first(self, dynamo, hot_demo_user):
+        DynamoRepository(dynamo).put_reframes([make_reframe('demo_user', i) for i in range(30)])
+        shards = {i['user_shard'] for i in dynamo.Table('CognitiveReframer-Reframes').scan()['Items']}
+        assert len(shards) > 1 and shards <= set(user_shards.shard_keys('demo_user', 4))
+
+        with patch('app.dynamodb', dynamo):
+            first = app.handle_history('demo_user')
+            second = app.handle_history('demo_user', before=first['next_before'])
+            newer = app.handle_history('demo_user', since=make_reframe('demo_user', 24)['created_at'])
+
+        assert [i['reframe_id'] for i in first['history']] == [f'demo_user_{i:04d}' for i in range(29, 9, -1)]
+        assert [i['reframe_id'] for i in second['history']] == [f'demo_user_{i:04d}' for i in range(9, -1, -1)]
+        assert [i['reframe_id'] for i in newer['history']] == [f'demo_user_{i:04d}' for i in range(29, 24, -1)]
+
+    def test_history_version_merges_shards(self, dynamo, hot_demo_user):
+        repo = DynamoRepository(dynamo)
+        repo.put_reframes([make_reframe('demo_user', i) for i in range(30)])
+        versions = repo.get_users(user_shards.shard_keys('demo_user', 4), projection=['history_count'])
+
+        # Each shard keeps its own version item; none of them sees all 30 writes
+        assert len(versions) > 1 and all(v['history_count'] < 30 for v in versions)
+        assert repo.history_version('demo_user') == (make_reframe('demo_user', 29)['created_at'], 30)
+        repo.put_reframe(make_reframe('demo_user', 30))
+        assert repo.history_version('demo_user') == (make_reframe('demo_user', 30)['created_at'], 31)
+
+    def test_recall_memories_returns_newest_across_shards(self, dynamo, hot_demo_user):
+        DynamoRepository(dynamo).put_reframes([make_reframe('demo_user', i) for i in range(12)])
+
+        with patch('app.dynamodb', dynamo):
+            memories = app.recall_memories('demo_user', 'worry', top_k=3)
+
+        assert [m['reframe_id'] for m in memories] == ['demo_user_0011', 'demo_user_0010', 'demo_user_0009']
+
+
+class TestAdaptivePromotion:
+
+    def test_fast_writer_is_promoted_and_read_everywhere(self, dynamo):
+        clock = FakeClock()
+        detector_map = ShardMap(hot_user_ids=set(), shards=4, writes_per_second=1, clock=clock)
+        with patch.object(user_shards, 'shard_map', detector_map):
+            repo = DynamoRepository(dynamo)
+            for i in range(40):
+                clock.now = i * 0.2
+                repo.put_reframe(make_reframe('alice', i))
+
+        assert repo.get_user('alice')['user_shards'] == 4
+        assert len({i['user_shard'] for i in dynamo.Table('CognitiveReframer-Reframes').scan()['Items']}) > 1
+
+        # Another container learns the shard count from the user item
+        with patch.object(user_shards, 'shard_map', ShardMap(hot_user_ids=set(), shards=4, writes_per_second=1)):
+            history = DynamoRepository(dynamo).recent_reframes('alice', limit=40)
+        assert [i['reframe_id'] for i in history] == [f'alice_{i:04d}' for i in range(39, -1, -1)]
+
+    def test_slow_writer_stays_on_one_partition(self):
+        clock = FakeClock()
+        shard_map = ShardMap(hot_user_ids=set(), shards=4, writes_per_second=1, clock=clock)
+        for i in range(30):
+            clock.now = i * 2
+            assert shard_map.shard_for_write('bob', 1) == ('bob', False)
+
+    def test_backfill_makes_old_reframes_visible(self, dynamo):
+        legacy = make_reframe('carol', 0)
+        dynamo.Table('CognitiveReframer-Reframes').put_item(Item=legacy)
+        repo = DynamoRepository(dynamo)
+        assert repo.recent_reframes('carol') == []
+
+        assert user_shards.backfill(dynamo) == 1
+        assert user_shards.backfill(dynamo) == 0
+        assert [i['reframe_id'] for i in repo.recent_reframes('carol')] == [legacy['reframe_id']]